@@ -0,0 +1,93 @@
+import numpy as np
+
+# gain window (60+-1.5dB) the bandwidth is measured against
+GAIN_HIGH = 1188.5
+GAIN_LOW = 944
+# 1.5dB drop relative to the DC gain
+DROP = 0.944
+# bandwidth goal, the gain penalty averages below it
+BW_GOAL = 7.2*10**6
+# smallest DC gain counted as an operational amplifier
+MIN_DC_GAIN = 100
+
+# how each row's bandwidth was found
+EDGE_OK = 0        # gain leaves the window, bandwidth interpolated at the edge
+EDGE_PUNISHED = 1  # DC gain outside the window, 1.5dB bandwidth divided by the gain penalty
+EDGE_SKIPPED = 2   # DC gain too low to be an amplifier
+EDGE_STALE = 3     # gain leaves the window at the second point, there is no bandwidth of its own
+EDGE_MISSING = 4   # gain never leaves the window
+
+# strips the PySpice units off an AC analysis once
+def get_AC_arrays(analysis) -> tuple[np.ndarray, np.ndarray]:
+    return np.asarray(analysis.frequency, dtype=float), np.asarray(analysis.AC_out, dtype=complex)
+
+# index of the first True along the last axis, -1 where there is none
+def first_true(mask : np.ndarray) -> np.ndarray:
+    index = np.argmax(mask, axis=-1)
+    found = np.take_along_axis(mask, index[..., None], axis=-1)[..., 0]
+    return np.where(found, index, -1)
+
+# index of the bandwidth edge for gains shaped (..., points) and whether the DC gain left the window
+# -1 where the gain never leaves the window, a punished row that never drops 1.5dB keeps index 0
+def get_edge_index(gains : np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    DC_gain = gains[..., :1]
+    window = first_true((gains > GAIN_HIGH) | (gains < GAIN_LOW))
+    drop = first_true((gains <= DC_gain*DROP) | (gains >= DC_gain/DROP))
+    punished = window == 0
+    return np.where(punished, np.maximum(drop, 0), window), punished
+
+# simple linear approximation
+def lin_approx(x1, y1, x2, y2, y_target):
+    return (y_target-y1)*(x2-x1)/(y2-y1) + x1
+
+# root mean square distance from the gain window below the bandwidth goal
+def get_gain_penalty(freq : np.ndarray, gains : np.ndarray, is_coarse : np.ndarray | None = None) -> np.ndarray:
+    below = np.logical_and.accumulate(freq < BW_GOAL, axis=-1)
+    if is_coarse is not None: # refining points of an adaptive sweep would bias the mean
+        below = below & is_coarse
+    distance = np.minimum((gains - GAIN_HIGH)**2, (gains - GAIN_LOW)**2)
+    # sequential sum keeps the rounding of a running total
+    adj = np.cumsum(np.where(below, distance, 0), axis=-1)[..., -1]
+    return np.sqrt(adj)/np.sum(below, axis=-1)
+
+# bandwidth, DC gain and edge status of every row of gains shaped (..., points)
+# freq and is_coarse broadcast against gains, rows can be corners, designs or both
+def get_BWs(freq : np.ndarray, gains : np.ndarray, is_coarse : np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    gains = np.asarray(gains, dtype=float)
+    freq = np.broadcast_to(freq, gains.shape)
+    if is_coarse is not None:
+        is_coarse = np.broadcast_to(is_coarse, gains.shape)
+    DC_gain = gains[..., 0]
+    index, punished = get_edge_index(gains)
+    # rows without an edge are computed at the second point and masked out below
+    upper = np.where(index < 0, 1, index)[..., None]
+    # an edge at index 0 interpolates against the last point, as negative indexing did
+    lower = (upper - 1) % gains.shape[-1]
+    BW = lin_approx(np.take_along_axis(freq, upper, axis=-1)[..., 0], np.take_along_axis(gains, upper, axis=-1)[..., 0],
+                    np.take_along_axis(freq, lower, axis=-1)[..., 0], np.take_along_axis(gains, lower, axis=-1)[..., 0],
+                    DC_gain*DROP)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        BW = np.where(punished, BW/get_gain_penalty(freq, gains, is_coarse), BW)
+    status = np.select([DC_gain <= MIN_DC_GAIN, index < 0, (index == 1) & ~punished, punished],
+                       [EDGE_SKIPPED, EDGE_MISSING, EDGE_STALE, EDGE_PUNISHED], EDGE_OK)
+    BW = np.where((status == EDGE_OK) | (status == EDGE_PUNISHED), BW, np.nan)
+    return BW, DC_gain, status
+
+# row with the lowest bandwidth, the worst case over transistor tolerances, or None if every row is skipped
+# a stale row keeps the bandwidth of the row before it, which can never be a new minimum
+def get_worst_case(BWs : np.ndarray, statuses : np.ndarray) -> int | None:
+    worst = None
+    measured = False
+    for i, status in enumerate(statuses):
+        if status == EDGE_SKIPPED:
+            continue
+        if status == EDGE_MISSING or (status == EDGE_STALE and not measured):
+            raise ValueError("No bandwidth edge in the AC sweep")
+        if status == EDGE_STALE:
+            continue
+        if not np.isfinite(BWs[i]): # flat gain around the edge, nothing to interpolate
+            raise ValueError("Bandwidth edge can not be interpolated")
+        measured = True
+        if worst == None or BWs[i] < BWs[worst]:
+            worst = i
+    return worst
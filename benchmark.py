@@ -0,0 +1,109 @@
+import argparse
+import json
+import time
+import numpy as np
+
+##########################################
+
+import circuit_analysis
+from circuit_analysis import CircuitAnalyzer
+from simulated_annealing import run_walk, get_encoding
+from optimizer import get_start_design
+from mock_ngspice import MockNgSpice
+from simulation_session import SimulationSession, set_session
+from helper_funcs import RunConfig, set_config
+
+# percentiles reported for every stage
+PERCENTILES = [50, 90, 99]
+
+# collects the stage durations CircuitAnalyzer reports through circuit_analysis.stage_hook
+class StageTimer:
+    def __init__(self) -> None:
+        self.durations = dict()
+
+    def __call__(self, stage : str, seconds : float) -> None:
+        self.durations.setdefault(stage, []).append(seconds)
+
+    # count, mean and percentiles in milliseconds per stage
+    def summary(self) -> dict[str, dict[str, float]]:
+        summary = dict()
+        for stage, durations in self.durations.items():
+            durations = np.array(durations)*1000
+            summary[stage] = {'count' : len(durations), 'mean_ms' : float(durations.mean()),
+                              **{f"p{p}_ms" : float(np.percentile(durations, p)) for p in PERCENTILES}}
+        return summary
+
+# designs a walk would visit, drawn once so every benchmark sees the same ones
+def get_designs(s_0 : dict, n : int, sigma : float, seed : int = 0) -> list[dict]:
+    np.random.seed(seed)
+    encoding = get_encoding(s_0)
+    x = encoding.encode(s_0)
+    designs = []
+    for i in range(n):
+        x = encoding.neighbour(x, sd=sigma)
+        designs.append(encoding.decode(x))
+    return designs
+
+# evaluations/sec and per stage latency of CircuitAnalyzer, failed designs are counted but not timed past their last stage
+def bench_evaluations(designs : list[dict], **options) -> dict:
+    timer = StageTimer()
+    circuit_analysis.stage_hook = timer
+    failures = 0
+    try:
+        start = time.perf_counter()
+        for s in designs:
+            try:
+                CircuitAnalyzer(s, **options)
+            except: # catches errors in NgSpice like run_walk
+                failures += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        circuit_analysis.stage_hook = None
+    return {'designs' : len(designs), 'failures' : failures, 'seconds' : elapsed,
+            'evaluations_per_sec' : len(designs)/elapsed, 'stages' : timer.summary()}
+
+# end to end annealing steps/sec without an evaluation cache
+def bench_run_walk(s_0 : dict, config : RunConfig, kMax : int, seed : int = 0) -> dict:
+    np.random.seed(seed)
+    start = time.perf_counter()
+    sbest, ebest = run_walk(T=config.T, kMax=kMax, s_0=s_0, config=config)
+    elapsed = time.perf_counter() - start
+    return {'steps' : kMax, 'seconds' : elapsed, 'steps_per_sec' : kMax/elapsed, 'ebest' : ebest}
+
+def print_report(name : str, result : dict) -> None:
+    print(f"{name}: {result['designs']} designs, {result['failures']} failures, {result['evaluations_per_sec']:.1f} evaluations/sec")
+    print(f"{'Stage':>10} {'Count':>6} {'Mean':>9} " + " ".join(f"{f'p{p}':>9}" for p in PERCENTILES))
+    for stage, stats in result['stages'].items():
+        print(f"{stage:>10} {stats['count']:>6} {stats['mean_ms']:>7.2f}ms " + " ".join(f"{stats[f'p{p}_ms']:>7.2f}ms" for p in PERCENTILES))
+    print()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluation throughput of CircuitAnalyzer and run_walk")
+    parser.add_argument('--mock', action='store_true', help="use the synthetic stand-in instead of ngspice")
+    parser.add_argument('--designs', type=int, default=200)
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--sigma', type=float, default=0.3)
+    parser.add_argument('--nominal', action='store_true', help="only the nominal transistor instead of the LO/HI corners")
+    parser.add_argument('--out', help="JSON file for the results")
+    args = parser.parse_args()
+
+    if args.mock:
+        set_session(SimulationSession(ngspice=MockNgSpice()))
+    config = RunConfig(isVerbose=False, sigma=args.sigma, dBeta=not args.nominal, nWorkers=1, showPlots=False)
+    set_config(config)
+    s_0 = get_start_design(config)
+    designs = get_designs(s_0, args.designs, args.sigma)
+
+    results = {'backend' : 'mock' if args.mock else 'ngspice', 'evaluations' : dict()}
+    benchmarks = [('netlist', {}), ('template', {'template' : True}), ('adaptive', {'template' : True, 'adaptive' : True})]
+    if not args.mock: # the stand-in only lives in this process and has no transistor vectors for the small signal solver
+        benchmarks.append(('batch', {'batch' : True}))
+        benchmarks.append(('fast AC', {'template' : True, 'fast_AC' : True}))
+    for name, options in benchmarks:
+        results['evaluations'][name] = bench_evaluations(designs, **options)
+        print_report(name, results['evaluations'][name])
+    results['run_walk'] = bench_run_walk(s_0, config, args.steps)
+    print(f"run_walk: {results['run_walk']['steps_per_sec']:.1f} steps/sec")
+    if args.out is not None:
+        with open(args.out, 'w') as file:
+            json.dump(results, file, indent=2)
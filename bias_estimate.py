@@ -0,0 +1,55 @@
+import numpy as np
+
+##########################################
+
+from spice_models import get_model_params
+
+# supply voltage, VDC of get_base_circuit
+VCC = 9
+# upper end of the base-emitter drop, a larger drop means less current
+VBE = 0.9
+# divides BF, beta falls at high currents (IKF, about 13% at 20mA) and a lower beta means less current
+BETA_MARGIN = 2
+# OP_current above which CircuitAnalyzer's current goodness is at most 0.5 and the design is rejected
+REJECT_CURRENT = 0.01 + np.sqrt(0.5)/100
+# only estimates this far above REJECT_CURRENT reject a design
+CURRENT_MARGIN = 1.5
+
+# lower bound on the supply current of one stage biased by the divider R_top, R_mid, R_bottom
+# the transistor setting the current has its base between R_mid and R_bottom and R_emitter to ground
+# a cascode stacks a second transistor with its base between R_top and R_mid and its collector on R_collector
+def stage_current(R_top : float, R_mid : float, R_bottom : float, R_emitter : float, R_collector : float | None, beta : float, cascode : bool) -> float:
+    g = 1/(beta + 1)
+    alpha = beta*g
+    # divider loaded by the base currents, solved for the emitter current of the lower transistor
+    K = 1 + (R_top + R_mid)/R_bottom
+    IE = max(VCC - VBE*K, 0)/(R_emitter*K + g*(R_mid + R_top*(1 + alpha*cascode)))
+    V_base = VBE + IE*R_emitter if IE > 0 else VCC/K
+    # everything returns to ground through R_bottom and R_emitter
+    active = V_base/R_bottom + IE
+    if R_collector is None: # emitter follower, the collector is on the supply
+        return active
+    # an upper transistor with a reverse biased base-collector junction is active, otherwise its collector is no higher than its base
+    # and the base no higher than the unloaded divider, so R_collector drops at least what R_top does
+    V_top = VCC*(R_mid + R_bottom)/(R_top + R_mid + R_bottom)
+    saturated = (VCC - V_top)/R_top + (VCC - V_top)/R_collector
+    return min(active, saturated)
+
+# lower bound on the supply current of a design for a transistor with forward beta BF
+# the stages only share the supply at DC, coupling capacitors and RF's small current are left out
+def estimate_current(s : dict, BF : float) -> float:
+    beta = BF/BETA_MARGIN
+    inStage, outStage = s['inStage'], s['outStage']
+    current = stage_current(inStage['RB1'], 0, inStage['RB2'], inStage['RE'], None, beta, cascode=False)
+    for cascode in (s['cascode1'], s['cascode2']):
+        current += stage_current(cascode['RB1'], cascode['RB2'], cascode['RB3'], cascode['RE_deg'] + cascode['RE'], cascode['RC'], beta, cascode=True)
+    current += stage_current(outStage['RB1'], outStage['RB2'], outStage['RB3'], outStage['RE'], outStage['RC'], beta, cascode=True)
+    return current
+
+# lower bound on OP_current, the highest current of the design's transistor tolerances
+def estimate_OP_current(s : dict) -> float:
+    return max(estimate_current(s, get_model_params(trans)['BF']) for trans in s['trans'].values())
+
+# whether the design draws so much current that NgSpice would reject it anyway
+def is_over_current(OP_current : float) -> bool:
+    return OP_current > CURRENT_MARGIN*REJECT_CURRENT
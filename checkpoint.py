@@ -0,0 +1,89 @@
+import os
+import numpy as np
+
+# steps between checkpoints of a walk
+CHECKPOINT_INTERVAL = 100
+
+# numpy's global random state as arrays, including the cached gaussian np.random.normal keeps
+def get_rng_state() -> dict[str, np.ndarray]:
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {'rng_keys' : keys, 'rng_pos' : np.array(pos), 'rng_has_gauss' : np.array(has_gauss), 'rng_cached_gaussian' : np.array(cached_gaussian)}
+
+def set_rng_state(state : dict[str, np.ndarray]) -> None:
+    np.random.set_state(('MT19937', state['rng_keys'], int(state['rng_pos']), int(state['rng_has_gauss']), float(state['rng_cached_gaussian'])))
+
+# one .npz file holding the arrays a walk needs to continue, replaced atomically on every save
+class WalkCheckpoint:
+    def __init__(self, path : str, interval : int = CHECKPOINT_INTERVAL) -> None:
+        self.path = path
+        self.interval = interval
+
+    # whether a walk should checkpoint after finishing "step" of "kMax" steps
+    def is_due(self, step : int, kMax : int) -> bool:
+        return (step + 1) % self.interval == 0 or step + 1 == kMax
+
+    # saves the arrays with the current random state, a kill mid write leaves the old file intact
+    def save(self, **arrays) -> None:
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            np.savez(file, **arrays, **get_rng_state())
+        os.replace(temp_path, self.path)
+
+    # the saved arrays or None if the walk never checkpointed, restores the random state
+    def load(self) -> dict[str, np.ndarray] | None:
+        if not os.path.exists(self.path):
+            return None
+        with np.load(self.path) as data:
+            state = {name : data[name] for name in data.files}
+        set_rng_state(state)
+        return state
+
+# directory of walk checkpoints plus the settings and start design of the run they belong to
+class RunCheckpoint:
+    def __init__(self, directory : str, interval : int = CHECKPOINT_INTERVAL) -> None:
+        self.directory = directory
+        self.interval = interval
+        self.header = os.path.join(directory, 'run.npz')
+
+    # whether an unfinished run left checkpoints behind
+    def can_resume(self) -> bool:
+        if not os.path.exists(self.header):
+            return False
+        with np.load(self.header) as data:
+            return not bool(data['finished'])
+
+    # starts a new run, dropping the walks of any previous one
+    # the random state is kept so walks that never checkpointed replay the same stream
+    def begin(self, settings : dict[str, float], x_0 : np.ndarray) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz') or name.endswith('.npz.tmp'):
+                os.remove(os.path.join(self.directory, name))
+        self.__write_header(x_0=x_0, finished=np.array(False), **get_rng_state(), **{f"setting_{name}" : np.array(value) for name, value in settings.items()})
+
+    # encoded start design of the run being resumed, its settings have to match
+    def resume(self, settings : dict[str, float]) -> np.ndarray:
+        header = self.__read_header()
+        saved = {name[len('setting_'):] : value.item() for name, value in header.items() if name.startswith('setting_')}
+        if saved != settings:
+            raise ValueError(f"Checkpoints in {self.directory} were written with different settings: {saved}")
+        set_rng_state(header)
+        return header['x_0']
+
+    def finish(self) -> None:
+        header = self.__read_header()
+        header['finished'] = np.array(True)
+        self.__write_header(**header)
+
+    def walk(self, name : str) -> WalkCheckpoint:
+        return WalkCheckpoint(os.path.join(self.directory, f"{name}.npz"), interval=self.interval)
+
+    def __read_header(self) -> dict[str, np.ndarray]:
+        with np.load(self.header) as data:
+            return {name : data[name] for name in data.files}
+
+    def __write_header(self, **arrays) -> None:
+        temp_path = self.header + '.tmp'
+        with open(temp_path, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(temp_path, self.header)
@@ -1,4 +1,5 @@
 import numpy as np
+import time
 
 ##########################################
 
@@ -9,70 +10,206 @@ from PySpice.Unit import *
 ##########################################
 
 from subcircuit_def import *
-
-# records every valid goodness value
-mega_goodness = []
+from ac_metrics import *
+from netlist_template import get_template
+from bias_estimate import estimate_OP_current, is_over_current
+from simulation_session import SessionSimulator, get_session
+from ngspice_batch import BatchSimulator
+from fused_corners import get_fused_simulators
+import small_signal
+from small_signal import get_op_saves, get_small_signal_simulator, is_check_due, check_AC
 
 # grabs the transistor paths
 dicts = SubCircuitDictionaries()
 trans_dict = dicts.get_trans_dict()
 
+# called as stage_hook(stage, seconds) after each stage of a CircuitAnalyzer, None skips the timing
+# stages are "bias", "circuit", "simulator", "dc", "ac", "post" and "sens"
+stage_hook = None
+
+# points per decade of the AC sweep
+SWEEP_POINTS = 50
+# adaptive AC sweep: coarse points per decade, points per refining sweep, max refining sweeps
+COARSE_POINTS = 10
+REFINE_POINTS = 8
+MAX_REFINEMENTS = 6
+
+# the log AC sweep from 1kHz to 100MHz, the whole analysis or an adaptive sweep's coarse start
+def get_sweep(points : int) -> dict:
+    return {'start_frequency' : 1@u_kHz, 'stop_frequency' : 100@u_MHz, 'number_of_points' : points, 'variation' : 'dec'}
+
+# AC sweep as plain arrays, merged from a coarse sweep and refining sweeps around the bandwidth edge when adaptive
+class ACAnalysis:
+    def __init__(self, frequency : np.ndarray, AC_out : np.ndarray, is_coarse : np.ndarray | None = None) -> None:
+        self.frequency = frequency
+        self.AC_out = AC_out
+        # refining points are left out of the mean square gain penalty
+        self.is_coarse = is_coarse if is_coarse is not None else np.ones(len(frequency), dtype=bool)
+
+# what a CircuitAnalyzer found without any of its simulators or analyses, small enough to keep many of
+# the worst case tolerance's sweep is kept as float32 gain and phase when asked for, otherwise get_AC_analysis simulates the design again
+class AnalysisResult:
+    __slots__ = ('curr_dict', 'options', 'BW', 'DC_gain', 'OP_current', 'goodness', 'frequency', 'gain', 'phase')
+
+    def __init__(self, curr_dict : dict, options : dict, BW : float, DC_gain : float, OP_current : float, goodness : float,
+                 analysis : ACAnalysis | None = None) -> None:
+        self.curr_dict = curr_dict
+        # CircuitAnalyzer keyword arguments the sweep is simulated again with
+        self.options = options
+        self.BW = BW
+        self.DC_gain = DC_gain
+        self.OP_current = OP_current
+        self.goodness = goodness
+        self.frequency, self.gain, self.phase = None, None, None
+        if analysis is not None:
+            self.__keep(analysis)
+
+    def __keep(self, analysis : ACAnalysis) -> None:
+        frequency, AC_out = get_AC_arrays(analysis)
+        self.frequency = frequency.astype(np.float32)
+        self.gain = np.absolute(AC_out).astype(np.float32)
+        self.phase = np.angle(AC_out).astype(np.float32)
+
+    # the worst case tolerance's sweep, simulated again the first time when it was not kept
+    # None for a design rejected on current, which never gets an AC analysis
+    def get_AC_analysis(self) -> ACAnalysis | None:
+        if self.gain is None:
+            analysis = CircuitAnalyzer(self.curr_dict, **{**self.options, 'prefilter' : False}).get_AC_analysis()
+            if analysis is None:
+                return None
+            self.__keep(analysis)
+        return ACAnalysis(self.frequency.astype(float), self.gain*np.exp(1j*self.phase.astype(float)))
+
 # takes in a circuit definition (state) and calculates goodness
 class CircuitAnalyzer: 
-    def __init__(self, curr_dict : dict[str, float | dict[str,str]]) -> None:
+    def __init__(self, curr_dict : dict[str, float | dict[str,str]], template : bool = False, adaptive : bool = False, BW_tol : float = 1e-3, prefilter : bool = False,
+                 model_params : dict[str, float] | None = None, ac : bool = True, batch : bool = False, fused : bool = False, fast_AC : bool = False,
+                 AC_check : int = 0, simulators : dict | None = None, keep_simulators : bool = False) -> None:
         self.curr_dict = curr_dict
-        # PySpice circuit from input dictionary
-        self.circuits = self.__make_circuit() 
-        # creates simulators for each transistor tolerance
-        self.simulators = self.__make_simulator() 
+        self.options = {'template' : template, 'adaptive' : adaptive, 'BW_tol' : BW_tol, 'prefilter' : prefilter, 'model_params' : model_params,
+                        'batch' : batch, 'fused' : fused, 'fast_AC' : fast_AC, 'AC_check' : AC_check}
+        # overrides of every transistor's model parameters, altered into the template
+        self.model_params = model_params
+        # closed form lower bound on the supply current, designs far over the limit are rejected before NgSpice
+        bias_current = self.__stage('bias', lambda: estimate_OP_current(curr_dict)) if prefilter else 0
+        self.prefiltered = is_over_current(bias_current)
+        if self.prefiltered:
+            self.OP_current = bias_current
+            self.OP_current_goodness = self.__get_current_goodness()
+            self.BW = 0
+            self.DC_gain = 0
+            self.goodness = -1
+            return
+        # compiled netlist reused between designs, only resistor values are altered
+        self.template = template
+        if model_params and not template:
+            raise ValueError("Model parameters can only be overridden through the netlist template")
+        # every analysis runs in an ngspice -b process of its own instead of the session's ngspice
+        self.batch = batch
+        if model_params and batch:
+            raise ValueError("Model parameters can not be overridden in batch mode")
+        # every transistor tolerance in one netlist, DC and AC are solved once for all of them
+        self.fused = fused
+        if model_params and fused:
+            raise ValueError("Model parameters can not be overridden in a fused netlist")
+        # AC sweeps solved in numpy from the operating point, every AC_check-th one simulated by ngspice as well to check the solver, 0 never checks
+        self.fast_AC = fast_AC
+        self.AC_check = AC_check
+        # coarse AC sweep refined around the bandwidth edge until it is within BW_tol (relative)
+        self.adaptive = adaptive
+        self.BW_tol = BW_tol
+        if simulators is not None: # simulators of each transistor tolerance made elsewhere, e.g. batch simulators with prefetched analyses
+            self.circuits = dict()
+            self.simulators = simulators
+        else:
+            # PySpice circuit from input dictionary
+            self.circuits = self.__stage('circuit', self.__make_circuit) if (batch or not template) and not fused else dict()
+            # creates simulators for each transistor tolerance
+            self.simulators = self.__stage('simulator', self.__make_simulator)
+        try:
+            self.__simulate(ac)
+        finally: # only numbers and plain arrays outlive the constructor, the simulators too unless get_sensitivities will need them
+            self.circuits = None
+            self.__DC_analyses = None
+            self.__AC_analyses = None
+            if not keep_simulators:
+                self.simulators = None
+
+    def __simulate(self, ac : bool) -> None:
         # DC simulation of circuit
-        self.__DC_analyses = self.__make_DC_analysis()
-        # extracts the operating current 
-        self.OP_current = self.__get_OP_current()
+        self.__DC_analyses = self.__stage('dc', self.__make_DC_analysis)
+        # extracts the operating current of each tolerance and the max
+        self.OP_currents = self.__get_OP_currents()
+        self.OP_current = max(self.OP_currents.values())
         # calculates punishment for current usage
-        self.OP_current_goodness = max(min(1,1 if self.OP_current <= 0.01 else 1-(100*(self.OP_current-0.01))**2),0.001)
+        self.OP_current_goodness = self.__get_current_goodness()
+        if not ac: # operating point only, bandwidth, gain and goodness are left unset
+            return
         if (self.OP_current_goodness > 0.5): # rejects high current circuits
             # AC simulation 
-            self.__AC_analyses = self.__make_AC_analysis()
-            self.frequencies = dict()
-            self.gains = dict()
-            # grabs the frequency and gain data from the analysis
-            for key, value in self.__AC_analyses.items():
-                self.frequencies[key] = value.frequency
-                self.gains[key] = np.absolute(value.AC_out)
-            # calculates & punishes the bandwidth 
-            self.BW, self.DC_gain, self.key_min = self.__get_BW()
-            # calculates goodness (higher better)
-            self.goodness = self.__get_goodness()
-            # records valid goodness
-            mega_goodness.append(self.goodness)
+            self.__AC_analyses = self.__stage('ac', self.__make_AC_analysis)
+            # bandwidth, gain and goodness from the AC data
+            self.__stage('post', self.__post_process)
         else: # rejected circuit
             self.BW = 0
             self.DC_gain = 0
             self.goodness = -1
     
+    # runs one stage, timing it only when something listens
+    def __stage(self, stage : str, make):
+        if stage_hook is None:
+            return make()
+        start = time.perf_counter()
+        result = make()
+        stage_hook(stage, time.perf_counter() - start)
+        return result
+
+    def __post_process(self) -> None:
+        self.frequencies = dict()
+        self.gains = dict()
+        self.responses = dict()
+        self.__is_coarse = dict()
+        # grabs the frequency and gain data from the analysis as plain arrays, copied so nothing of PySpice's waveforms is kept
+        for key, value in self.__AC_analyses.items():
+            self.frequencies[key], self.responses[key] = (np.array(x) for x in get_AC_arrays(value))
+            self.gains[key] = np.absolute(self.responses[key])
+            self.__is_coarse[key] = getattr(value, 'is_coarse', np.ones(len(self.gains[key]), dtype=bool))
+        # calculates & punishes the bandwidth 
+        self.BW, self.DC_gain, self.key_min = self.__get_BW()
+        # calculates goodness (higher better)
+        self.goodness = self.__get_goodness()
+
     # creates the circuit using the PySpice environment 
     def __make_circuit(self) -> dict[str, Circuit]:
         circuits = {}
         for key, value in self.curr_dict['trans'].items(): # type: ignore
-            circuit = get_base_circuit()
-            circuit.SinusoidalVoltageSource('AC_voltage', 'ac_in', circuit.gnd, amplitude=1@u_V) 
-            circuit.R('RAC', 'ac_in', 'in_node', 1500@u_Ohm)
-            circuit.include(trans_dict[value])
-            circuit.subcircuit(FeedBackAmp(self.curr_dict, value))
-            circuit.X('fbamp1','feedbackamp','Vcc', circuit.gnd,'in_node','out')
-            circuits[key] = circuit
+            circuits[key] = get_amp_circuit(self.curr_dict, value)
         return circuits
 
     # creates simulator objects for each transistor tolerance
-    def __make_simulator(self, temperature = 25) -> dict[str, NgSpiceSharedCircuitSimulator]:
+    def __make_simulator(self, temperature = 25) -> dict[str, SessionSimulator]:
         simulators = dict()
+        if self.fused: # one simulator per tolerance, each a view of the fused netlist
+            return get_fused_simulators(self.curr_dict, temperature, template=self.template, batch=self.batch, fast_AC=self.fast_AC)
+        if self.batch: # netlists of their own, the session's ngspice is never touched
+            return {key : BatchSimulator(value, temperature=temperature, saves=["AC_out","i(vvdc)"] + self.__get_op_saves(self.curr_dict['trans'][key]))
+                    for key, value in self.circuits.items()}
+        if self.template: # one compiled template serves every transistor tolerance
+            template = get_template(self.curr_dict, temperature, saves=tuple(self.__get_op_saves(list(self.curr_dict['trans'].values())[0])))
+            for key, value in self.curr_dict['trans'].items(): # type: ignore
+                simulators[key] = template.bind(self.curr_dict, value, self.model_params)
+            return simulators
         for key, value in self.circuits.items():
-            temp = value.simulator(temperature=temperature, nominal_temperature=temperature)
-            temp.save(["AC_out","i(vvdc)"])
+            temp = get_session().simulator(value, temperature=temperature)
+            temp.save(["AC_out","i(vvdc)"] + self.__get_op_saves(self.curr_dict['trans'][key]))
+            temp.compile()
             simulators[key] = temp
         return simulators
 
+    # transistor vectors the small signal solver reads from the operating point, nothing more is saved without fast_AC
+    def __get_op_saves(self, trans : str) -> list[str]:
+        return get_op_saves(self.curr_dict, trans) if self.fast_AC else []
+
     # calculates DC operating point of the circuit
     def __make_DC_analysis(self) -> dict:
         DC_analyses = dict()
@@ -80,58 +217,83 @@ class CircuitAnalyzer:
             DC_analyses[key] = value.operating_point()
         return DC_analyses
 
-    # returns the max current draw of all the transistor tolerances
-    def __get_OP_current(self) -> float:
-        return max(max([abs(float(np.absolute(x[0]))) for x in DC_analysis.branches.values()]) for DC_analysis in self.__DC_analyses.values())
+    # returns the max current draw of each transistor tolerance
+    def __get_OP_currents(self) -> dict[str, float]:
+        return {key : max([abs(float(np.absolute(x[0]))) for x in DC_analysis.branches.values()]) for key, DC_analysis in self.__DC_analyses.items()}
+
+    # punishment for current usage, rejects the design at 0.5 or below
+    def __get_current_goodness(self) -> float:
+        return max(min(1,1 if self.OP_current <= 0.01 else 1-(100*(self.OP_current-0.01))**2),0.001)
 
     # simulates the circuit between a range of frequencies on a log scale
+    # with fast_AC the sweeps are solved from the operating point instead, a checked design keeps ngspice's sweeps, so a mismatched one is never scored from the solver
     def __make_AC_analysis(self) -> dict:
+        fast = self.__make_small_signal() if self.fast_AC else None
+        if fast is not None and not is_check_due(self.AC_check):
+            return self.__sweep(fast)
+        AC_analyses = self.__sweep(self.simulators)
+        if fast is not None:
+            check_AC(fast, AC_analyses)
+        return AC_analyses
+
+    # small signal simulators of each transistor tolerance, None when an operating point lacks the transistor vectors
+    def __make_small_signal(self) -> dict | None:
+        simulators = dict()
+        for key, value in self.curr_dict['trans'].items(): # type: ignore
+            simulators[key] = get_small_signal_simulator(self.curr_dict, value, self.__DC_analyses[key], self.model_params)
+            if simulators[key] is None:
+                small_signal.counts['fallback'] += 1
+                return None
+        return simulators
+
+    # the AC sweep of every tolerance from "simulators"
+    def __sweep(self, simulators : dict) -> dict:
         AC_analyses = dict()
-        for key, value in self.simulators.items():
-            AC_analyses[key] = value.ac(start_frequency=1@u_kHz, stop_frequency=100@u_MHz, number_of_points=50,  variation='dec')
+        for key, value in simulators.items():
+            if self.adaptive:
+                AC_analyses[key] = self.__make_adaptive_AC_analysis(value)
+            else:
+                AC_analyses[key] = value.ac(**get_sweep(SWEEP_POINTS))
         return AC_analyses
+
+    # coarse log sweep, then linear sweeps across the bracket holding the bandwidth edge until it is narrow enough
+    # a DC gain outside the window is punished by the mean gain penalty of the full sweep, which the coarse points can't reproduce
+    def __make_adaptive_AC_analysis(self, simulator) -> ACAnalysis:
+        sweep = simulator.ac(**get_sweep(COARSE_POINTS))
+        frequency = np.asarray(sweep.frequency, dtype=float)
+        AC_out = np.asarray(sweep.AC_out, dtype=complex)
+        is_coarse = np.ones(len(frequency), dtype=bool)
+        if np.absolute(AC_out[0]) > MIN_DC_GAIN and get_edge_index(np.absolute(AC_out))[1]:
+            return ACAnalysis(*get_AC_arrays(simulator.ac(**get_sweep(SWEEP_POINTS))))
+        for _ in range(MAX_REFINEMENTS):
+            gains = np.absolute(AC_out)
+            index = get_edge_index(gains)[0]
+            if gains[0] <= MIN_DC_GAIN or index < 1: # nothing to bracket
+                break
+            f_low, f_high = frequency[index-1], frequency[index]
+            if f_high - f_low <= self.BW_tol*f_low: # edge is known well enough
+                break
+            sweep = simulator.ac(start_frequency=f_low, stop_frequency=f_high, number_of_points=REFINE_POINTS+2, variation='lin')
+            # end points are already known
+            frequency = np.concatenate((frequency, np.asarray(sweep.frequency, dtype=float)[1:-1]))
+            AC_out = np.concatenate((AC_out, np.asarray(sweep.AC_out, dtype=complex)[1:-1]))
+            is_coarse = np.concatenate((is_coarse, np.zeros(REFINE_POINTS, dtype=bool)))
+            order = np.argsort(frequency, kind='stable')
+            frequency, AC_out, is_coarse = frequency[order], AC_out[order], is_coarse[order]
+        return ACAnalysis(frequency, AC_out, is_coarse)
     
     # calculates the 1.5dB bandwidth and punishes bandwidth for being out of the desired gain range
     def __get_BW(self) -> tuple[float, float, str]:
-        BW_min = None
-        DC_gain_min = None
-        key_min = ""
-        for key, freq in self.frequencies.items():
-            DC_gain_curr = self.gains[key][0].value
-            if DC_gain_curr > 100: # only check minimum operational amplifiers 
-                index_3dB = None
-                for i, x in enumerate(self.gains[key]):
-                    if x.value > 1188.5 or x.value < 944: # finds the 60+-1.5dB BW
-                        index_3dB = i
-                        break
-                if index_3dB > 1: # if its valid, approximates the exact value
-                    currBW = self.__lin_approx(freq[index_3dB].value,self.gains[key][index_3dB],freq[index_3dB-1].value,self.gains[key][index_3dB-1], DC_gain_curr*0.944)
-                else: # invalid -> needs to be punished
-                    if index_3dB == 0:
-                        for i, x in enumerate(self.gains[key]):
-                            # finds 1.5dB bandwidth
-                            if x.value <= DC_gain_curr*0.944 or x.value >= DC_gain_curr/0.944: 
-                                index_3dB = i
-                                break
-                        # approximates exact value
-                        currBW = self.__lin_approx(freq[index_3dB].value,self.gains[key][index_3dB],freq[index_3dB-1].value,self.gains[key][index_3dB-1], DC_gain_curr*0.944)
-                        i = 0
-                        adj = 0
-                        # punishes bandwidth based on mean square distance from desired gain
-                        while(freq[i].value < 7.2*10**6): 
-                            adj += min((self.gains[key][i].value - 1188.5)**2,(self.gains[key][i].value - 944)**2)
-                            i += 1
-                        currBW /= np.sqrt(adj)/i
-                # boot strapping and takes lower of BWs
-                if index_3dB != None and currBW != None and (BW_min == None or currBW < BW_min):
-                    BW_min = currBW 
-                    DC_gain_min = DC_gain_curr
-                    key_min = key
-        return (lambda: (BW_min, DC_gain_min, key_min), lambda: (0,0,self.curr_dict['trans'][list(self.curr_dict['trans'].keys())[0]]))[BW_min == None]() 
-
-    # simple linear approximation
-    def __lin_approx(self, x1, y1, x2, y2, y_target):
-        return (y_target-y1)*(x2-x1)/(y2-y1) + x1
+        keys = list(self.frequencies.keys())
+        if len(set(len(x) for x in self.gains.values())) == 1: # same sweep for every tolerance, one batched call
+            BWs, DC_gains, statuses = get_BWs(np.stack([self.frequencies[key] for key in keys]), np.stack([self.gains[key] for key in keys]), np.stack([self.__is_coarse[key] for key in keys]))
+        else: # adaptive sweeps differ in length
+            BWs, DC_gains, statuses = (np.array(x) for x in zip(*(get_BWs(self.frequencies[key], self.gains[key], self.__is_coarse[key]) for key in keys)))
+        # boot strapping and takes lower of BWs
+        worst = get_worst_case(BWs, statuses)
+        if worst == None:
+            return (0,0,keys[0])
+        return (BWs[worst], DC_gains[worst], keys[worst])
 
     # unused
     def __get_GBWP(self) -> float:
@@ -145,6 +307,27 @@ class CircuitAnalyzer:
         else:
             return 0
     
-    # returns analysis for worst case of transistor tolerance
-    def get_AC_analysis(self):
-        return self.__AC_analyses[self.key_min]
\ No newline at end of file
+    # sensitivities to every device parameter, keyed by the flattened ngspice name, from one NgSpice run each
+    # i(vvdc) on the tolerance drawing the most current, AC_out at "frequencies" on the worst case tolerance when given
+    def get_sensitivities(self, frequencies : tuple[float, float] | None = None) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray] | None]:
+        if self.simulators is None:
+            raise ValueError("Sensitivities need the analyzer made with keep_simulators=True")
+        key_current = max(self.OP_currents, key=self.OP_currents.get)
+        DC = self.__stage('sens', lambda: self.simulators[key_current].sensitivity('i(vvdc)'))
+        DC_sensitivities = {name.lower() : np.asarray(value, dtype=float) for name, value in DC.elements.items()}
+        if frequencies is None:
+            return DC_sensitivities, None
+        AC = self.__stage('sens', lambda: self.simulators[self.key_min].sensitivity('v(ac_out)', start_frequency=frequencies[0], stop_frequency=frequencies[1],
+                                                                                     number_of_points=2, variation='lin'))
+        return DC_sensitivities, {name.lower() : np.asarray(value, dtype=complex) for name, value in AC.elements.items()}
+
+    # returns analysis for worst case of transistor tolerance, None when the design was rejected on current before its AC analysis
+    def get_AC_analysis(self) -> ACAnalysis | None:
+        if not hasattr(self, 'key_min'):
+            return None
+        return ACAnalysis(self.frequencies[self.key_min], self.responses[self.key_min], self.__is_coarse[self.key_min])
+
+    # the record of this analysis, keeping the worst case sweep when "keep_AC"
+    def result(self, keep_AC : bool = False) -> AnalysisResult:
+        return AnalysisResult(self.curr_dict, self.options, self.BW, self.DC_gain, self.OP_current, self.goodness,
+                              self.get_AC_analysis() if keep_AC else None)
\ No newline at end of file
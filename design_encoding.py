@@ -0,0 +1,85 @@
+import numpy as np
+
+# compact design state: one (decade, mantissa index) row per free resistor in a fixed order
+# the value of a row is valid_res[mantissa]*10**(decade-1), as iter_resistor computes it
+class DesignEncoding:
+    DECADES = 10 # lookup table rows, decade 1 (10 ohm) to 7 (21.5 Mohm) are reachable
+
+    def __init__(self, s_0 : dict, free_vars : list[str], free_vars_dict : dict[str, list[str]], valid_res : list[float]) -> None:
+        self.s_0 = s_0
+        # paths into the design dictionary in the order neighbour draws its steps
+        self.paths = []
+        for key in free_vars:
+            if type(s_0[key]) == dict:
+                self.paths.extend((key, sub_key) for sub_key in free_vars_dict[key])
+            else:
+                self.paths.append((key,))
+        self.size = len(self.paths)
+        self.valid_res = np.array(valid_res)
+        self.len_valid_res = len(valid_res)
+        # value lookup table, same arithmetic as iter_resistor so decoded floats match exactly
+        decades = np.arange(self.DECADES, dtype=float)
+        self.table = self.valid_res[None, :]*10**(decades[:, None] - 1)
+        self.log_table = np.log10(self.table)
+        # 10 ohm and 21.5 Mohm bounds as flat indices
+        self.flat_min = 1*self.len_valid_res + 0
+        self.flat_max = 7*self.len_valid_res + valid_res.index(21.5)
+
+    # design dictionary to encoded state
+    def encode(self, s : dict) -> np.ndarray:
+        R = np.array([self.__get(s, path) for path in self.paths], dtype=float)
+        decade = np.floor(np.log10(R))
+        mantissa = np.searchsorted(self.valid_res, np.round(R/10**(decade - 1), 1))
+        mantissa = np.minimum(mantissa, self.len_valid_res - 1)
+        if not np.allclose(self.valid_res[mantissa]*10**(decade - 1), R):
+            raise ValueError(f"Resistors are not all valid 2% values: {R}")
+        return np.stack((decade, mantissa), axis=1).astype(np.int16)
+
+    # encoded state to the get_feedbackamp_dict format, unchanged parts are shared with s_0
+    def decode(self, x : np.ndarray) -> dict:
+        s = self.s_0.copy()
+        values = self.values(x)
+        for path, value in zip(self.paths, values.tolist()):
+            if len(path) == 1:
+                s[path[0]] = value
+            else:
+                if s[path[0]] is self.s_0[path[0]]: # copy sub circuits only once
+                    s[path[0]] = s[path[0]].copy()
+                s[path[0]][path[1]] = value
+        return s
+
+    def values(self, x : np.ndarray) -> np.ndarray:
+        return self.table[x[:, 0], x[:, 1]]
+
+    # log10 of every resistor, a smooth space for distances and models
+    def log_values(self, x : np.ndarray) -> np.ndarray:
+        return self.log_table[x[..., 0], x[..., 1]]
+
+    def flat(self, x : np.ndarray) -> np.ndarray:
+        return x[..., 0].astype(np.int64)*self.len_valid_res + x[..., 1]
+
+    def unflat(self, flat : np.ndarray) -> np.ndarray:
+        return np.stack(np.divmod(flat, self.len_valid_res), axis=-1).astype(np.int16)
+
+    # moves every resistor a random number of E96 steps, vectorized iter_resistor
+    # "mean" biases the steps of each resistor, e.g. up a gradient
+    def neighbour(self, x : np.ndarray, sd : float, mean : np.ndarray | float = 0) -> np.ndarray:
+        n = np.round(np.random.normal(mean, sd, size=self.size)).astype(np.int64)
+        decade = x[:, 0].astype(np.int64)
+        j = x[:, 1] + n
+        # overflow wrapping
+        up = np.where(j >= self.len_valid_res, j//self.len_valid_res, 0)
+        j = j - up*self.len_valid_res
+        # underflow wrapping, stops short of a full decade like iter_resistor
+        down = np.where(j <= -self.len_valid_res, (-j - self.len_valid_res)//self.len_valid_res + 1, 0)
+        j = j + down*self.len_valid_res
+        # a remaining negative index reads valid_res from the end without changing decade
+        flat = (decade + up - down)*self.len_valid_res + j % self.len_valid_res
+        # bounds on allowed resistor values
+        flat = np.clip(flat, self.flat_min, self.flat_max)
+        return np.where((n != 0)[:, None], self.unflat(flat), x)
+
+    def __get(self, s : dict, path : tuple) -> float:
+        for key in path:
+            s = s[key]
+        return s
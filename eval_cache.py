@@ -0,0 +1,200 @@
+import shelve
+import time
+from collections import OrderedDict, namedtuple
+
+##########################################
+
+import instrumentation
+from circuit_analysis import CircuitAnalyzer, SWEEP_POINTS, COARSE_POINTS, get_sweep
+from bias_estimate import estimate_OP_current, is_over_current
+from ngspice_batch import BatchSimulator, prefetch
+from subcircuit_def import get_amp_circuit
+from fused_corners import get_fused_simulators
+from simulation_session import ac_command
+from small_signal import get_op_saves
+
+# the scalars worth keeping from a CircuitAnalyzer
+CachedEvaluation = namedtuple('CachedEvaluation', ['BW', 'DC_gain', 'OP_current', 'goodness'])
+
+# evaluation server client designs are sent to instead of simulating in this process, see eval_server
+remote = None
+
+def set_remote(client) -> None:
+    global remote
+    remote = client
+
+# canonical, hashable key for a design dictionary (resistors and transistor corners)
+def design_key(s : dict) -> tuple:
+    key = []
+    for name, value in sorted(s.items()):
+        if type(value) == dict: # recursion to handle sub circuits
+            key.append((name, design_key(value)))
+        elif type(value) == str: # transistor model names
+            key.append((name, value))
+        else: # 6 significant figures hides float noise from iter_resistor
+            key.append((name, float(f"{float(value):.6g}")))
+    return tuple(key)
+
+# bounded LRU cache of evaluated designs with an optional on-disk backing store
+# designs are keyed by the repr of their design key and mode in memory as on disk, so records move between the two and between processes as they are
+class EvaluationCache:
+    def __init__(self, maxsize : int = 100000, path : str | None = None, keep_new : bool = False) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.__memory = OrderedDict()
+        # shelve keeps designs across runs of main.py
+        self.__disk = shelve.open(path) if path is not None else None
+        # records put since the last drain, a worker process's cache sends them back to the parent's
+        self.__new = [] if keep_new else None
+        self.__drained = {'hits' : 0, 'disk_hits' : 0, 'misses' : 0}
+
+    def __len__(self) -> int:
+        return len(self.__memory)
+
+    # returns the cached evaluation of "s" or None, "mode" separates analysis settings that change results
+    def get(self, s : dict, mode : tuple = ()) -> CachedEvaluation | None:
+        key = repr((design_key(s), mode))
+        if key in self.__memory:
+            self.__memory.move_to_end(key)
+            self.hits += 1
+            return self.__memory[key]
+        if self.__disk is not None and key in self.__disk:
+            record = CachedEvaluation(*self.__disk[key])
+            self.__remember(key, record)
+            self.hits += 1
+            self.disk_hits += 1
+            return record
+        self.misses += 1
+        return None
+
+    def put(self, s : dict, record : CachedEvaluation, mode : tuple = ()) -> None:
+        key = repr((design_key(s), mode))
+        self.__remember(key, record)
+        if self.__disk is not None:
+            self.__disk[key] = tuple(record)
+        if self.__new is not None:
+            self.__new.append((key, record))
+
+    # stores in memory and evicts the least recently used design
+    def __remember(self, key : str, record : CachedEvaluation) -> None:
+        self.__memory[key] = record
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.maxsize:
+            self.__memory.popitem(last=False)
+
+    # every key and record on disk and in memory, the ones in memory last so they outlive the rest in a smaller cache, seeds a worker's cache
+    def records(self) -> list[tuple[str, CachedEvaluation]]:
+        records = []
+        if self.__disk is not None:
+            records = [(key, CachedEvaluation(*value)) for key, value in self.__disk.items() if key not in self.__memory]
+        return records + list(self.__memory.items())
+
+    # adds records of another cache without counting hits or misses
+    def merge(self, records : list[tuple[str, CachedEvaluation]]) -> None:
+        for key, record in records:
+            self.__remember(key, record)
+            if self.__disk is not None:
+                self.__disk[key] = tuple(record)
+
+    # records put and counts since the last drain, sent back by worker processes
+    def drain(self) -> dict:
+        drained = {'records' : self.__new if self.__new is not None else [], 'hits' : self.hits - self.__drained['hits'],
+                   'disk_hits' : self.disk_hits - self.__drained['disk_hits'], 'misses' : self.misses - self.__drained['misses']}
+        if self.__new is not None:
+            self.__new = []
+        self.__drained = {'hits' : self.hits, 'disk_hits' : self.disk_hits, 'misses' : self.misses}
+        return drained
+
+    # takes in what a worker's cache drained, as if the worker's lookups had been made here
+    def merge_drained(self, drained : dict) -> None:
+        self.merge(drained['records'])
+        self.hits += drained['hits']
+        self.disk_hits += drained['disk_hits']
+        self.misses += drained['misses']
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits/total if total else 0
+
+    def close(self) -> None:
+        if self.__disk is not None:
+            self.__disk.close()
+            self.__disk = None
+
+# cache mode of CircuitAnalyzer options, the compiled template, batch processes and fused netlists give the same goodness, so they share cache entries
+# the bias prefilter's estimate is not validated against every design it rejects, so its records are kept apart from simulated ones
+# the fast AC solver does not, but how often it is checked only decides which designs get ngspice's sweep
+# dict valued options such as model_params are frozen to sorted tuples so the mode stays hashable
+def get_mode(options : dict) -> tuple:
+    return tuple(sorted((name, tuple(sorted(value.items())) if isinstance(value, dict) else value) for name, value in options.items()
+                        if name not in ('template', 'batch', 'fused', 'AC_check') and value))
+
+# evaluates a design, only running NgSpice when the cache has not seen it
+# options are passed on to CircuitAnalyzer
+def evaluate(s : dict, cache : EvaluationCache | None = None, **options) -> CachedEvaluation:
+    mode = get_mode(options)
+    instruments = instrumentation.instruments
+    start = time.perf_counter() if instruments is not None else 0
+    record = cache.get(s, mode) if cache is not None else None
+    cache_hit = record is not None
+    if not cache_hit:
+        if remote is not None:
+            record = remote.evaluate(s, options)
+        else:
+            analyzer = CircuitAnalyzer(s, **options)
+            record = CachedEvaluation(analyzer.BW, analyzer.DC_gain, analyzer.OP_current, analyzer.goodness)
+        if cache is not None:
+            cache.put(s, record, mode)
+    if instruments is not None:
+        instruments.time('evaluate', time.perf_counter() - start)
+        instruments.evaluation(record, cache_hit)
+    return record
+
+# evaluates many designs at once, the ones the cache has not seen are simulated together
+# every transistor tolerance of every design runs its operating point and AC sweep in one ngspice -b process, nProcesses at a time
+# a fused design runs all its tolerances in one process
+# with fast_AC only the operating points are run up front, checked designs fetch their AC sweep afterwards
+# a design NgSpice fails on is None instead of raising, the rest of the batch is unaffected
+def evaluate_batch(designs : list[dict], cache : EvaluationCache | None = None, nProcesses : int = 1, **options) -> list[CachedEvaluation | None]:
+    mode = get_mode(options)
+    instruments = instrumentation.instruments
+    start = time.perf_counter() if instruments is not None else 0
+    records = [cache.get(s, mode) if cache is not None else None for s in designs]
+    hits = [record is not None for record in records]
+    misses = [i for i, record in enumerate(records) if record is None]
+    if remote is not None:
+        for i, record in zip(misses, remote.map([designs[i] for i in misses], options)):
+            records[i] = record
+    else:
+        # designs the bias prefilter rejects never reach ngspice
+        simulate = [i for i in misses if not (options.get('prefilter') and is_over_current(estimate_OP_current(designs[i])))]
+        simulators = dict()
+        batch = [] # one process per tolerance, or per design when its tolerances are fused
+        for i in simulate:
+            if options.get('fused'):
+                simulators[i] = get_fused_simulators(designs[i], batch=True, fast_AC=options.get('fast_AC', False))
+                batch.append(next(iter(simulators[i].values())).fused.simulator)
+            else:
+                simulators[i] = {key : BatchSimulator(get_amp_circuit(designs[i], trans),
+                                                      saves=["AC_out","i(vvdc)"] + (get_op_saves(designs[i], trans) if options.get('fast_AC') else []))
+                                 for key, trans in designs[i]['trans'].items()}
+                batch.extend(simulators[i].values())
+        commands = ['op'] + ([] if options.get('fast_AC') else [ac_command(**get_sweep(COARSE_POINTS if options.get('adaptive') else SWEEP_POINTS))])
+        prefetch(batch, commands, nProcesses)
+        for i in misses:
+            try:
+                analyzer = CircuitAnalyzer(designs[i], simulators=simulators.get(i), **{**options, 'batch' : True})
+                records[i] = CachedEvaluation(analyzer.BW, analyzer.DC_gain, analyzer.OP_current, analyzer.goodness)
+            except: # catches errors in NgSpice
+                records[i] = None
+    for i in misses:
+        if records[i] is not None and cache is not None:
+            cache.put(designs[i], records[i], mode)
+    if instruments is not None:
+        instruments.time('evaluate', time.perf_counter() - start)
+        for record, cache_hit in zip(records, hits):
+            if record is not None:
+                instruments.evaluation(record, cache_hit)
+    return records
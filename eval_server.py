@@ -0,0 +1,312 @@
+import argparse
+import ipaddress
+import multiprocessing
+import os
+import queue
+import secrets
+import socket
+import threading
+import time
+import uuid
+from multiprocessing.managers import BaseManager
+
+##########################################
+
+from circuit_analysis import CircuitAnalyzer
+from eval_cache import CachedEvaluation, set_remote
+from simulation_session import SimulationSession, set_session, forget_inherited_ngspice
+from helper_funcs import RunConfig
+
+# environment variable holding the shared secret of the server, its workers and clients, there is no default key
+AUTHKEY_VARIABLE = 'EVAL_AUTHKEY'
+# host servers listen on and clients connect to unless told otherwise, only this machine can reach it
+LOOPBACK_HOST = '127.0.0.1'
+# port the server listens on unless told otherwise
+EVAL_PORT = 50000
+# designs waiting for a worker before clients block, the back-pressure on every client together
+QUEUE_SIZE = 256
+# designs one client has out at once
+CLIENT_WINDOW = 64
+# seconds one evaluation may take before its worker's simulator is killed and restarted
+EVAL_TIMEOUT = 60
+# times a timed out, crashed or lost evaluation is sent again before it counts as failed
+EVAL_RETRIES = 2
+# seconds a queued design may wait for a worker to start it, on top of twice the timeout, before it is sent again
+# a worker that dies between taking a design and starting it never reports it, this is how long the design is missed for
+QUEUE_WAIT = 300
+# seconds a client waits on a full queue or an empty result queue before checking its deadlines again
+POLL_INTERVAL = 0.5
+# seconds a worker waits for its server to come up
+CONNECT_WAIT = 30
+
+# "host:port" to a manager address
+def parse_address(address : str) -> tuple[str, int]:
+    host, _, port = address.rpartition(':')
+    return (host or LOOPBACK_HOST, int(port) if port else EVAL_PORT)
+
+# whether only this machine can reach "host"
+def is_loopback(host : str) -> bool:
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+# the key set in EVAL_AUTHKEY, None when it is not set
+def get_authkey() -> bytes | None:
+    key = os.environ.get(AUTHKEY_VARIABLE)
+    return key.encode() if key else None
+
+# key of a server listening on "host", other machines can only reach it with EVAL_AUTHKEY set
+# a loopback server without one makes up a random key and prints it for its clients
+def get_server_authkey(host : str) -> bytes:
+    authkey = get_authkey()
+    if authkey is not None:
+        return authkey
+    if not is_loopback(host):
+        raise RuntimeError(f"Set {AUTHKEY_VARIABLE} before serving on {host}, other machines could connect to it")
+    key = secrets.token_hex(16)
+    print(f"{AUTHKEY_VARIABLE} is not set, clients connect with {AUTHKEY_VARIABLE}={key}")
+    return key.encode()
+
+# key workers and clients connect with, the server's has to be set in EVAL_AUTHKEY
+def get_client_authkey() -> bytes:
+    authkey = get_authkey()
+    if authkey is None:
+        raise RuntimeError(f"Set {AUTHKEY_VARIABLE} to the key of the evaluation server")
+    return authkey
+
+# the server side hands out the shared queues, clients and workers only name them
+class ServerManager(BaseManager):
+    pass
+
+class ClientManager(BaseManager):
+    pass
+
+for name in ('get_task_queue', 'get_result_queue', 'drop_result_queue'):
+    ClientManager.register(name)
+
+# connects to the server, waiting up to "wait" seconds for it to come up
+def connect(address : tuple[str, int], authkey : bytes | None = None, wait : float = 0) -> ClientManager:
+    authkey = authkey if authkey is not None else get_client_authkey()
+    give_up = time.monotonic() + wait
+    while True:
+        manager = ClientManager(address=address, authkey=authkey)
+        try:
+            manager.connect()
+            return manager
+        except ConnectionRefusedError:
+            if time.monotonic() > give_up:
+                raise
+            time.sleep(POLL_INTERVAL)
+
+# hosts one bounded task queue every worker takes from and a result queue per client
+# tasks are (client_id, task_id, design, options, timeout), results (task_id, status, payload)
+def serve(address : tuple[str, int], authkey : bytes | None = None, queue_size : int = QUEUE_SIZE) -> None:
+    authkey = authkey if authkey is not None else get_server_authkey(address[0])
+    tasks = queue.Queue(maxsize=queue_size)
+    results = dict()
+    lock = threading.Lock()
+
+    def get_result_queue(client_id : str) -> queue.Queue:
+        with lock:
+            return results.setdefault(client_id, queue.Queue())
+
+    def drop_result_queue(client_id : str) -> queue.Queue:
+        with lock:
+            return results.pop(client_id, queue.Queue())
+
+    ServerManager.register('get_task_queue', callable=lambda: tasks)
+    ServerManager.register('get_result_queue', callable=get_result_queue)
+    ServerManager.register('drop_result_queue', callable=drop_result_queue)
+    print(f"Evaluation server listening on {address[0]}:{address[1]}")
+    ServerManager(address=address, authkey=authkey).get_server().serve_forever()
+
+# simulates designs sent down "conn" in a process of its own, so a hung or crashed NgSpice takes only this process down
+# ends when its worker goes away, "parent_conn" is the worker's end a fork leaves open here
+def simulator_loop(conn, parent_conn, max_runs : int) -> None:
+    parent_conn.close()
+    # a forked process inherits its parent's instance, so force a fresh one
+    forget_inherited_ngspice()
+    set_session(SimulationSession(max_runs=max_runs))
+    while True:
+        try:
+            s, options = conn.recv()
+        except EOFError:
+            return
+        try:
+            analyzer = CircuitAnalyzer(s, **options)
+            conn.send(('ok', tuple(CachedEvaluation(analyzer.BW, analyzer.DC_gain, analyzer.OP_current, analyzer.goodness))))
+        except Exception as error: # errors in NgSpice, the design fails like it would locally
+            conn.send(('error', repr(error)))
+
+# takes tasks from the server, simulating each in a child process that is killed and replaced when it hangs or dies
+class EvaluationWorker:
+    def __init__(self, address : tuple[str, int], authkey : bytes | None = None, max_runs : int = 10000) -> None:
+        self.manager = connect(address, authkey, wait=CONNECT_WAIT)
+        self.tasks = self.manager.get_task_queue()
+        self.results = dict()
+        self.max_runs = max_runs
+        self.simulator = None
+        self.conn = None
+
+    def __start_simulator(self) -> None:
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.simulator = multiprocessing.Process(target=simulator_loop, args=(child_conn, self.conn, self.max_runs), daemon=True)
+        self.simulator.start()
+        child_conn.close()
+
+    def __kill_simulator(self) -> None:
+        self.simulator.kill()
+        self.simulator.join()
+        self.simulator = None
+
+    def __result_queue(self, client_id : str):
+        if client_id not in self.results:
+            self.results[client_id] = self.manager.get_result_queue(client_id)
+        return self.results[client_id]
+
+    # status and payload of one evaluation, "timeout" or "crash" when the simulator had to be replaced
+    def evaluate(self, s : dict, options : dict, timeout : float) -> tuple[str, object]:
+        if self.simulator is None or not self.simulator.is_alive():
+            self.__start_simulator()
+        try:
+            self.conn.send((s, options))
+            if not self.conn.poll(timeout): # hung NgSpice run
+                self.__kill_simulator()
+                return 'timeout', None
+            return self.conn.recv()
+        except (EOFError, OSError): # the simulator died mid run
+            self.__kill_simulator()
+            return 'crash', None
+
+    # serves until the server goes away
+    def run(self) -> None:
+        try:
+            while True:
+                client_id, task_id, s, options, timeout = self.tasks.get()
+                results = self.__result_queue(client_id)
+                results.put((task_id, 'started', None))
+                status, payload = self.evaluate(s, options, timeout)
+                results.put((task_id, status, payload))
+        except (EOFError, ConnectionError): # server shut down
+            pass
+        finally:
+            if self.simulator is not None:
+                self.__kill_simulator()
+
+def worker_main(address : tuple[str, int], authkey : bytes | None, max_runs : int) -> None:
+    EvaluationWorker(address, authkey, max_runs).run()
+
+# starts n workers on this machine, each with its own simulator process
+def start_workers(address : tuple[str, int], n : int, authkey : bytes | None = None, max_runs : int = 10000) -> list[multiprocessing.Process]:
+    workers = [multiprocessing.Process(target=worker_main, args=(address, authkey, max_runs)) for _ in range(n)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+# the optimizers' side of the server, evaluate sends it every design the cache has not seen
+# at most "window" designs are out at once and a full server queue blocks the client, so a slow farm slows the optimizer instead of piling up work
+# a design a worker never answers within twice the timeout after starting it is sent again, so losing a worker or a machine loses no designs
+# a design no worker starts within queue_wait plus twice the timeout of being queued is sent again too
+class EvaluationClient:
+    def __init__(self, address : tuple[str, int], authkey : bytes | None = None, timeout : float = EVAL_TIMEOUT, retries : int = EVAL_RETRIES,
+                 window : int = CLIENT_WINDOW, queue_wait : float = QUEUE_WAIT) -> None:
+        self.manager = connect(address, authkey)
+        self.client_id = uuid.uuid4().hex
+        self.tasks = self.manager.get_task_queue()
+        self.results = self.manager.get_result_queue(self.client_id)
+        self.timeout = timeout
+        self.retries = retries
+        self.window = window
+        self.queue_wait = queue_wait
+        self.next_task = 0
+        self.resent = 0
+        self.failures = 0
+
+    # records of "designs" in order, None where NgSpice failed or every attempt timed out or crashed
+    def map(self, designs : list[dict], options : dict) -> list[CachedEvaluation | None]:
+        records = [None]*len(designs)
+        unsent = [(i, 0) for i in range(len(designs))][::-1]
+        pending = dict() # task_id -> [index, attempt, deadline], the deadline moves up once a worker starts it
+        while unsent or pending:
+            while unsent and len(pending) < self.window:
+                index, attempt = unsent[-1]
+                try:
+                    self.tasks.put((self.client_id, self.next_task, designs[index], options, self.timeout), timeout=POLL_INTERVAL)
+                except queue.Full: # back-pressure, collects results meanwhile
+                    break
+                unsent.pop()
+                pending[self.next_task] = [index, attempt, time.monotonic() + self.queue_wait + 2*self.timeout]
+                self.next_task += 1
+            try:
+                task_id, status, payload = self.results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                task_id, status = None, None
+            if task_id in pending:
+                index, attempt, deadline = pending[task_id]
+                if status == 'started':
+                    pending[task_id][2] = time.monotonic() + 2*self.timeout
+                elif status == 'ok':
+                    records[index] = CachedEvaluation(*payload)
+                    del pending[task_id]
+                elif status == 'error' or attempt >= self.retries: # NgSpice fails the same way every time
+                    self.failures += 1
+                    del pending[task_id]
+                else: # timeout or crash
+                    self.resent += 1
+                    unsent.append((index, attempt + 1))
+                    del pending[task_id]
+            # designs whose worker went quiet, late answers to them are ignored
+            now = time.monotonic()
+            for task_id, (index, attempt, deadline) in list(pending.items()):
+                if now > deadline:
+                    del pending[task_id]
+                    if attempt < self.retries:
+                        self.resent += 1
+                        unsent.append((index, attempt + 1))
+                    else:
+                        self.failures += 1
+        return records
+
+    # one design, raising like CircuitAnalyzer when it can not be evaluated
+    def evaluate(self, s : dict, options : dict) -> CachedEvaluation:
+        record = self.map([s], options)[0]
+        if record is None:
+            raise RuntimeError(f"Evaluation server could not evaluate {s}")
+        return record
+
+    def close(self) -> None:
+        self.manager.drop_result_queue(self.client_id)
+
+# sends this process's evaluations to the server named in the config, if any
+def connect_remote(config : RunConfig) -> EvaluationClient | None:
+    if config.evalServer is None:
+        return None
+    client = EvaluationClient(parse_address(config.evalServer), timeout=config.evalTimeout)
+    set_remote(client)
+    return client
+
+if __name__ == "__main__":
+    # EVAL_AUTHKEY=<secret> python eval_server.py serve --host 0.0.0.0 --port 50000 --workers 4
+    # then EVAL_AUTHKEY=<secret> python eval_server.py worker --address host:50000 --workers 8 on other machines
+    # runs connect with --evalServer host:50000 and the same EVAL_AUTHKEY
+    parser = argparse.ArgumentParser()
+    parser.add_argument('role', choices=['serve', 'worker'])
+    parser.add_argument('--host', default=LOOPBACK_HOST, help="interface the server listens on, 0.0.0.0 for every machine, which needs EVAL_AUTHKEY set")
+    parser.add_argument('--port', type=int, default=EVAL_PORT)
+    parser.add_argument('--address', default=f"{LOOPBACK_HOST}:{EVAL_PORT}", help="server a worker connects to")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--queue', type=int, default=QUEUE_SIZE)
+    parser.add_argument('--maxRuns', type=int, default=10000)
+    args = parser.parse_args()
+    if args.role == 'serve':
+        address = (args.host, args.port)
+        authkey = get_server_authkey(args.host)
+        server = multiprocessing.Process(target=serve, args=(address, authkey, args.queue))
+        server.start()
+        workers = start_workers((args.host if args.host != '0.0.0.0' else LOOPBACK_HOST, args.port), args.workers, authkey, max_runs=args.maxRuns)
+        server.join()
+    else:
+        workers = start_workers(parse_address(args.address), args.workers, max_runs=args.maxRuns)
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,73 @@
+from subcircuit_def import get_fused_circuit, get_fused_saves, corner_suffix
+from netlist_template import get_fused_template
+from ngspice_batch import BatchSimulator
+from simulation_session import ac_command, get_session
+from small_signal import get_op_saves
+
+# value under "name" regardless of case, ngspice lowercases vector names where PySpice keeps the ones it was given
+def find(vectors : dict, name : str):
+    for key, value in vectors.items():
+        if key.lower() == name.lower():
+            return value
+    raise KeyError(name)
+
+# one corner's share of a fused analysis, read like the analysis of that corner's own netlist
+class CornerAnalysis:
+    def __init__(self, analysis, suffix : str) -> None:
+        self.frequency = getattr(analysis, 'frequency', None)
+        self.branches = {'vvdc' : find(analysis.branches, f"vvdc_{suffix}")} if analysis.branches else dict()
+        nodes = getattr(analysis, 'nodes', dict())
+        self.AC_out = find(nodes, f"AC_out_{suffix}") if nodes else None
+        # sensitivities to this corner's devices, named as in the single amplifier netlist
+        elements = getattr(analysis, 'elements', dict())
+        self.elements = {name.lower().replace(f".xfbamp_{suffix}.", ".xfbamp1.") : value for name, value in elements.items()
+                         if '.xfbamp_' not in name.lower() or f".xfbamp_{suffix}." in name.lower()}
+        # operating point vectors of this corner's transistors, a raw file keeps them with the nodes
+        internal = {**getattr(analysis, 'internal_parameters', dict()), **{name : value for name, value in nodes.items() if name.startswith('@')}}
+        self.internal_parameters = {name.lower().replace(f".xfbamp_{suffix}.", ".xfbamp1.") : value for name, value in internal.items()
+                                    if f".xfbamp_{suffix}." in name.lower()}
+
+# runs each analysis of a fused netlist once, every corner after the first that asks for it gets the same result
+class FusedSimulator:
+    def __init__(self, simulator) -> None:
+        self.simulator = simulator
+        self.analyses = dict()
+
+    def run(self, command : str, make):
+        if command not in self.analyses:
+            self.analyses[command] = make()
+        return self.analyses[command]
+
+# the simulator calls CircuitAnalyzer makes for one corner, answered from the fused netlist
+class CornerSimulator:
+    def __init__(self, fused : FusedSimulator, suffix : str) -> None:
+        self.fused = fused
+        self.suffix = suffix
+
+    def operating_point(self) -> CornerAnalysis:
+        return CornerAnalysis(self.fused.run('op', self.fused.simulator.operating_point), self.suffix)
+
+    def ac(self, *args, **kwargs) -> CornerAnalysis:
+        return CornerAnalysis(self.fused.run(ac_command(*args, **kwargs), lambda: self.fused.simulator.ac(*args, **kwargs)), self.suffix)
+
+    # the outputs CircuitAnalyzer asks about are this corner's own
+    def sensitivity(self, output : str, *args, **kwargs) -> CornerAnalysis:
+        output = {'i(vvdc)' : f"i(vvdc_{self.suffix})", 'v(ac_out)' : f"v(ac_out_{self.suffix})"}.get(output.lower(), output)
+        return CornerAnalysis(self.fused.simulator.sensitivity(output, *args, **kwargs), self.suffix)
+
+# a simulator per transistor corner of the design, all answered by one netlist at "temperature" holding every corner
+# corners at other temperatures are a call each, their simulators merge into one dict for CircuitAnalyzer(simulators=...)
+# "fast_AC" also saves every corner's transistor vectors for the small signal solver
+def get_fused_simulators(curr_dict : dict, temperature = 25, template : bool = False, batch : bool = False, fast_AC : bool = False) -> dict[str, CornerSimulator]:
+    corners = curr_dict['trans']
+    saves = [name for key, trans in corners.items() for name in get_op_saves(curr_dict, trans, f"xfbamp_{corner_suffix(key)}")] if fast_AC else []
+    if batch:
+        simulator = BatchSimulator(get_fused_circuit(curr_dict, corners), temperature=temperature, saves=get_fused_saves(corners) + saves)
+    elif template:
+        simulator = get_fused_template(curr_dict, corners, temperature, saves=tuple(saves)).bind(curr_dict)
+    else:
+        simulator = get_session().simulator(get_fused_circuit(curr_dict, corners), temperature=temperature)
+        simulator.save(get_fused_saves(corners) + saves)
+        simulator.compile()
+    fused = FusedSimulator(simulator)
+    return {key : CornerSimulator(fused, corner_suffix(key)) for key in corners}
@@ -4,6 +4,8 @@ import math
 
 from PySpice.Probe.Plot import plot
 
+from ac_metrics import get_AC_arrays
+
 # making bode plots
 def bode_diagram(axes, frequency, gain, phase, **kwargs):
     bode_diagram_gain(axes[0], frequency, gain, **kwargs)
@@ -30,10 +32,11 @@ def bode_diagram_phase(axe, frequency, phase, **kwargs):
 def make_bode_plot(analysis):
     figure, (ax1, ax2) = plt.subplots(2, figsize=(20, 10))
     plt.title("Bode Diagram of an Operational Amplifier")
+    frequency, AC_out = get_AC_arrays(analysis)
     bode_diagram(axes=(ax1, ax2),
-                frequency=analysis.frequency,
-                gain=20*np.log10(np.absolute([x.value for x in np.absolute(analysis.AC_out)])),
-                phase=np.angle([x.value for x in np.absolute(analysis.AC_out)], deg=False),
+                frequency=frequency,
+                gain=20*np.log10(np.absolute(AC_out)),
+                phase=np.angle(AC_out, deg=False),
                 marker='.',
                 color='blue',
                 linestyle='-',
@@ -45,14 +48,18 @@ def make_bode_plot(analysis):
 colors = ["red","green","blue"]
 label = ["Start", "SA", "GRW"]
 
+# None stands for a design without an AC analysis, it is left out and the rest keep their colours
 def make_bode_plot_from_list(analysis_list):
     figure, (ax1, ax2) = plt.subplots(2, figsize=(20, 10))
     plt.title("Bode Diagram of an Operational Amplifier")
     for i, analysis in enumerate(analysis_list):
+        if analysis is None:
+            continue
+        frequency, AC_out = get_AC_arrays(analysis)
         bode_diagram(axes=(ax1, ax2),
-                    frequency=analysis.frequency,
-                    gain=20*np.log10([x.value for x in np.absolute(analysis.AC_out)]),
-                    phase=np.angle([x.value for x in analysis.AC_out], deg=False),
+                    frequency=frequency,
+                    gain=20*np.log10(np.absolute(AC_out)),
+                    phase=np.angle(AC_out, deg=False),
                     marker='.',
                     color=colors[i],
                     label=label[i],
@@ -65,4 +72,14 @@ def make_bode_plot_from_list(analysis_list):
 
 def make_2d_plot(x, y):
     plt.plot(x,y, 'o')
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+# bandwidth against current of every design on the front, coloured by how far its gain is outside the window
+def make_pareto_plot(BW, gain_error, OP_current):
+    plt.scatter(OP_current, BW, c=gain_error, cmap='viridis')
+    plt.colorbar(label="Gain Error [log]")
+    plt.yscale('log')
+    plt.xlabel("Current [A]")
+    plt.ylabel("Bandwidth [Hz]")
+    plt.title("Pareto Front")
+    plt.show()
@@ -1,6 +1,9 @@
+import argparse
 import atexit
+import json
+import os
 
-# prevents windows from sleeping while program is running 
+# prevents windows from sleeping while program is running
 class WindowsInhibitor:
     ES_CONTINUOUS = 0x80000000
     ES_SYSTEM_REQUIRED = 0x00000001
@@ -20,61 +23,164 @@ class WindowsInhibitor:
         print("Allowing Windows to go to sleep")
         ctypes.windll.kernel32.SetThreadExecutionState(
             WindowsInhibitor.ES_CONTINUOUS)
-        
-# sleep inhibitor 
+
+# sleep inhibitor
 osSleep = WindowsInhibitor()
-osSleep.inhibit()
 
 # un inhibits no sleep when program finishes
 def exit_handler():
     osSleep.uninhibit()
 
-atexit.register(exit_handler)
+# keeps windows awake for the rest of the run, other systems are left alone
+def prevent_sleep() -> None:
+    if os.name == 'nt':
+        osSleep.inhibit()
+        atexit.register(exit_handler)
+
+# settings of one optimization run, type and default of each
+CONFIG_FIELDS = {
+    'isVerbose' : (bool, True),
+    'isRand' : (bool, False),
+    'kAnnealing' : (int, 2000),
+    'nWalk' : (int, 3),
+    'T' : (float, 30),
+    'kGreedy' : (int, 6000),
+    'sigma' : (float, 0.3),
+    'dBeta' : (bool, True),
+    'fusedCorners' : (bool, False), # every transistor tolerance in one netlist, one DC and one AC solve per design instead of one per tolerance
+    'nWorkers' : (int, None), # None uses one process per walk, up to the number of cores
+    'useTemplate' : (bool, True), # one netlist per process altered for each design instead of a netlist generated per design, same results
+    'ngspiceBatch' : (bool, False), # simulate in ngspice -b processes, a crash only fails its design and batches of designs run concurrently
+    'adaptiveAC' : (bool, False),
+    'fastAC' : (bool, False), # AC sweeps solved in numpy from the ngspice operating point instead of simulated
+    'fastACCheck' : (int, 50), # every nth fast AC sweep is also simulated to check it against ngspice, 0 never checks
+    'biasPrefilter' : (bool, False), # rejects designs whose estimated bias current is far over the limit without simulating, opt-in until the estimate is validated
+    'tempering' : (bool, False),
+    'speculation' : (int, 1), # proposals of one walk evaluated together across nWorkers processes, 1 evaluates one at a time
+    'pareto' : (bool, False), # anneal towards the whole bandwidth, gain error and current front instead of one goodness
+    'sensitivityMoves' : (bool, False), # annealing steps drift up the goodness gradient from NgSpice's sensitivity analysis
+    'patternSearch' : (bool, False), # refines the best annealing design with a pattern search instead of the greedy walk
+    'surrogate' : (bool, False), # skip simulating proposals a surrogate model expects to be rejected
+    'surrogateKappa' : (float, 2.0), # standard deviations of optimism, higher skips fewer
+    'surrogateMinPoints' : (int, 100), # evaluations a walk makes before it starts skipping
+    'evalServer' : (str, None), # host:port of an eval_server.py the designs are simulated on, None simulates here
+    'evalTimeout' : (float, 60), # seconds before the server gives up on a hung simulation
+    'resume' : (bool, False), # continue an unfinished run from its checkpoints
+    'showPlots' : (bool, True),
+    'yieldSamples' : (int, 0), # monte carlo samples of the final design's tolerances, 0 skips the yield analysis
+    'instrument' : (bool, False), # stage timers and counters, written to a stats file at the end
+}
+
+# named starting points, "default" is CONFIG_FIELDS' defaults
+CONFIG_PRESETS = {
+    'default' : {},
+    'test' : {'isRand' : True, 'kAnnealing' : 1000, 'nWalk' : 1, 'kGreedy' : 250, 'dBeta' : False, 'nWorkers' : 1},
+}
+
+# run settings, built without any prompts from keywords, a JSON file or command line flags
+class RunConfig:
+    def __init__(self, **settings) -> None:
+        unknown = settings.keys() - CONFIG_FIELDS.keys()
+        if unknown:
+            raise ValueError(f"Unknown settings: {sorted(unknown)}")
+        # the given settings, kept so derived defaults follow later changes
+        self.settings = settings
+        for name, (kind, default) in CONFIG_FIELDS.items():
+            value = settings.get(name, default)
+            setattr(self, name, kind(value) if value is not None else None)
+        if self.nWorkers is None:
+            self.nWorkers = min(self.nWalk, os.cpu_count() or 1)
+
+    # copy with some settings changed
+    def replace(self, **changes) -> 'RunConfig':
+        return RunConfig(**{**self.settings, **changes})
+
+    def to_dict(self) -> dict:
+        return {name : getattr(self, name) for name in CONFIG_FIELDS}
+
+    @classmethod
+    def preset(cls, name : str, **settings) -> 'RunConfig':
+        return cls(**{**CONFIG_PRESETS[name], **settings})
 
-# gets user input and stores in object for easy global access
-class singleton:
-    def __init__(self) -> None:
+    @classmethod
+    def from_file(cls, path : str, **settings) -> 'RunConfig':
+        with open(path) as file:
+            return cls(**{**json.load(file), **settings})
+
+    # --preset and --config set the base, flags named after the settings override it
+    @classmethod
+    def from_args(cls, argv : list[str] | None = None) -> 'RunConfig':
+        return cls.from_namespace(get_config_parser().parse_args(argv))
+
+    # settings from flags parsed by a get_config_parser parser, which may have flags of its own
+    @classmethod
+    def from_namespace(cls, args : argparse.Namespace) -> 'RunConfig':
+        settings = dict(CONFIG_PRESETS[args.preset])
+        if args.config is not None:
+            with open(args.config) as file:
+                settings.update(json.load(file))
+        settings.update({name : value for name, value in vars(args).items() if name in CONFIG_FIELDS and value is not None})
+        return cls(**settings)
+
+    # gets user input, the original way of starting a run
+    # only the original questions are asked, the other settings keep their defaults and are set with flags or a JSON file
+    @classmethod
+    def interactive(cls) -> 'RunConfig':
         print()
-        des = input("Default Behavior? ~5min (y/n): ").lower() 
+        des = input("Default Behavior? ~5min (y/n): ").lower()
         if (des == 'y'):
-            self.isVerbose = True
-            self.isRand = False
-            self.kAnnealing = 2000
-            self.nWalk = 3
-            self.T = 30
-            self.kGreedy = 6000
-            self.sigma = 0.3
-            self.dBeta = True
-            print()
-        elif (des == 'test'):
-            self.isVerbose = True
-            self.isRand = True
-            self.kAnnealing = 1000
-            self.nWalk = 1
-            self.T = 30
-            self.kGreedy = 250
-            self.sigma = 0.3
-            self.dBeta = False
-            print()
-        else:
             print()
-            self.isVerbose = ("y" == input("Verbose? (y/n): ").lower())
+            return cls.preset('default')
+        elif (des in CONFIG_PRESETS): # any other preset by name, e.g. "test"
             print()
-            self.isRand = ("y" == input("Random Starting Point? (y/n): ").lower())
-            if self.isRand:
-                print()
-                print("!!!! Recommend higher SD, assume nominal transistors, and num steps !!!!")
-            print()
-            self.dBeta = ("y" == input("(y) Check transistor tolerances or (n) assume nominal (y/n): ").lower())
-            print()
-            self.sigma = float(input("Neighbor Standard Deviation (recommend <1): "))
-            print()
-            print("Simulated Annealing")
-            self.kAnnealing = int(input("Num steps per walk: "))
-            self.nWalk = int(input("Num walks: "))
-            self.T = float(input("Starting Temperature (recommend <30): "))
+            return cls.preset(des)
+        settings = dict()
+        print()
+        settings['isVerbose'] = ("y" == input("Verbose? (y/n): ").lower())
+        print()
+        settings['isRand'] = ("y" == input("Random Starting Point? (y/n): ").lower())
+        if settings['isRand']:
             print()
-            print("Greedy Random Walk")
-            self.kGreedy = int(input("Num steps: "))
+            print("!!!! Recommend higher SD, assume nominal transistors, and num steps !!!!")
+        print()
+        settings['dBeta'] = ("y" == input("(y) Check transistor tolerances or (n) assume nominal (y/n): ").lower())
+        print()
+        settings['sigma'] = float(input("Neighbor Standard Deviation (recommend <1): "))
+        print()
+        print("Simulated Annealing")
+        settings['kAnnealing'] = int(input("Num steps per walk: "))
+        settings['nWalk'] = int(input("Num walks: "))
+        settings['T'] = float(input("Starting Temperature (recommend <30): "))
+        print()
+        print("Greedy Random Walk")
+        settings['kGreedy'] = int(input("Num steps: "))
+        return cls(**settings)
+
+    # CircuitAnalyzer keyword arguments for the chosen analysis settings
+    def analysis_options(self) -> dict:
+        return {'template' : self.useTemplate, 'adaptive' : self.adaptiveAC, 'prefilter' : self.biasPrefilter, 'batch' : self.ngspiceBatch,
+                'fused' : self.fusedCorners, 'fast_AC' : self.fastAC, 'AC_check' : self.fastACCheck if self.fastAC else 0}
+
+# command line flags for every setting, also used by the sweep runner
+def get_config_parser(parser : argparse.ArgumentParser | None = None) -> argparse.ArgumentParser:
+    parser = parser if parser is not None else argparse.ArgumentParser()
+    parser.add_argument('--preset', choices=sorted(CONFIG_PRESETS), default='default')
+    parser.add_argument('--config', help="JSON file of settings")
+    for name, (kind, default) in CONFIG_FIELDS.items():
+        if kind == bool:
+            parser.add_argument(f"--{name}", action=argparse.BooleanOptionalAction, default=None)
+        else:
+            parser.add_argument(f"--{name}", type=kind, default=None)
+    return parser
+
+# configuration of this process, only prompts if nothing set one before it is first needed
+config = None
+def get_config() -> RunConfig:
+    global config
+    if config is None:
+        config = RunConfig.interactive()
+    return config
 
-single = singleton()
\ No newline at end of file
+def set_config(new_config : RunConfig | None) -> None:
+    global config
+    config = new_config
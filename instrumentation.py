@@ -0,0 +1,114 @@
+import json
+import numpy as np
+
+##########################################
+
+import circuit_analysis
+
+# log spaced duration bins from 1us to 100s, percentiles merge across processes through the counts
+TIMER_BINS = np.logspace(-6, 2, 161)
+PERCENTILES = [50, 90, 99]
+
+# counters and stage timers of the evaluations made in this process
+class Instrumentation:
+    def __init__(self) -> None:
+        self.counters = dict()
+        self.timers = dict()
+
+    def count(self, name : str, n : int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # an evaluation that returned, from the cache or from NgSpice
+    def evaluation(self, record, cache_hit : bool) -> None:
+        self.count('evaluations')
+        self.count('cache_hits' if cache_hit else 'simulations')
+        if record.goodness == -1: # OP_current_goodness <= 0.5
+            self.count('rejected_current')
+
+    # an evaluation that raised, run_walk's except branch
+    def failure(self) -> None:
+        self.count('evaluations')
+        self.count('ngspice_failures')
+
+    # one proposal of an annealing chain
+    def step(self, accepted : bool) -> None:
+        self.count('proposals')
+        if accepted:
+            self.count('accepted')
+
+    # records one duration, also used as circuit_analysis.stage_hook
+    def time(self, stage : str, seconds : float) -> None:
+        if stage not in self.timers:
+            self.timers[stage] = {'count' : 0, 'total' : 0.0, 'max' : 0.0, 'bins' : np.zeros(len(TIMER_BINS) + 1, dtype=np.int64)}
+        timer = self.timers[stage]
+        timer['count'] += 1
+        timer['total'] += seconds
+        timer['max'] = max(timer['max'], seconds)
+        timer['bins'][np.searchsorted(TIMER_BINS, seconds)] += 1
+
+    # adds the stats of another process, as returned by drain
+    def merge(self, stats : dict) -> None:
+        for name, n in stats['counters'].items():
+            self.count(name, n)
+        for stage, other in stats['timers'].items():
+            if stage not in self.timers:
+                self.timers[stage] = {'count' : 0, 'total' : 0.0, 'max' : 0.0, 'bins' : np.zeros(len(TIMER_BINS) + 1, dtype=np.int64)}
+            timer = self.timers[stage]
+            timer['count'] += other['count']
+            timer['total'] += other['total']
+            timer['max'] = max(timer['max'], other['max'])
+            timer['bins'] += np.asarray(other['bins'])
+
+    # hands the stats recorded so far to the caller and starts over, used by worker processes
+    def drain(self) -> dict:
+        stats = {'counters' : self.counters, 'timers' : self.timers}
+        self.counters = dict()
+        self.timers = dict()
+        return stats
+
+    # upper edge of the bin holding the p-th percentile
+    def percentile(self, stage : str, p : float) -> float:
+        timer = self.timers[stage]
+        index = int(np.searchsorted(np.cumsum(timer['bins']), p/100*timer['count']))
+        return float(TIMER_BINS[min(index, len(TIMER_BINS) - 1)])
+
+    def summary(self) -> dict:
+        rates = dict()
+        if self.counters.get('proposals'):
+            rates['acceptance_rate'] = self.counters.get('accepted', 0)/self.counters['proposals']
+        if self.counters.get('evaluations'):
+            rates['cache_hit_rate'] = self.counters.get('cache_hits', 0)/self.counters['evaluations']
+            rates['rejected_current_rate'] = self.counters.get('rejected_current', 0)/self.counters['evaluations']
+            rates['ngspice_failure_rate'] = self.counters.get('ngspice_failures', 0)/self.counters['evaluations']
+        stages = {stage : {'count' : timer['count'], 'total_s' : timer['total'], 'mean_ms' : 1000*timer['total']/timer['count'], 'max_ms' : 1000*timer['max'],
+                           **{f"p{p}_ms" : 1000*self.percentile(stage, p) for p in PERCENTILES}} for stage, timer in self.timers.items()}
+        return {'counters' : dict(self.counters), 'rates' : rates, 'stages' : stages}
+
+    def report(self) -> str:
+        summary = self.summary()
+        lines = [f"{'Stage':>10} {'Count':>8} {'Total':>9} {'Mean':>9} " + " ".join(f"{f'p{p}':>9}" for p in PERCENTILES) + f" {'Max':>9}"]
+        for stage, stats in summary['stages'].items():
+            lines.append(f"{stage:>10} {stats['count']:>8} {stats['total_s']:>8.1f}s {stats['mean_ms']:>7.2f}ms " +
+                         " ".join(f"{stats[f'p{p}_ms']:>7.2f}ms" for p in PERCENTILES) + f" {stats['max_ms']:>7.2f}ms")
+        lines.append(", ".join(f"{name}: {n}" for name, n in summary['counters'].items()))
+        lines.append(", ".join(f"{name}: {rate:.1%}" for name, rate in summary['rates'].items()))
+        return "\n".join(lines)
+
+    def save(self, path : str) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+# instruments of this process, None while instrumentation is off so the hot paths only test for None
+instruments = None
+
+def enable() -> Instrumentation:
+    global instruments
+    if instruments is None:
+        instruments = Instrumentation()
+    circuit_analysis.stage_hook = instruments.time
+    return instruments
+
+def disable() -> None:
+    global instruments
+    instruments = None
+    circuit_analysis.stage_hook = None
@@ -8,19 +8,31 @@ from PySpice.Unit import *
 #####################################
 # other libraries
 
-from tqdm import tqdm
 import csv
 import atexit
+import sys
 import time
 
 #####################################
 # project files
 
-from subcircuit_def import SubCircuitDictionaries
 from circuit_analysis import *
 from graphing import *
-from simulated_annealing import run_walk, neighbour, free_vars
-from helper_funcs import single
+from simulated_annealing import get_encoding
+from checkpoint import RunCheckpoint
+from trace_log import TraceLog
+from eval_cache import EvaluationCache
+from optimizer import get_start_design, get_run_settings, run_annealing, run_greedy, run_pattern_search, run_pareto
+from pareto import write_front
+from simulation_session import SimulationSession, set_session
+from eval_server import connect_remote
+from helper_funcs import RunConfig, set_config, prevent_sleep
+import instrumentation
+import surrogate
+import speculative
+import small_signal
+from yield_analysis import run_yield_analysis, report as yield_report
+from start_generator import get_random_starts, report as start_report
 
 #####################################
 # data recording     
@@ -37,56 +49,90 @@ def capture_data():
             
 atexit.register(capture_data)
 
+# evaluations are reused within a run and across runs through the on-disk store
+CACHE_SIZE = 100000
+CACHE_PATH = 'eval_cache'
+# analyses each ngspice instance runs before its memory is released
+SESSION_RUNS = 10000
+# walks checkpoint here so a killed run can be resumed
+CHECKPOINT_DIR = 'checkpoints'
+# every evaluation of every walk is streamed here
+TRACE_DIR = 'trace'
+# timers and counters of an instrumented run
+STATS_PATH = 'stats.json'
+# every monte carlo sample of the final design
+YIELD_PATH = 'yield.csv'
+# non-dominated designs of a multi-objective run
+PARETO_PATH = 'pareto.csv'
+
 if __name__ == "__main__":
 
-    trans = {} # holds the transistor tolerances to be tested
-    if single.dBeta: # tests high and low beta 
-        trans = {"LO" :"ZTX107-LO", "HI" : "ZTX107-HI"} 
-    else: # nominal case
-        trans = {"NOM" : "ZTX107-NOM"} 
+    # command line flags or a --config file run without prompts, no arguments asks as before
+    single = RunConfig.from_args() if len(sys.argv) > 1 else RunConfig.interactive()
+    set_config(single)
+    prevent_sleep()
+    if single.instrument:
+        instrumentation.enable()
+
+    cache = EvaluationCache(maxsize=CACHE_SIZE, path=CACHE_PATH)
+    atexit.register(cache.close)
+    set_session(SimulationSession(max_runs=SESSION_RUNS))
+    # designs are simulated on the evaluation server when one is given
+    remote = connect_remote(single)
+    if remote is not None:
+        atexit.register(remote.close)
 
     # stores the starting configuration of the circuit
-    sub_dicts = SubCircuitDictionaries()
-    fb_dict = sub_dicts.get_feedbackamp_dict(trans)
-
-    # randomizes the starting configuration within bounds
-    # very bad starts tend to get stuck 
-    # practically designing a semi functional circuit is trivial 
-    # given more time I would add design equations to calculate a default state
-    if single.isRand: 
-        temp = neighbour(fb_dict, free_vars, 10)
-        gain_start = CircuitAnalyzer(temp).DC_gain
-        while(gain_start > 944 or gain_start < 400): # bounds
-            temp = neighbour(fb_dict, free_vars, 10)
-            gain_start = CircuitAnalyzer(temp).DC_gain
-        fb_dict = temp
+    fb_dict = get_start_design(single)
+
+    # a resumed run has to continue with the settings it was started with
+    checkpoints = RunCheckpoint(CHECKPOINT_DIR)
+    run_settings = get_run_settings(single)
+    encoding = get_encoding(fb_dict)
+    trace = TraceLog(TRACE_DIR)
+    resume = False
+    if checkpoints.can_resume():
+        resume = single.resume if len(sys.argv) > 1 else "y" == input("Resume the unfinished run from its checkpoints? (y/n): ").lower()
+
+    starts = None # every walk's own start when they are random
+    if resume: # the start designs are part of the checkpoint
+        x_0 = checkpoints.resume(run_settings)
+        if x_0.ndim == 3:
+            starts = [encoding.decode(x) for x in x_0]
+            fb_dict = starts[0]
+        else:
+            fb_dict = encoding.decode(x_0)
+    else:
+        if single.isRand: 
+            starts = get_random_starts(fb_dict, single.nWalk, single, cache, cache_size=CACHE_SIZE, max_runs=SESSION_RUNS)
+            fb_dict = starts[0]
+        checkpoints.begin(run_settings, np.stack([encoding.encode(s) for s in starts]) if starts is not None else encoding.encode(fb_dict))
+        trace.begin()
 
     # grabs parameters from user's input
     v = single.isVerbose
     kMax = single.kAnnealing
     numWalk = single.nWalk
-    Tinit = single.T
 
     # begins timing 
     startSA = time.time()
-    if v: # run conditions for verbose mode
-        if single.isRand and single.isVerbose:
-            make_bode_plot(CircuitAnalyzer(fb_dict).get_AC_analysis())
-        print("Running Simulated Annealing in Verbose Mode...")
-        for i in range(numWalk):
-            print(f"Walk #{i+1}...")
-            # run_walk computes one round of simulated annealing
-            sbest, ebest = run_walk(T=Tinit, kMax=kMax, s_0=fb_dict)
-            sbest_list.append(sbest)
-            ebest_list.append(ebest)
-    else: # non verbose
-        print("Running Simulated Annealing...")
-        with tqdm(total=kMax*numWalk) as pbar:
-            for i in range(numWalk):
-                # run_walk computes one round of simulated annealing
-                sbest, ebest = run_walk(T=Tinit, kMax=kMax, s_0=fb_dict, pbar=pbar)
-                sbest_list.append(sbest)
-                ebest_list.append(ebest)
+    if v and single.isRand and single.showPlots:
+        start_analysis = CircuitAnalyzer(fb_dict).get_AC_analysis()
+        if start_analysis is not None: # rejected on current, there is no sweep to plot
+            make_bode_plot(start_analysis)
+    front = None
+    if single.pareto: # one run finds the whole front, its best goodness goes on like the annealing best
+        front = run_pareto(fb_dict, single, cache, checkpoints=checkpoints, trace=trace, cache_size=CACHE_SIZE, max_runs=SESSION_RUNS, starts=starts)
+        write_front(front, fb_dict, PARETO_PATH)
+        best = front.best() if len(front) else None
+        sbest_par = [encoding.decode(front.X[best]) if best is not None else fb_dict]
+        ebest_par = [-front.goodness[best] if best is not None else 0]
+        tempering = None
+    else:
+        sbest_par, ebest_par, tempering = run_annealing(fb_dict, single, cache, checkpoints=checkpoints, trace=trace, cache_size=CACHE_SIZE, max_runs=SESSION_RUNS,
+                                                        starts=starts)
+    sbest_list.extend(sbest_par)
+    ebest_list.extend(ebest_par)
     # ends timer 
     endSA = time.time()
 
@@ -95,42 +141,79 @@ if __name__ == "__main__":
         print()
 
     # this run_walk is a greedy walk, i.e. SA with T = 0 
-    sbest = None
-    ebest = None
-    if v: # run conditions for verbose mode
-        print("Running Greedy Walk in Verbose Mode...")
-        sbest, ebest = run_walk(T=0, kMax=single.kGreedy, s_0=fb_dict)
-    else: # non verbose
-        print("Running Greedy Walk...")
-        with tqdm(total=kMax*numWalk) as pbar:
-            sbest, ebest = run_walk(T=0, kMax=single.kGreedy, s_0=fb_dict, pbar=pbar)
+    if single.patternSearch: # refines the SA best instead
+        sbest, ebest = run_pattern_search(sbest_list[np.argmin(ebest_list)], single, cache, checkpoints=checkpoints, trace=trace)
+    else:
+        sbest, ebest = run_greedy(fb_dict, single, cache, checkpoints=checkpoints, trace=trace)
     endGRW = time.time()
+    checkpoints.finish()
+    # the comparison below is not part of the optimization
+    instruments = instrumentation.instruments
+    instrumentation.disable()
 
-    # reanalyses the start, SA best, and GRW best for comparison
-    sGRW_analyser = CircuitAnalyzer(sbest)
-    sSA_analyser = CircuitAnalyzer(sbest_list[np.argmin(ebest_list)])
-    sstart_analyser = CircuitAnalyzer(fb_dict)
+    # reanalyses the start, SA best, and GRW best for comparison, their sweeps are simulated again only if they are plotted
+    sGRW_analyser = CircuitAnalyzer(sbest).result()
+    sSA_analyser = CircuitAnalyzer(sbest_list[np.argmin(ebest_list)]).result()
+    sstart_analyser = CircuitAnalyzer(fb_dict).result()
 
     # large printout
     print()
     print(f"        Neigbour SD: {single.sigma:.2}")
-    print(f"           SA Steps: {kMax}, SA Walks: {numWalk}, Temp: {single.T}")
-    print(f"          GRW Steps: {single.kGreedy}")
+    print(f"           SA Steps: {kMax}, SA Walks: {numWalk}, Temp: {single.T}, Processes: {min(single.nWorkers, numWalk)}")
+    if tempering is not None:
+        print(tempering.report())
+    if front is not None:
+        print(f"       Pareto Front: {len(front)} designs written to {PARETO_PATH}")
+    print(f"          GRW Steps: {single.kGreedy}" + (" (pattern search)" if single.patternSearch else ""))
     print(f"    Check Trans Tol: {single.dBeta}")
+    print(f"   Evaluation Cache: {cache.hits} hits ({cache.disk_hits} from disk), {cache.misses} misses, {cache.hit_rate():.0%} hit rate")
+    if single.isRand and not resume:
+        print(f"     Random Starts: {start_report()}")
+    if single.surrogate:
+        print(f"Surrogate Screening: {surrogate.report()}")
+    if single.speculation > 1:
+        print(f" Speculative Rounds: {speculative.report()}")
+    if single.fastAC:
+        print(f"    Small Signal AC: {small_signal.report()}")
+    if remote is not None:
+        print(f"  Evaluation Server: {single.evalServer}, {remote.resent} resent, {remote.failures} failed (this process)")
+    if instruments is not None:
+        print()
+        print(instruments.report())
+        instruments.save(STATS_PATH)
+        print(f"Stats written to {STATS_PATH}")
     print()
     print(f"               Goal: BW:>{7.2*10**6:.2E}, Gain:~{1000:.2E}, Current:<{0.012:.2E}")
     print(f"              Start: BW: {sstart_analyser.BW:.2E}, Gain: {sstart_analyser.DC_gain:.2E}, Current: {sstart_analyser.OP_current:.2E}")
     print(f"Simulated Annealing: BW: {sSA_analyser.BW:.2E}, Gain: {sSA_analyser.DC_gain:.2E}, Current: {sSA_analyser.OP_current:.2E}, Time: {round(endSA - startSA)}s")
-    print(f" Greedy Random Walk: BW: {sGRW_analyser.BW:.2E}, Gain: {sGRW_analyser.DC_gain:.2E}, Current: {sGRW_analyser.OP_current:.2E}, Time: {round(endGRW - endSA)}s")
+    print(f"{'Pattern Search' if single.patternSearch else 'Greedy Random Walk':>19}: BW: {sGRW_analyser.BW:.2E}, Gain: {sGRW_analyser.DC_gain:.2E}, Current: {sGRW_analyser.OP_current:.2E}, Time: {round(endGRW - endSA)}s")
 
-    # making pretty plots
-    make_bode_plot_from_list([sstart_analyser.get_AC_analysis(), sSA_analyser.get_AC_analysis(), sGRW_analyser.get_AC_analysis()]) 
+    # tolerance and beta spread of the best design found
+    if single.yieldSamples > 0:
+        print()
+        final = sbest if ebest <= min(ebest_list) else sbest_list[np.argmin(ebest_list)]
+        print(yield_report(run_yield_analysis(final, single.yieldSamples, path=YIELD_PATH, config=single, cache_size=CACHE_SIZE, max_runs=SESSION_RUNS)))
+        print(f"Samples written to {YIELD_PATH}")
 
-    plt.scatter([i for i in range(len(mega_goodness))],mega_goodness)
-    plt.xlabel("Iteration #")
-    plt.ylabel("Goodness")
-    plt.title("Goodness vs Cummulative Iteration #")
-    plt.show()
+    # making pretty plots
+    if single.showPlots:
+        analyses = [sstart_analyser.get_AC_analysis(), sSA_analyser.get_AC_analysis(), sGRW_analyser.get_AC_analysis()]
+        for name, analysis in zip(('Start', 'Simulated Annealing', 'Pattern Search' if single.patternSearch else 'Greedy Random Walk'), analyses):
+            if analysis is None:
+                print(f"{name} design was rejected on current, it has no AC analysis to plot")
+        make_bode_plot_from_list(analyses)
+        if front is not None and len(front):
+            F = front.objectives()
+            make_pareto_plot(-F[:, 0], F[:, 1], F[:, 2])
+
+        # valid goodness of every evaluation, read back from the memory mapped trace
+        goodness = trace.column('goodness')
+        goodness = goodness[goodness >= 0]
+        plt.scatter(np.arange(len(goodness)),goodness)
+        plt.xlabel("Iteration #")
+        plt.ylabel("Goodness")
+        plt.title("Goodness vs Cummulative Iteration #")
+        plt.show()
 
     # adds GRW to list so it can be saved when program exits
     sbest_list.append(sbest)
@@ -0,0 +1,190 @@
+import re
+import zlib
+import numpy as np
+
+##########################################
+
+from spice_models import get_model_params, spice_float
+
+# synthetic targets the stand-in circuit is built around
+MOCK_GAIN = 1000
+MOCK_CURRENT = 0.009
+MOCK_POLE = 7.2*10**6
+# relative resistor change of the finite differences answering sens
+MOCK_SENS_STEP = 1e-6
+
+# analysis returned by the stand-in, shaped like the PySpice analyses CircuitAnalyzer reads
+class MockAnalysis:
+    def __init__(self, branches : dict | None = None, frequency : np.ndarray | None = None, nodes : dict | None = None, elements : dict | None = None) -> None:
+        self.branches = branches if branches is not None else dict()
+        self.frequency = frequency
+        self.nodes = nodes if nodes is not None else dict()
+        self.AC_out = self.nodes.get('ac_out')
+        self.elements = elements if elements is not None else dict()
+
+class MockPlot:
+    def __init__(self, analysis : MockAnalysis) -> None:
+        self.analysis = analysis
+
+    def to_analysis(self) -> MockAnalysis:
+        return self.analysis
+
+# the raw library handle SimulationSession.release talks to
+class MockLibrary:
+    def ngSpice_Command(self, command) -> int:
+        return 0
+
+# flattened ngspice name and value of every resistor, and the transistor models of each top level instance, in a netlist
+# subcircuit definitions nest, a fused netlist defines the stages once inside every corner's amplifier
+def read_netlist(netlist : str) -> tuple[dict[str, float], dict[str, set[str]]]:
+    stack = [([], dict())] # element lines and the subcircuits defined at each level
+    names = []
+    for line in netlist.splitlines():
+        tokens = line.split()
+        if not tokens or tokens[0].startswith('*'):
+            continue
+        if tokens[0].lower() == '.subckt':
+            names.append(tokens[1].lower())
+            stack.append(([], dict()))
+        elif tokens[0].lower() == '.ends':
+            definition = stack.pop()
+            stack[-1][1][names.pop()] = definition
+        elif not tokens[0].startswith('.'):
+            stack[-1][0].append(tokens)
+    resistors = dict()
+    models = dict()
+    def flatten(elements : list, scopes : list[dict], prefix : str, instance : str | None) -> None:
+        for tokens in elements:
+            name = tokens[0].lower()
+            if name[0] == 'r':
+                resistors[f"r.{prefix}{name}" if prefix else name] = spice_float(re.sub('ohm$', '', tokens[3].lower()))
+            elif name[0] == 'q':
+                models.setdefault(instance, set()).add(tokens[4])
+            elif name[0] == 'x':
+                subcircuit = tokens[-1].lower()
+                definition = next(scope[subcircuit] for scope in reversed(scopes) if subcircuit in scope)
+                flatten(definition[0], scopes + [definition[1]], f"{prefix}{name}.", instance if instance is not None else name)
+    flatten(stack[0][0], [stack[0][1]], '', None)
+    return resistors, models
+
+# corner suffix of a top level amplifier instance, None for the single amplifier of an unfused netlist
+def get_suffix(instance : str) -> str | None:
+    return instance[len('xfbamp_'):] if instance.startswith('xfbamp_') else None
+
+# name of a resistor as it is in the single amplifier netlist, so every corner of a fused netlist sees the same landscape
+def get_canonical(name : str, instance : str) -> str:
+    suffix = get_suffix(instance)
+    if name.startswith(f"r.{instance}."):
+        return f"r.xfbamp1.{name[len(f'r.{instance}.'):]}"
+    return name[:-len(f"_{suffix}")] if suffix is not None else name
+
+# deterministic weight of a resistor in each synthetic response, the same in every process
+def get_weights(name : str) -> np.ndarray:
+    return np.random.default_rng(zlib.crc32(name.encode())).uniform(-1, 1, 3)
+
+# frequencies of an ac or sens ... ac command from its variation, points, start and stop tokens
+def get_frequencies(tokens : list[str]) -> np.ndarray:
+    variation, points, start, stop = tokens[0], int(tokens[1]), float(tokens[2]), float(tokens[3])
+    if variation == 'dec':
+        return start*10**(np.arange(int(np.floor(np.log10(stop/start)*points + 1e-9)) + 1)/points)
+    return np.linspace(start, stop, points)
+
+# stand-in for NgSpiceShared: parses the loaded netlist and answers op, ac and sens with synthetic vectors
+# gain, supply current and pole move smoothly with log resistor values and beta, so optimizers have a landscape to climb
+# every top level amplifier of a fused netlist answers on its own supply i(vvdc_<corner>) and output ac_out_<corner>
+class MockNgSpice:
+    def __init__(self) -> None:
+        self._ngspice_shared = MockLibrary()
+        self.resistors = dict()
+        self.weights = dict()
+        # amplifier each resistor belongs to and the beta of each amplifier
+        self.owners = dict()
+        self.models = dict()
+        self.BF = dict()
+        self.last_plot = 'const'
+        self.__analysis = None
+        self.commands = 0
+
+    def load_circuit(self, netlist : str) -> None:
+        self.resistors, self.models = read_netlist(netlist)
+        if not self.models:
+            self.models = {'xfbamp1' : set()}
+        self.owners = dict()
+        for name in self.resistors:
+            if name.startswith('r.'):
+                owner = name.split('.')[1]
+            else: # resistors around the amplifiers, RAC_lo and R_load_lo belong to corner lo
+                owner = next((instance for instance in self.models if get_suffix(instance) is not None and name.endswith(f"_{get_suffix(instance)}")),
+                             next(iter(self.models)))
+            self.owners[name] = owner
+            canonical = get_canonical(name, owner)
+            if canonical not in self.weights:
+                self.weights[canonical] = get_weights(canonical)
+        self.BF = {instance : min(get_model_params(model)['BF'] for model in models) if models else 100 for instance, models in self.models.items()}
+
+    def remove_circuit(self) -> None:
+        self.resistors = dict()
+
+    def destroy(self, plot_name='all') -> None:
+        self.__analysis = None
+
+    def alter_device(self, device : str, **parameters) -> None:
+        self.resistors[device.lower()] = float(parameters['resistance'])
+
+    def alter_model(self, model : str, **parameters) -> None:
+        if 'bf' in parameters:
+            for instance, models in self.models.items():
+                if model.lower() in {name.lower() for name in models}:
+                    self.BF[instance] = float(parameters['bf'])
+
+    # supply branch and output node of an amplifier
+    def __outputs(self, instance : str) -> tuple[str, str]:
+        suffix = get_suffix(instance)
+        return ('vvdc', 'ac_out') if suffix is None else (f"vvdc_{suffix}", f"ac_out_{suffix}")
+
+    def exec_command(self, command : str, join_lines=True) -> str:
+        self.commands += 1
+        tokens = command.split()
+        if tokens[0] == 'op':
+            self.__analysis = MockAnalysis(branches={self.__outputs(instance)[0] : np.array([-self.__response(instance)[1]]) for instance in self.models})
+            self.last_plot = 'op1'
+        elif tokens[0] == 'ac':
+            frequency = get_frequencies(tokens[1:])
+            self.__analysis = MockAnalysis(frequency=frequency, nodes={self.__outputs(instance)[1] : self.__AC_out(frequency, instance) for instance in self.models})
+            self.last_plot = 'ac1'
+        elif tokens[0] == 'sens': # finite differences over each resistor
+            output = tokens[1].lower()
+            instance = next(instance for instance in self.models if output in (f"i({self.__outputs(instance)[0]})", f"v({self.__outputs(instance)[1]})"))
+            current = output.startswith('i(')
+            frequency = get_frequencies(tokens[3:]) if len(tokens) > 2 else None
+            elements = dict()
+            for name, value in list(self.resistors.items()):
+                step = value*MOCK_SENS_STEP
+                self.resistors[name] = value + step
+                high = -self.__response(instance)[1] if current else self.__AC_out(frequency, instance)
+                self.resistors[name] = value - step
+                low = -self.__response(instance)[1] if current else self.__AC_out(frequency, instance)
+                self.resistors[name] = value
+                elements[name] = np.atleast_1d((high - low)/(2*step))
+            self.__analysis = MockAnalysis(elements=elements)
+            self.last_plot = 'sens1'
+        else:
+            raise ValueError(f"The stand-in simulator only runs op, ac and sens, not {command}")
+        return ''
+
+    def plot(self, simulation, plot_name : str) -> MockPlot:
+        return MockPlot(self.__analysis)
+
+    def __AC_out(self, frequency : np.ndarray, instance : str) -> np.ndarray:
+        gain, current, pole = self.__response(instance)
+        return gain/(1 + 1j*frequency/pole)**2
+
+    # DC gain, supply current and pole frequency of one amplifier of the loaded circuit
+    def __response(self, instance : str) -> tuple[float, float, float]:
+        names = [name for name in self.resistors if self.owners[name] == instance]
+        logs = np.log10(np.array([self.resistors[name] for name in names])/1000)
+        z = np.tanh(np.array([self.weights[get_canonical(name, instance)] for name in names]).T @ logs/np.sqrt(len(names)))
+        gain = MOCK_GAIN*np.exp(0.25*z[0] + 0.05*np.log(self.BF[instance]/100))
+        current = MOCK_CURRENT*np.exp(0.4*z[1])
+        pole = MOCK_POLE*np.exp(0.8*z[2])
+        return gain, current, pole
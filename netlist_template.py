@@ -0,0 +1,164 @@
+from PySpice.Spice.BasicElement import Resistor, SubCircuitElement
+from PySpice.Spice.NgSpice.Simulation import NgSpiceSharedCircuitSimulator
+
+##########################################
+
+from subcircuit_def import FeedBackAmp, get_amp_circuit, get_fused_circuit, get_fused_saves, corner_suffix
+from spice_models import get_model_params
+from simulation_session import SimulationSession, ac_command, sens_command, get_session
+
+# flattened ngspice name of every resistor, keyed by its path in the design dictionary
+def get_resistor_names(fbDict : dict, trans : str, instance : str = 'xfbamp1') -> dict[tuple, str]:
+    amp = FeedBackAmp(fbDict, trans)
+    stages = {element.subcircuit_name : element.name.lower() for element in amp.elements if isinstance(element, SubCircuitElement)}
+    names = dict()
+    for element in amp.elements: # resistors of the feedback amp itself, e.g. RF
+        if isinstance(element, Resistor):
+            names[(element.name[1:],)] = f"r.{instance}.{element.name.lower()}"
+    for subcircuit in amp.subcircuits: # resistors inside each stage
+        for element in subcircuit.elements:
+            if isinstance(element, Resistor):
+                names[(subcircuit.name, element.name[1:])] = f"r.{instance}.{stages[subcircuit.name]}.{element.name.lower()}"
+    return names
+
+# looks up a value in the design dictionary by its path
+def get_path(fbDict : dict, path : tuple) -> float:
+    for key in path:
+        fbDict = fbDict[key]
+    return float(fbDict)
+
+# netlist compiled once and loaded into ngspice, later designs only alter resistor values
+# transistor corners are switched with altermod, so one template serves every corner
+# "saves" are vectors kept besides AC_out and i(vvdc), e.g. the transistor vectors of the small signal solver
+class CircuitTemplate:
+    def __init__(self, curr_dict : dict, trans : str, session : SimulationSession | None = None, temperature = 25, saves : tuple[str, ...] = ()) -> None:
+        self.session = session if session is not None else get_session()
+        self.base_trans = trans
+        circuit = get_amp_circuit(curr_dict, trans)
+        self.simulator = NgSpiceSharedCircuitSimulator(circuit, ngspice_shared=self.session.ngspice, temperature=temperature, nominal_temperature=temperature)
+        self.simulator.save(["AC_out","i(vvdc)", *saves])
+        # the only string generation the template ever does
+        self.netlist = str(self.simulator)
+        self.resistors = get_resistor_names(curr_dict, trans)
+        self.__base_values = {path : get_path(curr_dict, path) for path in self.resistors}
+        self.values = dict()
+        self.params = dict()
+
+    # loads the netlist, resetting values to those it was built with
+    def load(self) -> None:
+        self.session.load(self.netlist, owner=self)
+        self.values = self.__base_values.copy()
+        self.params = get_model_params(self.base_trans).copy()
+
+    # alters only the resistors and model parameters that differ from the loaded state
+    # "params" overrides parameters of the transistor's model card, e.g. {'BF' : 312}
+    def set_state(self, curr_dict : dict, trans : str, params : dict[str, float] | None = None) -> None:
+        if not self.session.holds(self):
+            self.load()
+        ngspice = self.session.ngspice
+        for path, name in self.resistors.items():
+            value = get_path(curr_dict, path)
+            if value != self.values[path]:
+                ngspice.alter_device(name, resistance=value)
+                self.values[path] = value
+        target = get_model_params(trans)
+        if params:
+            target = {**target, **{key.upper() : value for key, value in params.items()}}
+        if target != self.params:
+            if target.keys() != self.params.keys():
+                raise ValueError(f"{trans} can not be reached from {self.base_trans} with altermod")
+            ngspice.alter_model(self.base_trans, **{key.lower() : value for key, value in target.items() if self.params[key] != value})
+            self.params = target.copy()
+
+    def operating_point(self):
+        return self.session.run('op', self.simulator)
+
+    def ac(self, *args, **kwargs):
+        return self.session.run(ac_command(*args, **kwargs), self.simulator)
+
+    def sensitivity(self, output : str, *args, **kwargs):
+        return self.session.run(sens_command(output, *args, **kwargs), self.simulator)
+
+    # simulator-like view of the template for one design and transistor corner
+    def bind(self, curr_dict : dict, trans : str, params : dict[str, float] | None = None) -> 'BoundTemplate':
+        return BoundTemplate(self, curr_dict, trans, params)
+
+# exposes the simulator calls CircuitAnalyzer makes, applying the design before each analysis
+class BoundTemplate:
+    def __init__(self, template : CircuitTemplate, curr_dict : dict, trans : str, params : dict[str, float] | None = None) -> None:
+        self.template = template
+        self.curr_dict = curr_dict
+        self.trans = trans
+        self.params = params
+
+    def operating_point(self):
+        self.template.set_state(self.curr_dict, self.trans, self.params)
+        return self.template.operating_point()
+
+    def ac(self, *args, **kwargs):
+        self.template.set_state(self.curr_dict, self.trans, self.params)
+        return self.template.ac(*args, **kwargs)
+
+    def sensitivity(self, output : str, *args, **kwargs):
+        self.template.set_state(self.curr_dict, self.trans, self.params)
+        return self.template.sensitivity(output, *args, **kwargs)
+
+# netlist holding every transistor corner's amplifier, compiled once, later designs alter the resistors of every corner
+# each corner keeps its own model card, so nothing is switched with altermod
+class FusedTemplate:
+    def __init__(self, curr_dict : dict, corners : dict[str, str], session : SimulationSession | None = None, temperature = 25, saves : tuple[str, ...] = ()) -> None:
+        self.session = session if session is not None else get_session()
+        circuit = get_fused_circuit(curr_dict, corners)
+        self.simulator = NgSpiceSharedCircuitSimulator(circuit, ngspice_shared=self.session.ngspice, temperature=temperature, nominal_temperature=temperature)
+        self.simulator.save(get_fused_saves(corners) + list(saves))
+        self.netlist = str(self.simulator)
+        # path in the design dictionary of every corner's copy of each resistor
+        self.resistors = {name : path for key, trans in corners.items() for path, name in get_resistor_names(curr_dict, trans, f"xfbamp_{corner_suffix(key)}").items()}
+        self.__base_values = {name : get_path(curr_dict, path) for name, path in self.resistors.items()}
+        self.values = dict()
+
+    def load(self) -> None:
+        self.session.load(self.netlist, owner=self)
+        self.values = self.__base_values.copy()
+
+    # every corner is already in the netlist, so "trans" is ignored
+    def set_state(self, curr_dict : dict, trans : str | None = None, params : dict[str, float] | None = None) -> None:
+        if params:
+            raise ValueError("Model parameters can not be overridden in a fused netlist")
+        if not self.session.holds(self):
+            self.load()
+        ngspice = self.session.ngspice
+        for name, path in self.resistors.items():
+            value = get_path(curr_dict, path)
+            if value != self.values[name]:
+                ngspice.alter_device(name, resistance=value)
+                self.values[name] = value
+
+    def operating_point(self):
+        return self.session.run('op', self.simulator)
+
+    def ac(self, *args, **kwargs):
+        return self.session.run(ac_command(*args, **kwargs), self.simulator)
+
+    def sensitivity(self, output : str, *args, **kwargs):
+        return self.session.run(sens_command(output, *args, **kwargs), self.simulator)
+
+    def bind(self, curr_dict : dict) -> 'BoundTemplate':
+        return BoundTemplate(self, curr_dict, None)
+
+# one template per temperature, model parameter set and saved vectors in the process's session
+def get_template(curr_dict : dict, temperature = 25, saves : tuple[str, ...] = ()) -> CircuitTemplate:
+    session = get_session()
+    trans = list(curr_dict['trans'].values())[0]
+    key = (temperature, tuple(sorted(get_model_params(trans))), tuple(saves))
+    if key not in session.templates:
+        session.templates[key] = CircuitTemplate(curr_dict, trans, session=session, temperature=temperature, saves=tuple(saves))
+    return session.templates[key]
+
+# one fused template per temperature, set of corners and saved vectors in the process's session
+def get_fused_template(curr_dict : dict, corners : dict[str, str], temperature = 25, saves : tuple[str, ...] = ()) -> FusedTemplate:
+    session = get_session()
+    key = ('fused', temperature, tuple(corners.items()), tuple(saves))
+    if key not in session.templates:
+        session.templates[key] = FusedTemplate(curr_dict, corners, session=session, temperature=temperature, saves=tuple(saves))
+    return session.templates[key]
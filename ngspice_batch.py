@@ -0,0 +1,157 @@
+import mmap
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+##########################################
+
+from PySpice.Spice.NgSpice.Simulation import NgSpiceSubprocessCircuitSimulator
+
+##########################################
+
+from simulation_session import ac_command, sens_command
+
+# ngspice executable run in batch mode, "ngspice_con" on windows
+NGSPICE_COMMAND = os.environ.get('NGSPICE_COMMAND', 'ngspice')
+# seconds one ngspice -b process may take before it is killed and its design fails
+BATCH_TIMEOUT = 60
+
+# analysis command kind of each plot ngspice writes to a raw file
+PLOT_KINDS = {'operating point' : 'op', 'ac analysis' : 'ac', 'sensitivity analysis' : 'sens', 'ac sensitivity analysis' : 'sens'}
+
+# one plot of a raw file, its vectors are views into the memory mapped file
+# read like the PySpice analyses CircuitAnalyzer reads: branches, nodes, frequency, AC_out and elements
+class RawAnalysis:
+    def __init__(self, name : str, vectors : dict[str, np.ndarray]) -> None:
+        self.name = name
+        self.frequency = None
+        self.branches = dict()
+        self.nodes = dict()
+        for vector_name, vector in vectors.items():
+            if vector_name == 'frequency':
+                self.frequency = vector.real
+            elif vector_name.startswith('i(') and vector_name.endswith(')'): # i(vvdc)
+                self.branches[vector_name[2:-1]] = vector
+            elif vector_name.endswith('#branch'): # vvdc#branch from older versions
+                self.branches[vector_name[:-len('#branch')]] = vector
+            elif vector_name.startswith('v(') and vector_name.endswith(')'):
+                self.nodes[vector_name[2:-1]] = vector
+            else:
+                self.nodes[vector_name] = vector
+        # a sensitivity plot's vectors are its devices
+        self.elements = self.nodes
+
+    def __getattr__(self, name : str) -> np.ndarray:
+        nodes = self.__dict__.get('nodes', dict())
+        if name.lower() in nodes: # AC_out
+            return nodes[name.lower()]
+        raise AttributeError(name)
+
+# every plot of a binary raw file, keyed by the kind of analysis that wrote it
+# the file is memory mapped and the vectors are strided views into it, nothing is copied
+def read_raw(path : str) -> dict[str, RawAnalysis]:
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return dict()
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    plots = dict()
+    offset = 0
+    while offset < len(buffer):
+        end = buffer.find(b'Binary:\n', offset)
+        if end < 0:
+            break
+        header = dict()
+        names = []
+        in_variables = False
+        for line in buffer[offset:end].decode('ascii', errors='replace').splitlines():
+            if in_variables:
+                tokens = line.split()
+                if len(tokens) >= 2 and tokens[0].isdigit():
+                    names.append(tokens[1].lower())
+                continue
+            key, _, value = line.partition(':')
+            if key == 'Variables':
+                in_variables = True
+            else:
+                header[key.strip()] = value.strip()
+        n_variables, n_points = int(header['No. Variables']), int(header['No. Points'])
+        dtype = np.complex128 if 'complex' in header.get('Flags', '').lower() else np.float64
+        offset = end + len(b'Binary:\n')
+        data = np.frombuffer(buffer, dtype=dtype, count=n_variables*n_points, offset=offset).reshape(n_points, n_variables)
+        offset += data.nbytes
+        name = header.get('Plotname', '')
+        plots[PLOT_KINDS.get(name.lower(), name.lower())] = RawAnalysis(name, {vector_name : data[:, j] for j, vector_name in enumerate(names)})
+    return plots
+
+# netlist of a PySpice circuit with the analyses as dot commands, ngspice -b runs them all in one go
+def get_deck(netlist : str, commands : list[str]) -> str:
+    lines = netlist.rstrip().splitlines()
+    if lines and lines[-1].strip().lower() == '.end':
+        lines.pop()
+    return '\n'.join(lines + [f".{command}" for command in commands] + ['.end', ''])
+
+# runs one deck in its own ngspice -b process, None when ngspice failed, hung or wrote nothing
+def run_deck(deck : str, directory : str, name : str, timeout : float = BATCH_TIMEOUT) -> dict[str, RawAnalysis] | None:
+    netlist_path = os.path.join(directory, f"{name}.cir")
+    raw_path = os.path.join(directory, f"{name}.raw")
+    with open(netlist_path, 'w') as file:
+        file.write(deck)
+    try:
+        process = subprocess.run([NGSPICE_COMMAND, '-b', '-r', raw_path, netlist_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+    except subprocess.TimeoutExpired: # run kills the hung process
+        return None
+    if process.returncode != 0 or not os.path.exists(raw_path):
+        return None
+    try:
+        return read_raw(raw_path)
+    except (KeyError, ValueError): # truncated by a crash
+        return None
+
+# runs every deck in concurrent ngspice -b processes, at most nProcesses at a time
+# a deck whose process crashes or hangs is None, the others are unaffected
+def run_batch(decks : list[str], nProcesses : int = 1, timeout : float = BATCH_TIMEOUT) -> list[dict[str, RawAnalysis] | None]:
+    # the mapped files stay readable after the directory is removed, except on windows where they are left behind
+    with tempfile.TemporaryDirectory(prefix='ngspice_batch_', ignore_cleanup_errors=True) as directory:
+        with ThreadPoolExecutor(max_workers=max(nProcesses, 1)) as executor:
+            return list(executor.map(lambda i: run_deck(decks[i], directory, f"deck_{i}", timeout), range(len(decks))))
+
+# the simulator calls CircuitAnalyzer makes, each answered by an ngspice -b process of its own
+# analyses fetched ahead of time by prefetch are answered without running anything
+class BatchSimulator:
+    def __init__(self, circuit, temperature = 25, timeout : float = BATCH_TIMEOUT, saves : list[str] | None = None) -> None:
+        simulator = NgSpiceSubprocessCircuitSimulator(circuit, temperature=temperature, nominal_temperature=temperature)
+        simulator.save(saves if saves is not None else ["AC_out","i(vvdc)"])
+        self.netlist = str(simulator)
+        self.timeout = timeout
+        # analysis of each command, None where ngspice failed
+        self.analyses = dict()
+
+    def deck(self, commands : list[str]) -> str:
+        return get_deck(self.netlist, commands)
+
+    def __get(self, command : str):
+        if command not in self.analyses:
+            prefetch([self], [command], timeout=self.timeout)
+        analysis = self.analyses[command]
+        if analysis is None:
+            raise NameError('Simulation failed')
+        return analysis
+
+    def operating_point(self):
+        return self.__get('op')
+
+    def ac(self, *args, **kwargs):
+        return self.__get(ac_command(*args, **kwargs))
+
+    def sensitivity(self, output : str, *args, **kwargs):
+        return self.__get(sens_command(output, *args, **kwargs))
+
+# runs "commands" for every simulator, one ngspice -b process per simulator across nProcesses at a time
+def prefetch(simulators : list[BatchSimulator], commands : list[str], nProcesses : int = 1, timeout : float = BATCH_TIMEOUT) -> None:
+    results = run_batch([simulator.deck(commands) for simulator in simulators], nProcesses, timeout)
+    for simulator, plots in zip(simulators, results):
+        for command in commands:
+            simulator.analyses[command] = plots.get(command.split()[0]) if plots is not None else None
@@ -0,0 +1,134 @@
+import numpy as np
+from tqdm import tqdm
+
+##########################################
+
+from subcircuit_def import SubCircuitDictionaries
+from simulated_annealing import run_walk, get_encoding
+from eval_cache import EvaluationCache
+from parallel_walks import run_walks_parallel
+from parallel_tempering import ParallelTempering, temperature_ladder
+from pattern_search import PatternSearch
+from pareto import ParetoArchive, run_pareto_walks
+from speculative import SpeculativeWalk
+from checkpoint import RunCheckpoint, WalkCheckpoint
+from trace_log import TraceLog, TraceWriter
+from helper_funcs import RunConfig
+
+# holds the transistor tolerances to be tested
+def get_trans(config : RunConfig) -> dict[str, str]:
+    if config.dBeta: # tests high and low beta
+        return {"LO" :"ZTX107-LO", "HI" : "ZTX107-HI"}
+    else: # nominal case
+        return {"NOM" : "ZTX107-NOM"}
+
+# the starting configuration of the circuit
+def get_start_design(config : RunConfig) -> dict:
+    return SubCircuitDictionaries().get_feedbackamp_dict(get_trans(config))
+
+# settings a resumed run has to share with the run that wrote its checkpoints
+def get_run_settings(config : RunConfig) -> dict:
+    return {'T' : config.T, 'kAnnealing' : config.kAnnealing, 'nWalk' : config.nWalk, 'kGreedy' : config.kGreedy, 'sigma' : config.sigma,
+            'dBeta' : config.dBeta, 'tempering' : config.tempering, 'adaptiveAC' : config.adaptiveAC, 'nWorkers' : config.nWorkers,
+            'surrogate' : config.surrogate, 'surrogateKappa' : config.surrogateKappa, 'surrogateMinPoints' : config.surrogateMinPoints,
+            'sensitivityMoves' : config.sensitivityMoves, 'patternSearch' : config.patternSearch, 'pareto' : config.pareto,
+            'speculation' : config.speculation, 'biasPrefilter' : config.biasPrefilter}
+
+def get_walk_checkpoint(checkpoints : RunCheckpoint | None, name : str) -> WalkCheckpoint | None:
+    return checkpoints.walk(name) if checkpoints is not None else None
+
+def get_walk_trace(trace : TraceLog | None, name : str, walk : int, state_size : int) -> TraceWriter | None:
+    return trace.writer(name, walk=walk, state_size=state_size) if trace is not None else None
+
+# the simulated annealing stage: parallel tempering, walks across processes or walks one after another
+# walk i starts from starts[i] when given, every walk from s_0 otherwise
+# returns every walk's best design and energy, and the tempering engine if it was used
+def run_annealing(s_0 : dict, config : RunConfig, cache : EvaluationCache | None = None, checkpoints : RunCheckpoint | None = None, trace : TraceLog | None = None,
+                  cache_size : int = 100000, max_runs : int = 10000, starts : list[dict] | None = None) -> tuple[list, list, ParallelTempering | None]:
+    v = config.isVerbose
+    kMax = config.kAnnealing
+    numWalk = config.nWalk
+    Tinit = config.T
+    starts = starts if starts is not None else [s_0]*numWalk
+    state_size = get_encoding(s_0).size
+    sbest_list = []
+    ebest_list = []
+    tempering = None
+    if config.tempering: # one replica per walk on a ladder from the final to the starting SA temperature
+        print(f"Running Parallel Tempering with {numWalk} Replicas on {min(config.nWorkers, numWalk)} Processes...")
+        tempering = ParallelTempering(s_0, temperature_ladder(1/Tinit, Tinit, numWalk), nWorkers=config.nWorkers, cache=cache, cache_size=cache_size, max_runs=max_runs, config=config,
+                                      starts=starts)
+        with tqdm(total=kMax*numWalk, disable=v) as pbar:
+            sbest_par, ebest_par = tempering.run(kMax, pbar=pbar, checkpoint=get_walk_checkpoint(checkpoints, 'tempering'), trace=get_walk_trace(trace, 'tempering', 0, state_size))
+        sbest_list.extend(sbest_par)
+        ebest_list.extend(ebest_par)
+    elif config.speculation > 1: # walks one after another, each evaluating several proposals at once across the processes
+        print(f"Running Speculative Simulated Annealing, {config.speculation} Proposals per Round on {min(config.nWorkers, config.speculation)} Processes...")
+        with tqdm(total=kMax*numWalk, disable=v) as pbar:
+            for i in range(numWalk):
+                walk = SpeculativeWalk(starts[i], config.speculation, nWorkers=config.nWorkers, cache=cache, cache_size=cache_size, max_runs=max_runs, config=config)
+                sbest, ebest = walk.run(Tinit, kMax, pbar=pbar, checkpoint=get_walk_checkpoint(checkpoints, f"walk_{i}"),
+                                        trace=get_walk_trace(trace, f"walk_{i:04d}", i, state_size))
+                sbest_list.append(sbest)
+                ebest_list.append(ebest)
+    elif config.nWorkers > 1: # walks spread across worker processes
+        print(f"Running Simulated Annealing on {min(config.nWorkers, numWalk)} Processes...")
+        with tqdm(total=kMax*numWalk, disable=v) as pbar:
+            sbest_par, ebest_par = run_walks_parallel(T=Tinit, kMax=kMax, s_0=s_0, starts=starts, numWalk=numWalk, nWorkers=config.nWorkers, seed=np.random.randint(2**31), pbar=pbar,
+                                                      cache=cache, cache_size=cache_size, max_runs=max_runs, checkpoints=checkpoints, trace=trace, config=config)
+        sbest_list.extend(sbest_par)
+        ebest_list.extend(ebest_par)
+    elif v: # run conditions for verbose mode
+        print("Running Simulated Annealing in Verbose Mode...")
+        for i in range(numWalk):
+            print(f"Walk #{i+1}...")
+            # run_walk computes one round of simulated annealing
+            sbest, ebest = run_walk(T=Tinit, kMax=kMax, s_0=starts[i], cache=cache, checkpoint=get_walk_checkpoint(checkpoints, f"walk_{i}"),
+                                    trace=get_walk_trace(trace, f"walk_{i:04d}", i, state_size), config=config)
+            sbest_list.append(sbest)
+            ebest_list.append(ebest)
+    else: # non verbose
+        print("Running Simulated Annealing...")
+        with tqdm(total=kMax*numWalk) as pbar:
+            for i in range(numWalk):
+                # run_walk computes one round of simulated annealing
+                sbest, ebest = run_walk(T=Tinit, kMax=kMax, s_0=starts[i], pbar=pbar, cache=cache, checkpoint=get_walk_checkpoint(checkpoints, f"walk_{i}"),
+                                        trace=get_walk_trace(trace, f"walk_{i:04d}", i, state_size), config=config)
+                sbest_list.append(sbest)
+                ebest_list.append(ebest)
+    return sbest_list, ebest_list, tempering
+
+# greedy walk, i.e. SA with T = 0
+def run_greedy(s_0 : dict, config : RunConfig, cache : EvaluationCache | None = None, checkpoints : RunCheckpoint | None = None, trace : TraceLog | None = None) -> tuple[dict, float]:
+    state_size = get_encoding(s_0).size
+    if config.speculation > 1: # nearly every greedy step is a rejection, the best case for speculation
+        print(f"Running Speculative Greedy Walk, {config.speculation} Proposals per Round...")
+        walk = SpeculativeWalk(s_0, config.speculation, nWorkers=config.nWorkers, cache=cache, config=config)
+        with tqdm(total=config.kGreedy, disable=config.isVerbose) as pbar:
+            return walk.run(0, config.kGreedy, pbar=pbar, checkpoint=get_walk_checkpoint(checkpoints, 'greedy'),
+                            trace=get_walk_trace(trace, 'walk_greedy', config.nWalk, state_size))
+    if config.isVerbose: # run conditions for verbose mode
+        print("Running Greedy Walk in Verbose Mode...")
+        return run_walk(T=0, kMax=config.kGreedy, s_0=s_0, cache=cache, checkpoint=get_walk_checkpoint(checkpoints, 'greedy'),
+                        trace=get_walk_trace(trace, 'walk_greedy', config.nWalk, state_size), config=config)
+    else: # non verbose
+        print("Running Greedy Walk...")
+        with tqdm(total=config.kAnnealing*config.nWalk) as pbar:
+            return run_walk(T=0, kMax=config.kGreedy, s_0=s_0, pbar=pbar, cache=cache, checkpoint=get_walk_checkpoint(checkpoints, 'greedy'),
+                            trace=get_walk_trace(trace, 'walk_greedy', config.nWalk, state_size), config=config)
+
+# pattern search refinement of "s_0", usually the best annealing design, spending at most kGreedy simulations
+def run_pattern_search(s_0 : dict, config : RunConfig, cache : EvaluationCache | None = None, checkpoints : RunCheckpoint | None = None, trace : TraceLog | None = None) -> tuple[dict, float]:
+    state_size = get_encoding(s_0).size
+    search = PatternSearch(s_0, cache=cache, config=config)
+    print("Running Pattern Search in Verbose Mode..." if config.isVerbose else "Running Pattern Search...")
+    with tqdm(total=config.kGreedy, disable=config.isVerbose) as pbar:
+        return search.run(config.kGreedy, pbar=pbar, checkpoint=get_walk_checkpoint(checkpoints, 'pattern'),
+                          trace=get_walk_trace(trace, 'walk_pattern', config.nWalk, state_size))
+
+# multi-objective annealing over bandwidth, gain error and current, returns the front of every walk merged
+def run_pareto(s_0 : dict, config : RunConfig, cache : EvaluationCache | None = None, checkpoints : RunCheckpoint | None = None, trace : TraceLog | None = None,
+               cache_size : int = 100000, max_runs : int = 10000, starts : list[dict] | None = None) -> ParetoArchive:
+    print(f"Running Multi-Objective Annealing on {min(config.nWorkers, config.nWalk)} Processes..." if config.nWorkers > 1 else "Running Multi-Objective Annealing...")
+    with tqdm(total=config.kAnnealing*config.nWalk, disable=config.isVerbose) as pbar:
+        return run_pareto_walks(s_0, config, pbar=pbar, cache=cache, checkpoints=checkpoints, trace=trace, cache_size=cache_size, max_runs=max_runs, starts=starts)
@@ -0,0 +1,209 @@
+import multiprocessing
+import numpy as np
+
+##########################################
+
+import parallel_walks
+from simulated_annealing import P, get_encoding, is_hopeless
+from eval_cache import CachedEvaluation, EvaluationCache, evaluate, evaluate_batch
+from checkpoint import WalkCheckpoint
+from trace_log import TraceWriter
+from helper_funcs import RunConfig, get_config
+import instrumentation
+import surrogate
+
+# steps between rounds of replica swaps
+SWAP_INTERVAL = 10
+
+# geometric ladder of fixed temperatures, coldest first
+def temperature_ladder(T_min : float, T_max : float, n : int) -> np.ndarray:
+    if n == 1:
+        return np.array([T_max])
+    return np.geomspace(T_min, T_max, n)
+
+# evaluation of a design or None when NgSpice fails, which run_walk counts as a rejected design
+def get_evaluation(s : dict, cache : EvaluationCache | None = None, config : RunConfig | None = None) -> CachedEvaluation | None:
+    config = config if config is not None else get_config()
+    try:
+        return evaluate(s, cache, **config.analysis_options())
+    except: # catches errors in NgSpice
+        print(f"Something went wrong with: {s}")
+        if instrumentation.instruments is not None:
+            instrumentation.instruments.failure()
+        return None
+
+# evaluations of many designs simulated together in nProcesses ngspice -b processes, None where NgSpice fails
+def get_evaluations(designs : list[dict], cache : EvaluationCache | None = None, config : RunConfig | None = None, nProcesses : int = 1) -> list[CachedEvaluation | None]:
+    config = config if config is not None else get_config()
+    records = evaluate_batch(designs, cache, nProcesses, **config.analysis_options())
+    for s, record in zip(designs, records):
+        if record is None:
+            print(f"Something went wrong with: {s}")
+            if instrumentation.instruments is not None:
+                instrumentation.instruments.failure()
+    return records
+
+# evaluates one design in a worker process, sending back the worker's stats
+def evaluation_worker(s : dict) -> tuple[CachedEvaluation | None, dict]:
+    record = get_evaluation(s, parallel_walks.worker_cache)
+    return record, parallel_walks.get_worker_stats()
+
+# replica exchange: one chain per temperature, neighbouring chains swap states every SWAP_INTERVAL steps
+class ParallelTempering:
+    def __init__(self, s_0 : dict, temperatures : np.ndarray, nWorkers : int = 1, cache : EvaluationCache | None = None, cache_size : int = 100000, max_runs : int = 10000,
+                 config : RunConfig | None = None, starts : list[dict] | None = None) -> None:
+        self.config = config if config is not None else get_config()
+        self.encoding = get_encoding(s_0)
+        self.temperatures = np.asarray(temperatures, dtype=float)
+        self.nReplicas = len(self.temperatures)
+        self.nWorkers = min(nWorkers, self.nReplicas)
+        self.cache = cache
+        self.cache_size = cache_size
+        self.max_runs = max_runs
+        # replica i starts from starts[i] when given, every replica from s_0 otherwise
+        self.states = [self.encoding.encode(s) for s in starts] if starts is not None else [self.encoding.encode(s_0)]*self.nReplicas
+        self.energies = np.zeros(self.nReplicas)
+        self.best_states = list(self.states)
+        self.best_energies = np.zeros(self.nReplicas)
+        # per replica and per neighbouring pair statistics
+        self.steps = 0
+        self.accepted = np.zeros(self.nReplicas, dtype=int)
+        self.swaps_tried = np.zeros(max(self.nReplicas - 1, 0), dtype=int)
+        self.swaps_accepted = np.zeros(max(self.nReplicas - 1, 0), dtype=int)
+        self.evaluations = 0
+        # one surrogate learns every replica's evaluations
+        self.model = surrogate.get_surrogate(self.config, self.encoding.size)
+
+    # energies of a batch of designs of the given replicas, across the pool when there is one
+    def __energies(self, states : list[np.ndarray], replicas : list[int], pool, trace : TraceWriter | None = None) -> np.ndarray:
+        designs = [self.encoding.decode(x) for x in states]
+        self.evaluations += len(designs)
+        if self.config.ngspiceBatch: # the batch's ngspice processes run side by side
+            records = get_evaluations(designs, self.cache, self.config, self.nWorkers)
+        elif pool is None:
+            records = [get_evaluation(s, self.cache, self.config) for s in designs]
+        else:
+            records = []
+            for record, stats in pool.map(evaluation_worker, designs, chunksize=1):
+                records.append(record)
+                parallel_walks.merge_worker_stats(stats, self.cache)
+        energies = np.array([-record.goodness if record is not None else 0 for record in records])
+        if self.model is not None:
+            for x, e in zip(states, energies):
+                self.model.add(self.encoding.log_values(x), -e)
+        if trace is not None: # the walk field holds the replica
+            for r, x, record in zip(replicas, states, records):
+                trace.record(self.steps, x, record, walk=r)
+        return energies
+
+    # swaps neighbouring replicas, alternating even and odd pairs between rounds
+    # the colder replica takes the hotter state through P at the pair's effective temperature
+    def __swap(self) -> None:
+        start = (self.steps//SWAP_INTERVAL) % 2
+        for i in range(start, self.nReplicas - 1, 2):
+            T_cold, T_hot = self.temperatures[i], self.temperatures[i + 1]
+            T_eff = T_cold*T_hot/(T_hot - T_cold) if T_hot != T_cold else T_cold
+            self.swaps_tried[i] += 1
+            if P(self.energies[i], self.energies[i + 1], T_eff):
+                self.states[i], self.states[i + 1] = self.states[i + 1], self.states[i]
+                self.energies[[i, i + 1]] = self.energies[[i + 1, i]]
+                self.swaps_accepted[i] += 1
+
+    def __step(self, pool, trace : TraceWriter | None = None) -> None:
+        proposals = [self.encoding.neighbour(x, sd=self.config.sigma) for x in self.states]
+        self.steps += 1
+        # proposals P would reject even at the surrogate's optimistic energy are not simulated
+        replicas = [r for r in range(self.nReplicas) if self.model is None or
+                    not is_hopeless(self.model, self.encoding.log_values(proposals[r]), self.energies[r], self.temperatures[r])]
+        new_energies = np.zeros(self.nReplicas)
+        if replicas:
+            new_energies[replicas] = self.__energies([proposals[r] for r in replicas], replicas, pool, trace)
+        for r in range(self.nReplicas):
+            accepted = P(self.energies[r], new_energies[r], self.temperatures[r])
+            if accepted: # acceptance
+                self.states[r] = proposals[r]
+                self.energies[r] = new_energies[r]
+                self.accepted[r] += 1
+            if instrumentation.instruments is not None:
+                instrumentation.instruments.step(accepted)
+            if new_energies[r] < self.best_energies[r]: # records best
+                self.best_states[r] = proposals[r]
+                self.best_energies[r] = new_energies[r]
+        if self.steps % SWAP_INTERVAL == 0:
+            self.__swap()
+
+    # every array needed to continue the run, the random state is added by the checkpoint
+    def __save(self, checkpoint : WalkCheckpoint) -> None:
+        checkpoint.save(states=np.stack(self.states), energies=self.energies, best_states=np.stack(self.best_states), best_energies=self.best_energies,
+                        steps=self.steps, accepted=self.accepted, swaps_tried=self.swaps_tried, swaps_accepted=self.swaps_accepted, evaluations=self.evaluations,
+                        **(self.model.state() if self.model is not None else {}))
+
+    def __restore(self, state : dict[str, np.ndarray]) -> None:
+        self.states = list(state['states'])
+        self.energies = state['energies']
+        self.best_states = list(state['best_states'])
+        self.best_energies = state['best_energies']
+        self.steps = int(state['steps'])
+        self.accepted = state['accepted']
+        self.swaps_tried = state['swaps_tried']
+        self.swaps_accepted = state['swaps_accepted']
+        self.evaluations = int(state['evaluations'])
+        if self.model is not None and 'surrogate_y' in state:
+            self.model.restore(state)
+
+    # runs every replica up to kMax steps, returning each replica's best design and energy
+    # every replica's evaluations are recorded in "trace" when given
+    def run(self, kMax : int, pbar=0, checkpoint : WalkCheckpoint | None = None, trace : TraceWriter | None = None):
+        state = checkpoint.load() if checkpoint is not None else None
+        if state is not None: # continues exactly where the checkpoint left off
+            self.__restore(state)
+            if not self.config.isVerbose and pbar:
+                pbar.update(self.steps*self.nReplicas)
+        pool = None
+        if self.nWorkers > 1 and not self.config.ngspiceBatch:
+            pool = multiprocessing.Pool(processes=self.nWorkers, initializer=parallel_walks.init_worker,
+                                        initargs=parallel_walks.get_init_args(self.config, self.cache, self.cache_size, self.max_runs))
+        try:
+            if trace is not None: # records written after the checkpoint are written again
+                trace.truncate(self.steps if state is not None else -1)
+            if self.steps == 0: # evaluates the start once for every replica, or each replica's own start
+                if all(np.array_equal(x, self.states[0]) for x in self.states):
+                    self.energies[:] = self.__energies(self.states[:1], [0], pool, trace)[0]
+                else:
+                    self.energies[:] = self.__energies(self.states, list(range(self.nReplicas)), pool, trace)
+                self.best_energies[:] = self.energies
+            for i in range(self.steps, kMax):
+                self.__step(pool, trace)
+                if self.config.isVerbose and i%100 == 0: # verbose printing
+                    print(f"{round(i/kMax*100)}% Complete")
+                    print(f"Replica Energies: {' '.join(f'{e:.2E}' for e in self.energies)}")
+                    print()
+                if not self.config.isVerbose and pbar: # non verbose output
+                    pbar.update(self.nReplicas)
+                if checkpoint is not None and checkpoint.is_due(i, kMax):
+                    if trace is not None: # the trace on disk has to reach the checkpoint
+                        trace.flush()
+                    self.__save(checkpoint)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if trace is not None:
+                trace.flush()
+        return [self.encoding.decode(x) for x in self.best_states], self.best_energies.tolist()
+
+    def acceptance_rates(self) -> np.ndarray:
+        return self.accepted/max(self.steps, 1)
+
+    def swap_rates(self) -> np.ndarray:
+        return self.swaps_accepted/np.maximum(self.swaps_tried, 1)
+
+    # table of acceptance and swap rates, the swap rate is with the next hotter replica
+    def report(self) -> str:
+        lines = [f"{'Replica':>8} {'Temp':>9} {'Accept':>7} {'Swap':>7} {'Best':>10}"]
+        swap_rates = self.swap_rates()
+        for r in range(self.nReplicas):
+            swap = f"{swap_rates[r]:.1%}" if r < self.nReplicas - 1 else "-"
+            lines.append(f"{r:>8} {self.temperatures[r]:>9.3g} {self.acceptance_rates()[r]:>7.1%} {swap:>7} {self.best_energies[r]:>10.2E}")
+        lines.append(f"{self.evaluations} evaluations over {self.steps} steps")
+        return "\n".join(lines)
@@ -0,0 +1,90 @@
+import multiprocessing
+import numpy as np
+
+##########################################
+
+import simulated_annealing
+from eval_cache import EvaluationCache, set_remote
+from eval_server import connect_remote
+from simulation_session import SimulationSession, set_session, forget_inherited_ngspice
+from checkpoint import RunCheckpoint
+from helper_funcs import RunConfig, get_config, set_config
+import instrumentation
+import surrogate
+import small_signal
+from trace_log import TraceLog
+
+# per process evaluation cache, filled in by init_worker
+worker_cache = None
+
+# sets up a worker process with the parent's settings and its own NgSpice instance
+# "records" of the parent's cache seed the worker's, what the worker adds goes back with its stats
+def init_worker(config : RunConfig, cache_size : int, max_runs : int, records : list | None = None) -> None:
+    global worker_cache
+    set_config(config)
+    # a forked worker inherits the parent's counts, which are not its own to send back
+    instrumentation.disable()
+    surrogate.drain_counts()
+    small_signal.drain_counts()
+    if config.instrument:
+        instrumentation.enable()
+    # a forked worker inherits the parent's instance, so force a fresh one
+    forget_inherited_ngspice()
+    set_session(SimulationSession(max_runs=max_runs))
+    worker_cache = EvaluationCache(maxsize=cache_size, keep_new=True)
+    if records:
+        worker_cache.merge(records)
+    # the parent's connection to the evaluation server can not be shared, each worker opens its own
+    set_remote(None)
+    connect_remote(config)
+
+# init_worker arguments of a pool whose workers start from the parent's "cache"
+def get_init_args(config : RunConfig, cache : EvaluationCache | None, cache_size : int, max_runs : int) -> tuple:
+    return config, cache_size, max_runs, cache.records() if cache is not None else None
+
+# counts and new cache records a worker sends back with each result, drained so nothing is sent twice
+def get_worker_stats() -> dict:
+    return {'instruments' : instrumentation.instruments.drain() if instrumentation.instruments is not None else None, 'surrogate' : surrogate.drain_counts(),
+            'small_signal' : small_signal.drain_counts(), 'cache' : worker_cache.drain() if worker_cache is not None else None}
+
+# "cache" takes in the worker's new records and lookups, None when the parent already looked the designs up itself
+def merge_worker_stats(stats : dict, cache : EvaluationCache | None = None) -> None:
+    if stats['instruments'] is not None and instrumentation.instruments is not None:
+        instrumentation.instruments.merge(stats['instruments'])
+    surrogate.merge_counts(stats['surrogate'])
+    small_signal.merge_counts(stats['small_signal'])
+    if cache is not None and stats['cache'] is not None:
+        cache.merge_drained(stats['cache'])
+
+# runs one annealing walk, its evaluations go straight to the walk's trace file
+def walk_worker(args : tuple) -> tuple:
+    walk_id, seed, T, kMax, s_0, checkpoint, trace = args
+    np.random.seed(seed) # every walk gets its own random stream, a checkpoint restores it
+    sbest, ebest = simulated_annealing.run_walk(T=T, kMax=kMax, s_0=s_0, cache=worker_cache, checkpoint=checkpoint, trace=trace)
+    return walk_id, sbest, ebest, get_worker_stats()
+
+# runs numWalk independent annealing walks across a pool of worker processes
+# walk i starts from starts[i] when given, every walk from s_0 otherwise
+# walks checkpoint into "checkpoints" when given, resuming any walk that already has a checkpoint
+# walk i traces into "trace" as walk_i when given
+# the workers start from the records of "cache" and send their new ones back into it
+def run_walks_parallel(T : float, kMax : int, s_0 : dict, numWalk : int, nWorkers : int, seed=None, pbar=0, cache : EvaluationCache | None = None,
+                       cache_size : int = 100000, max_runs : int = 10000, checkpoints : RunCheckpoint | None = None, trace : TraceLog | None = None, config : RunConfig | None = None, starts : list[dict] | None = None):
+    config = config if config is not None else get_config()
+    state_size = simulated_annealing.get_encoding(s_0).size
+    starts = starts if starts is not None else [s_0]*numWalk
+    seeds = np.random.SeedSequence(seed).generate_state(numWalk)
+    tasks = [(i, int(seeds[i]), T, kMax, starts[i], checkpoints.walk(f"walk_{i}") if checkpoints is not None else None,
+              trace.writer(f"walk_{i:04d}", walk=i, state_size=state_size) if trace is not None else None) for i in range(numWalk)]
+    results = [None]*numWalk
+    with multiprocessing.Pool(processes=min(nWorkers, numWalk), initializer=init_worker, initargs=get_init_args(config, cache, cache_size, max_runs)) as pool:
+        for walk_id, sbest, ebest, stats in pool.imap_unordered(walk_worker, tasks):
+            results[walk_id] = (sbest, ebest)
+            merge_worker_stats(stats, cache)
+            if pbar: # walks report back whole
+                pbar.update(kMax)
+
+    # collects the results in walk order
+    sbest_list = [result[0] for result in results]
+    ebest_list = [result[1] for result in results]
+    return sbest_list, ebest_list
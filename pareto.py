@@ -0,0 +1,263 @@
+import csv
+import multiprocessing
+import numpy as np
+
+##########################################
+
+import parallel_walks
+from simulated_annealing import temperature, get_encoding
+from eval_cache import CachedEvaluation, EvaluationCache, evaluate
+from ac_metrics import GAIN_HIGH, GAIN_LOW
+from checkpoint import RunCheckpoint, WalkCheckpoint
+from trace_log import TraceLog, TraceWriter
+from helper_funcs import RunConfig, get_config
+import instrumentation
+
+# objectives, all minimized: bandwidth (negated), log distance of the DC gain outside the 60+-1.5dB window and supply current
+OBJECTIVES = ['BW', 'gain_error', 'OP_current']
+# designs the archive keeps, the most crowded are dropped beyond it
+ARCHIVE_LIMIT = 5000
+# fraction the archive may outgrow its limit before it is thinned, so crowding is not recomputed on every insertion
+ARCHIVE_SLACK = 0.1
+# rows of archive storage to start with, doubled whenever it fills
+ARCHIVE_CAPACITY = 256
+
+# objectives of an evaluation, None for rejected, failed and unmeasured designs
+def get_objectives(record : CachedEvaluation | None) -> np.ndarray | None:
+    if record is None or record.goodness <= 0:
+        return None
+    gain_error = max(np.log(GAIN_LOW/record.DC_gain), np.log(record.DC_gain/GAIN_HIGH), 0)
+    return np.array([-record.BW, gain_error, record.OP_current])
+
+# rows of F no worse than f in every objective, a column at a time, numpy reduces over a short last axis far slower
+def no_worse(F : np.ndarray, f : np.ndarray) -> np.ndarray:
+    mask = F[..., 0] <= f[0]
+    for j in range(1, len(f)):
+        mask &= F[..., j] <= f[j]
+    return mask
+
+# rows of F that dominate f, no worse in every objective and better in one
+def dominates(F : np.ndarray, f : np.ndarray) -> np.ndarray:
+    return no_worse(F, f) & ~no_worse(-F, -f)
+
+# NSGA-II crowding distance of each row of F, the extremes of every objective are infinitely far from the rest
+def crowding_distance(F : np.ndarray) -> np.ndarray:
+    n, m = F.shape
+    distance = np.zeros(n)
+    if n < 3:
+        return np.full(n, np.inf)
+    for j in range(m):
+        order = np.argsort(F[:, j], kind='stable')
+        column = F[order, j]
+        span = column[-1] - column[0]
+        distance[order[[0, -1]]] = np.inf
+        if span > 0:
+            distance[order[1:-1]] += (column[2:] - column[:-2])/span
+    return distance
+
+# non-dominated designs and their objectives in preallocated arrays
+# insertion is one vectorized pass over the archive to test the new point and drop the points it dominates
+class ParetoArchive:
+    def __init__(self, state_shape : tuple, limit : int | None = ARCHIVE_LIMIT) -> None:
+        self.limit = limit
+        self.size = 0
+        self.F = np.empty((ARCHIVE_CAPACITY, len(OBJECTIVES)))
+        self.X = np.empty((ARCHIVE_CAPACITY, *state_shape), dtype=np.int16)
+        # scalar goodness of each design, to hand the single objective stages their start
+        self.goodness = np.empty(ARCHIVE_CAPACITY)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def objectives(self) -> np.ndarray:
+        return self.F[:self.size]
+
+    def states(self) -> np.ndarray:
+        return self.X[:self.size]
+
+    # adds the design unless it is dominated or already there, returns whether it was added
+    def insert(self, x : np.ndarray, f : np.ndarray, goodness : float) -> bool:
+        F = self.F[:self.size]
+        if no_worse(F, f).any(): # dominated or equal
+            return False
+        keep = ~no_worse(-F, -f)
+        if not keep.all(): # compacts the survivors to the front
+            n = int(keep.sum())
+            self.F[:n], self.X[:n], self.goodness[:n] = F[keep], self.X[:self.size][keep], self.goodness[:self.size][keep]
+            self.size = n
+        if self.size == len(self.F):
+            self.__grow()
+        self.F[self.size], self.X[self.size], self.goodness[self.size] = f, x, goodness
+        self.size += 1
+        if self.limit is not None and self.size > self.limit*(1 + ARCHIVE_SLACK):
+            self.__thin(self.limit)
+        return True
+
+    # inserts every design of another archive
+    def merge(self, other : 'ParetoArchive') -> None:
+        for x, f, goodness in zip(other.states(), other.objectives(), other.goodness[:other.size]):
+            self.insert(x, f, goodness)
+
+    # index of the design with the best scalar goodness
+    def best(self) -> int:
+        return int(np.argmax(self.goodness[:self.size]))
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {'archive_F' : self.objectives().copy(), 'archive_X' : self.states().copy(), 'archive_goodness' : self.goodness[:self.size].copy()}
+
+    def restore(self, state : dict[str, np.ndarray]) -> None:
+        n = len(state['archive_F'])
+        while len(self.F) < n:
+            self.__grow()
+        self.F[:n], self.X[:n], self.goodness[:n] = state['archive_F'], state['archive_X'], state['archive_goodness']
+        self.size = n
+
+    def __grow(self) -> None:
+        capacity = 2*len(self.F)
+        self.F = np.resize(self.F, (capacity, *self.F.shape[1:]))
+        self.X = np.resize(self.X, (capacity, *self.X.shape[1:]))
+        self.goodness = np.resize(self.goodness, capacity)
+
+    # drops the most crowded designs until "size" are left
+    def __thin(self, size : int) -> None:
+        keep = np.sort(np.argsort(-crowding_distance(self.objectives()), kind='stable')[:size])
+        self.F[:size], self.X[:size], self.goodness[:size] = self.F[keep], self.X[keep], self.goodness[keep]
+        self.size = size
+
+# how far f_new falls behind the designs dominating it, the mean over them of its largest shortfall as a fraction of each objective's spread
+# 0 when nothing dominates it, f is the walk's current design
+def domination_amount(archive : ParetoArchive, f : np.ndarray | None, f_new : np.ndarray) -> float:
+    F = archive.objectives()
+    dominators = F[dominates(F, f_new)]
+    if f is not None and dominates(f, f_new):
+        dominators = np.vstack((dominators, f))
+    if len(dominators) == 0:
+        return 0.0
+    points = np.vstack((F, f_new)) if f is None else np.vstack((F, f, f_new))
+    spread = np.ptp(points, axis=0)
+    spread[spread == 0] = 1
+    return float(np.mean(np.max((f_new - dominators)/spread, axis=1)))
+
+# acceptance function, the shortfall takes the place of P's relative energy change
+def P_dominated(amount : float, T : float) -> bool:
+    if amount <= 0: # nothing dominates the proposal
+        return True
+    if T != 0 and 4 > 100*amount/T: # throws out below 2% chance
+        return 1/(1 + np.exp(100*amount/T)) > np.random.random()
+    return False
+
+# archive based multi-objective annealing walk, every design it simulates is offered to "archive"
+# a proposal nothing dominates is always taken, a dominated one with a chance falling with its shortfall and the temperature
+def run_pareto_walk(T : float, kMax : int, s_0 : dict, archive : ParetoArchive, pbar=0, cache : EvaluationCache | None = None, checkpoint : WalkCheckpoint | None = None,
+                    trace : TraceWriter | None = None, config : RunConfig | None = None) -> ParetoArchive:
+    config = config if config is not None else get_config()
+    encoding = get_encoding(s_0)
+    state = checkpoint.load() if checkpoint is not None else None
+    if state is not None: # continues exactly where the checkpoint left off
+        x, f = state['x'], state['f']
+        f = None if np.isnan(f).any() else f
+        T, b = float(state['T']), float(state['b'])
+        start = int(state['step'])
+        archive.restore(state)
+        if not config.isVerbose and pbar:
+            pbar.update(start)
+    else:
+        x = encoding.encode(s_0)
+        record = evaluate(s_0, cache, **config.analysis_options())
+        f = get_objectives(record)
+        if f is not None:
+            archive.insert(x, f, record.goodness)
+        b = T**(-2/kMax) if T != 0 else 0
+        start = 0
+    if trace is not None: # records written after the checkpoint are written again
+        trace.truncate(start if state is not None else -1)
+        if state is None:
+            trace.record(0, x, record)
+
+    for i in range(start, kMax):
+        # annealing schedule
+        T = temperature(T, b=b)
+        # generates a nearby state
+        xnew = encoding.neighbour(x, sd=config.sigma)
+        snew = encoding.decode(xnew)
+        try: # simulates the circuit
+            record = evaluate(snew, cache, **config.analysis_options())
+        except: # catches errors in NgSpice
+            print(f"Something went wrong with: {snew}")
+            if instrumentation.instruments is not None:
+                instrumentation.instruments.failure()
+            record = None
+        if trace is not None:
+            trace.record(i + 1, xnew, record)
+        f_new = get_objectives(record)
+
+        # rejected designs are never taken, like P rejecting their energy
+        accepted = f_new is not None and P_dominated(domination_amount(archive, f, f_new), T)
+        if f_new is not None:
+            archive.insert(xnew, f_new, record.goodness)
+        if accepted: # acceptance
+            x = xnew
+            f = f_new
+        if instrumentation.instruments is not None:
+            instrumentation.instruments.step(accepted)
+
+        if config.isVerbose and i%100 == 0: # verbose printing
+            print(f"{round(i/kMax*100)}% Complete")
+            print(f"Front: {len(archive)} designs")
+            print()
+
+        if not config.isVerbose and pbar: # non verbose output
+            pbar.update()
+
+        if checkpoint is not None and checkpoint.is_due(i, kMax): # saves the walk after the step is complete
+            if trace is not None: # the trace on disk has to reach the checkpoint
+                trace.flush()
+            checkpoint.save(step=i + 1, x=x, f=f if f is not None else np.full(len(OBJECTIVES), np.nan), T=T, b=b, **archive.state())
+
+    if trace is not None:
+        trace.flush()
+    return archive
+
+# runs one multi-objective walk in a worker process
+def pareto_worker(args : tuple) -> tuple[int, ParetoArchive, dict]:
+    walk_id, seed, T, kMax, s_0, checkpoint, trace = args
+    np.random.seed(seed) # every walk gets its own random stream, a checkpoint restores it
+    archive = ParetoArchive(get_encoding(s_0).encode(s_0).shape)
+    run_pareto_walk(T=T, kMax=kMax, s_0=s_0, archive=archive, cache=parallel_walks.worker_cache, checkpoint=checkpoint, trace=trace)
+    return walk_id, archive, parallel_walks.get_worker_stats()
+
+# nWalk multi-objective walks, across worker processes when nWorkers > 1, their archives merged into one front
+# walk i starts from starts[i] when given, checkpoints as pareto_i and traces as pareto_i when given
+def run_pareto_walks(s_0 : dict, config : RunConfig, pbar=0, cache : EvaluationCache | None = None, checkpoints : RunCheckpoint | None = None, trace : TraceLog | None = None,
+                     cache_size : int = 100000, max_runs : int = 10000, starts : list[dict] | None = None) -> ParetoArchive:
+    encoding = get_encoding(s_0)
+    front = ParetoArchive(encoding.encode(s_0).shape)
+    starts = starts if starts is not None else [s_0]*config.nWalk
+    seeds = np.random.SeedSequence(np.random.randint(2**31)).generate_state(config.nWalk)
+    tasks = [(i, int(seeds[i]), config.T, config.kAnnealing, starts[i], checkpoints.walk(f"pareto_{i}") if checkpoints is not None else None,
+              trace.writer(f"pareto_{i:04d}", walk=i, state_size=encoding.size) if trace is not None else None) for i in range(config.nWalk)]
+    if config.nWorkers > 1:
+        with multiprocessing.Pool(processes=min(config.nWorkers, config.nWalk), initializer=parallel_walks.init_worker,
+                                  initargs=parallel_walks.get_init_args(config, cache, cache_size, max_runs)) as pool:
+            for walk_id, archive, stats in pool.imap_unordered(pareto_worker, tasks):
+                front.merge(archive)
+                parallel_walks.merge_worker_stats(stats, cache)
+                if pbar: # walks report back whole
+                    pbar.update(config.kAnnealing)
+    else:
+        for walk_id, seed, T, kMax, s_0, checkpoint, walk_trace in tasks:
+            np.random.seed(seed)
+            archive = ParetoArchive(front.X.shape[1:])
+            run_pareto_walk(T=T, kMax=kMax, s_0=s_0, archive=archive, pbar=pbar, cache=cache, checkpoint=checkpoint, trace=walk_trace, config=config)
+            front.merge(archive)
+    return front
+
+# writes the front with the highest bandwidth first
+def write_front(front : ParetoArchive, s_0 : dict, path : str) -> None:
+    encoding = get_encoding(s_0)
+    F = front.objectives()
+    with open(path, mode='w', newline='') as file:
+        writer = csv.writer(file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow([*OBJECTIVES, 'goodness', 'design'])
+        for i in np.argsort(F[:, 0], kind='stable'):
+            writer.writerow([-F[i, 0], F[i, 1], F[i, 2], front.goodness[i], encoding.decode(front.X[i])])
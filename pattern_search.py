@@ -0,0 +1,110 @@
+import numpy as np
+
+##########################################
+
+from simulated_annealing import get_encoding
+from eval_cache import EvaluationCache, evaluate
+from checkpoint import WalkCheckpoint
+from trace_log import TraceWriter
+from sensitivity import get_gradient
+from helper_funcs import RunConfig, get_config
+import instrumentation
+
+# first poll step in E48 steps, halved until a single step finds nothing better
+PATTERN_STEP = 8
+
+# Hooke-Jeeves pattern search over the flat E48 index of every free resistor
+# each sweep polls every resistor a step up and down, taking any improvement at once, then repeats the sweep's total move
+# the step halves after a sweep without improvement, the search ends below one step or after kMax simulations
+class PatternSearch:
+    def __init__(self, s_0 : dict, cache : EvaluationCache | None = None, config : RunConfig | None = None, step : int = PATTERN_STEP) -> None:
+        self.config = config if config is not None else get_config()
+        self.encoding = get_encoding(s_0)
+        self.cache = cache
+        self.x = self.encoding.flat(self.encoding.encode(s_0))
+        self.e = 0.0
+        self.step = step
+        self.evaluations = 0
+        self.sweeps = 0
+
+    # energy of the design at flat indices "x", a failed simulation is rejected like in run_walk
+    def __energy(self, x : np.ndarray, trace : TraceWriter | None = None) -> float:
+        s = self.encoding.decode(self.encoding.unflat(x))
+        try:
+            record = evaluate(s, self.cache, **self.config.analysis_options())
+        except: # catches errors in NgSpice
+            print(f"Something went wrong with: {s}")
+            if instrumentation.instruments is not None:
+                instrumentation.instruments.failure()
+            record = None
+        if trace is not None:
+            trace.record(self.evaluations, self.encoding.unflat(x), record)
+        self.evaluations += 1
+        return -record.goodness if record is not None else 0
+
+    # moves to "x" if it is better, clipped to the allowed resistor values
+    def __try(self, x : np.ndarray, trace : TraceWriter | None = None) -> bool:
+        x = np.clip(x, self.encoding.flat_min, self.encoding.flat_max)
+        if np.array_equal(x, self.x):
+            return False
+        e = self.__energy(x, trace)
+        if e < self.e:
+            self.x, self.e = x, e
+            return True
+        return False
+
+    # (resistor, direction) pairs to poll, the most sensitive resistor first and uphill first when guided by sensitivities
+    def __moves(self) -> list[tuple[int, int]]:
+        gradient = get_gradient(self.encoding.decode(self.encoding.unflat(self.x)), self.encoding, self.config) if self.config.sensitivityMoves else None
+        if gradient is None:
+            return [(j, sign) for j in range(self.encoding.size) for sign in (1, -1)]
+        order = np.argsort(-np.absolute(gradient), kind='stable')
+        return [(int(j), sign) for j in order for sign in ((1, -1) if gradient[j] >= 0 else (-1, 1))]
+
+    # one exploratory sweep and its pattern move, returns whether the design improved
+    def __sweep(self, kMax : int, trace : TraceWriter | None = None) -> bool:
+        base = self.x
+        moved = set()
+        for j, sign in self.__moves():
+            if self.evaluations >= kMax:
+                break
+            if j in moved: # the other direction already improved
+                continue
+            trial = self.x.copy()
+            trial[j] += sign*self.step
+            if self.__try(trial, trace):
+                moved.add(j)
+        improved = not np.array_equal(self.x, base)
+        if improved and self.evaluations < kMax: # keeps going the way the sweep went
+            self.__try(2*self.x - base, trace)
+        self.sweeps += 1
+        return improved
+
+    # runs until the step is below one or kMax simulations, returning the best design and energy
+    # the search checkpoints after every sweep, a resumed search repeats the unfinished sweep
+    def run(self, kMax : int, pbar=0, checkpoint : WalkCheckpoint | None = None, trace : TraceWriter | None = None) -> tuple[dict, float]:
+        state = checkpoint.load() if checkpoint is not None else None
+        if state is not None: # continues exactly where the checkpoint left off
+            self.x, self.e = state['x'], float(state['e'])
+            self.step, self.evaluations, self.sweeps = int(state['step']), int(state['evaluations']), int(state['sweeps'])
+            if not self.config.isVerbose and pbar:
+                pbar.update(self.evaluations)
+        if trace is not None: # records written after the checkpoint are written again
+            trace.truncate(self.evaluations - 1 if state is not None else -1)
+        if state is None:
+            self.e = self.__energy(self.x, trace)
+        while self.step >= 1 and self.evaluations < kMax:
+            evaluations = self.evaluations
+            if not self.__sweep(kMax, trace):
+                self.step //= 2
+            if self.config.isVerbose: # verbose printing
+                print(f"Sweep {self.sweeps}, Step: {self.step}, Simulations: {self.evaluations}, Energy: {self.e:.2E}")
+            if not self.config.isVerbose and pbar: # non verbose output
+                pbar.update(self.evaluations - evaluations)
+            if checkpoint is not None:
+                if trace is not None: # the trace on disk has to reach the checkpoint
+                    trace.flush()
+                checkpoint.save(x=self.x, e=self.e, step=self.step, evaluations=self.evaluations, sweeps=self.sweeps)
+        if trace is not None:
+            trace.flush()
+        return self.encoding.decode(self.encoding.unflat(self.x)), self.e
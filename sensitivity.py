@@ -0,0 +1,68 @@
+import numpy as np
+
+##########################################
+
+from ac_metrics import GAIN_HIGH, GAIN_LOW, DROP, get_edge_index
+from circuit_analysis import CircuitAnalyzer
+from design_encoding import DesignEncoding
+from netlist_template import get_resistor_names, get_path
+from helper_funcs import RunConfig
+
+# annealing steps a gradient is kept before the walk's state is differentiated again
+GRADIENT_INTERVAL = 10
+# mean move of the most sensitive resistor, in neighbour standard deviations
+GRADIENT_DRIFT = 1.0
+# smallest roll-off (log gain per log frequency) the bandwidth term is divided by
+MIN_SLOPE = 0.1
+# current the current goodness starts punishing at, as in CircuitAnalyzer
+CURRENT_LIMIT = 0.01
+
+# d ln(goodness)/d ln(R) of the resistor at each path, from the analyzer's NgSpice sensitivities
+# goodness is BW*OP_current_goodness, so the bandwidth and current terms add, resistors NgSpice gave nothing for stay at zero
+def get_log_gradient(analyzer : CircuitAnalyzer, paths : list[tuple]) -> np.ndarray:
+    names = get_resistor_names(analyzer.curr_dict, list(analyzer.curr_dict['trans'].values())[0])
+    R = np.array([get_path(analyzer.curr_dict, path) for path in paths])
+    gradient = np.zeros(len(paths))
+    # the bandwidth term needs the edge of the worst case tolerance, found above its first frequency
+    edge = None
+    if analyzer.goodness > 0:
+        frequency, gains = analyzer.frequencies[analyzer.key_min], analyzer.gains[analyzer.key_min]
+        index, punished = get_edge_index(gains)
+        if index > 0:
+            edge = int(index)
+    DC, AC = analyzer.get_sensitivities((frequency[0], frequency[edge]) if edge is not None else None)
+    if analyzer.OP_current > CURRENT_LIMIT:
+        # i(vvdc) flows into the supply, the current drawn is its negative
+        dI = -np.array([DC[names[path]][0] if names[path] in DC else 0 for path in paths])
+        gradient += -2*100**2*(analyzer.OP_current - CURRENT_LIMIT)/analyzer.OP_current_goodness*dI*R
+    if AC is not None:
+        H = analyzer.responses[analyzer.key_min][[0, edge]]
+        dH = np.array([AC[names[path]] if names[path] in AC else np.zeros(2) for path in paths])
+        # d ln|H|/d ln(R) at the DC and edge frequencies
+        dlnH = R[:, None]*np.real(np.conj(H)*dH)/np.absolute(H)**2
+        # the edge moves by the change in gain over the roll-off there
+        slope = max(abs(np.log(gains[edge]/gains[edge - 1])/np.log(frequency[edge]/frequency[edge - 1])), MIN_SLOPE)
+        if punished: # edge is the 1.5dB point, the DC gain is pulled back into the window
+            sign = 1 if gains[edge] <= gains[0]*DROP else -1
+            gradient += sign*(dlnH[:, 1] - dlnH[:, 0])/slope
+            gradient += np.sign(np.log(np.sqrt(GAIN_HIGH*GAIN_LOW)/gains[0]))*dlnH[:, 0]
+        else: # edge is where the gain leaves the window, falling below it or peaking above it
+            sign = 1 if gains[edge] < GAIN_LOW else -1
+            gradient += sign*dlnH[:, 1]/slope
+    return gradient
+
+# gradient of ln(goodness) over one E48 step of each free resistor, None when NgSpice can not differentiate the design
+def get_gradient(s : dict, encoding : DesignEncoding, config : RunConfig) -> np.ndarray | None:
+    try:
+        analyzer = CircuitAnalyzer(s, keep_simulators=True, **config.analysis_options())
+        if analyzer.prefiltered: # never simulated
+            return None
+        return get_log_gradient(analyzer, encoding.paths)*np.log(10)/encoding.len_valid_res
+    except: # catches errors in NgSpice, the walk moves blindly instead
+        return None
+
+# mean of neighbour's steps, the most sensitive resistor moves GRADIENT_DRIFT standard deviations uphill
+def get_drift(gradient : np.ndarray | None, sd : float, size : int) -> np.ndarray:
+    if gradient is None or not np.any(gradient):
+        return np.zeros(size)
+    return GRADIENT_DRIFT*sd*gradient/np.max(np.absolute(gradient))
@@ -1,8 +1,15 @@
 import numpy as np
 from PySpice.Unit import *
 from circuit_analysis import *
+from eval_cache import EvaluationCache, evaluate
+from design_encoding import DesignEncoding
+from checkpoint import WalkCheckpoint
+from trace_log import TraceWriter
 from tqdm import tqdm
-from helper_funcs import single
+from helper_funcs import RunConfig, get_config
+from sensitivity import GRADIENT_INTERVAL, get_gradient, get_drift
+import instrumentation
+import surrogate
 
 # annealing schedule
 def temperature(T, b):
@@ -19,6 +26,23 @@ def P(E_past, E_new, T):
         return 1/(1 + np.exp(100*(1-ratio)/T)) > np.random.random()
     else:
         return False
+
+# whether P could accept E_new at all, without drawing a random number
+def may_accept(E_past, E_new, T):
+    if(E_new >= -1):
+        return False
+    ratio = E_new/E_past
+    return ratio >= 1 or (T != 0 and 4 > 100*(1-ratio)/T)
+
+# whether a proposal can go unsimulated, i.e. P would reject even the surrogate's optimistic energy for it
+def is_hopeless(model : surrogate.Surrogate | None, log_values : np.ndarray, E_past : float, T : float) -> bool:
+    if model is None:
+        return False
+    optimistic = model.optimistic_energy(log_values)
+    if optimistic is None or may_accept(E_past, optimistic, T):
+        return False
+    surrogate.counts['skipped'] += 1
+    return True
     
 # specify design variables 
 free_vars = ['RF','cascode1','cascode2','outStage']
@@ -70,43 +94,105 @@ def iter_resistor(R,n):
     else:
         return return_val
 
+# compact encoding of the free resistors of designs shaped like "s_0"
+def get_encoding(s_0 : dict) -> DesignEncoding:
+    return DesignEncoding(s_0, free_vars, free_vars_dict, valid_res)
+
 # runs a simulated annealing walk 
-def run_walk(T : float, kMax : int, s_0 : dict, pbar=0):
-    s = s_0.copy()
-    sbest = s.copy()
-    e = -CircuitAnalyzer(s).goodness
-    ebest = e
-    if T != 0: # accounts for zero temp (greedy random)
-        b = T**(-2/kMax)
+def run_walk(T : float, kMax : int, s_0 : dict, pbar=0, cache : EvaluationCache | None = None, checkpoint : WalkCheckpoint | None = None, trace : TraceWriter | None = None,
+             config : RunConfig | None = None):
+    config = config if config is not None else get_config()
+    # the walk moves through compact encoded states, decoding only for simulation
+    encoding = get_encoding(s_0)
+    # learns the walk's evaluations to skip simulating proposals P would reject anyway
+    model = surrogate.get_surrogate(config, encoding.size)
+    # guided moves drift up the goodness gradient of the state it was last taken at
+    drift, drift_x, drift_step = np.zeros(encoding.size), None, 0
+    state = checkpoint.load() if checkpoint is not None else None
+    if state is not None: # continues exactly where the checkpoint left off
+        x, xbest = state['x'], state['xbest']
+        e, ebest = float(state['e']), float(state['ebest'])
+        T, b = float(state['T']), float(state['b'])
+        start = int(state['step'])
+        if model is not None and 'surrogate_y' in state:
+            model.restore(state)
+        if config.sensitivityMoves and 'drift' in state:
+            drift, drift_x, drift_step = state['drift'], state['drift_x'], int(state['drift_step'])
+        if not config.isVerbose and pbar:
+            pbar.update(start)
     else:
-        b = 0
-
-    for i in range(kMax):
+        x = encoding.encode(s_0)
+        xbest = x
+        record = evaluate(s_0, cache, **config.analysis_options())
+        e = -record.goodness
+        ebest = e
+        if model is not None:
+            model.add(encoding.log_values(x), record.goodness)
+        if config.sensitivityMoves:
+            drift, drift_x = get_drift(get_gradient(s_0, encoding, config), config.sigma, encoding.size), x
+        if T != 0: # accounts for zero temp (greedy random)
+            b = T**(-2/kMax)
+        else:
+            b = 0
+        start = 0
+    if trace is not None: # records written after the checkpoint are written again
+        trace.truncate(start if state is not None else -1)
+        if state is None:
+            trace.record(0, x, record)
+
+    for i in range(start, kMax):
         # annealing schedule
         T = temperature(T, b=b)
+        # differentiates the current state again once the old gradient is stale
+        if config.sensitivityMoves and i - drift_step >= GRADIENT_INTERVAL and not np.array_equal(x, drift_x):
+            drift, drift_x, drift_step = get_drift(get_gradient(encoding.decode(x), encoding, config), config.sigma, encoding.size), x, i
         # generates a nearby state
-        snew = neighbour(s=s, free_vars=free_vars, sd=single.sigma)
-        try: # simulates the circuit and calculates goodness
-            enew = -CircuitAnalyzer(snew).goodness 
-        except: # catches errors in NgSpice
-            print(f"Something went wrong with: {snew}")
+        xnew = encoding.neighbour(x, sd=config.sigma, mean=drift)
+        log_values = encoding.log_values(xnew) if model is not None else None
+        if is_hopeless(model, log_values, e, T): # rejected without simulating, like a failed design
             enew = 0
+        else:
+            snew = encoding.decode(xnew)
+            try: # simulates the circuit and calculates goodness
+                record = evaluate(snew, cache, **config.analysis_options())
+                enew = -record.goodness 
+            except: # catches errors in NgSpice
+                print(f"Something went wrong with: {snew}")
+                if instrumentation.instruments is not None:
+                    instrumentation.instruments.failure()
+                record = None
+                enew = 0
+            if model is not None:
+                model.add(log_values, -enew)
+            if trace is not None:
+                trace.record(i + 1, xnew, record)
         
-        if P(e, enew, T): # acceptance 
-            s = snew.copy()
+        accepted = P(e, enew, T)
+        if accepted: # acceptance 
+            x = xnew
             e = enew
+        if instrumentation.instruments is not None:
+            instrumentation.instruments.step(accepted)
 
         if enew < ebest: # records best
-            sbest = snew.copy()
+            xbest = xnew
             ebest = enew
 
-        if single.isVerbose and i%100 == 0: # verbose printing
+        if config.isVerbose and i%100 == 0: # verbose printing
             print(f"{round(i/kMax*100)}% Complete")
             print(f"Current Energy: {e:.2E}")
             print(f"    New Energy: {enew:.2E}")
             print()
 
-        if not single.isVerbose: # non verbose output
+        if not config.isVerbose and pbar: # non verbose output
             pbar.update()
 
-    return sbest, ebest
\ No newline at end of file
+        if checkpoint is not None and checkpoint.is_due(i, kMax): # saves the walk after the step is complete
+            if trace is not None: # the trace on disk has to reach the checkpoint
+                trace.flush()
+            checkpoint.save(step=i + 1, x=x, e=e, T=T, b=b, xbest=xbest, ebest=ebest, **(model.state() if model is not None else {}),
+                            **({'drift' : drift, 'drift_x' : drift_x, 'drift_step' : drift_step} if config.sensitivityMoves else {}))
+
+    if trace is not None:
+        trace.flush()
+    return encoding.decode(xbest), ebest
\ No newline at end of file
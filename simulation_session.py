@@ -0,0 +1,135 @@
+from cffi import FFI
+
+##########################################
+
+import PySpice
+from PySpice.Spice.NgSpice.Shared import NgSpiceShared
+from PySpice.Spice.NgSpice.Simulation import NgSpiceSharedCircuitSimulator
+
+# PySpice releases whose private NgSpiceShared internals forget_inherited_ngspice and reset_command_history reach into
+PYSPICE_VERSIONS = ('1.5',)
+
+# fails loudly instead of letting a PySpice upgrade silently break the private access below
+def check_pyspice_version() -> None:
+    if PySpice.__version__ not in PYSPICE_VERSIONS:
+        raise RuntimeError(f"PySpice {PySpice.__version__} is untested, simulation_session reaches into the internals of PySpice {', '.join(PYSPICE_VERSIONS)}")
+
+# drops the ngspice instance a forked process inherited, so the next new_instance loads a fresh one of its own
+def forget_inherited_ngspice() -> None:
+    check_pyspice_version()
+    NgSpiceShared._instances.clear()
+
+# clears ngspice's command history, which PySpice has no call for
+def reset_command_history(ngspice : NgSpiceShared) -> None:
+    check_pyspice_version()
+    ngspice._ngspice_shared.ngSpice_Command(FFI.NULL)
+
+# ngspice command for the AC sweeps CircuitAnalyzer asks for
+def ac_command(start_frequency, stop_frequency, number_of_points, variation='dec') -> str:
+    return f"ac {variation} {number_of_points} {float(start_frequency)} {float(stop_frequency)}"
+
+# ngspice command for the DC sensitivity of "output", or its AC sensitivity when given ac_command's arguments
+def sens_command(output : str, *args, **kwargs) -> str:
+    return f"sens {output} {ac_command(*args, **kwargs)}" if args or kwargs else f"sens {output}"
+
+# owns the process's ngspice instance and everything loaded into it
+class SimulationSession:
+    def __init__(self, max_runs : int = 10000, ngspice : NgSpiceShared | None = None) -> None:
+        self.ngspice = ngspice if ngspice is not None else NgSpiceShared.new_instance()
+        # analyses allowed before ngspice's memory is released
+        self.max_runs = max_runs
+        self.runs = 0
+        self.total_runs = 0
+        self.releases = 0
+        # owner of the circuit ngspice currently holds
+        self.loaded = None
+        # compiled netlist templates living in this instance
+        self.templates = dict()
+
+    # simulator for a PySpice circuit whose analyses go through this session
+    def simulator(self, circuit, temperature = 25) -> 'SessionSimulator':
+        simulator = NgSpiceSharedCircuitSimulator(circuit, ngspice_shared=self.ngspice, temperature=temperature, nominal_temperature=temperature)
+        return SessionSimulator(self, simulator)
+
+    # whether "owner" still has its circuit loaded, releasing memory first when due
+    def holds(self, owner) -> bool:
+        if self.runs >= self.max_runs:
+            self.release()
+        return owner is not None and self.loaded is owner
+
+    # replaces the loaded circuit so old circuits don't pile up inside ngspice
+    def load(self, netlist : str, owner) -> None:
+        if self.holds(owner):
+            return
+        if self.loaded is not None:
+            self.ngspice.remove_circuit()
+            self.loaded = None
+        self.ngspice.destroy()
+        self.ngspice.load_circuit(netlist)
+        self.loaded = owner
+
+    # runs an analysis command on the loaded circuit and converts it like PySpice's simulator does
+    def run(self, command : str, simulator : NgSpiceSharedCircuitSimulator):
+        self.ngspice.destroy()
+        self.runs += 1
+        self.total_runs += 1
+        self.ngspice.exec_command(command)
+        plot_name = self.ngspice.last_plot
+        if plot_name == 'const':
+            raise NameError('Simulation failed')
+        return self.ngspice.plot(simulator, plot_name).to_analysis()
+
+    # releases the loaded circuit, every plot and ngspice's command history, ngspice itself stays the same instance
+    # ngspice is loaded once per process, so a new NgSpiceShared would reinitialise the same library rather than start clean
+    def release(self) -> None:
+        if self.loaded is not None:
+            self.ngspice.remove_circuit()
+            self.loaded = None
+        self.ngspice.destroy()
+        reset_command_history(self.ngspice)
+        self.runs = 0
+        self.releases += 1
+
+# the operating_point/ac calls of a PySpice simulator, routed through a session
+class SessionSimulator:
+    def __init__(self, session : SimulationSession, simulator : NgSpiceSharedCircuitSimulator) -> None:
+        self.session = session
+        self.simulator = simulator
+        self.__netlist = None
+
+    def save(self, *args) -> None:
+        self.simulator.save(*args)
+        self.__netlist = None
+
+    # the netlist is generated once and shared by the DC and AC analyses
+    def compile(self) -> str:
+        if self.__netlist is None:
+            self.__netlist = str(self.simulator)
+        return self.__netlist
+
+    def __load(self) -> None:
+        self.session.load(self.compile(), owner=self)
+
+    def operating_point(self):
+        self.__load()
+        return self.session.run('op', self.simulator)
+
+    def ac(self, *args, **kwargs):
+        self.__load()
+        return self.session.run(ac_command(*args, **kwargs), self.simulator)
+
+    def sensitivity(self, output : str, *args, **kwargs):
+        self.__load()
+        return self.session.run(sens_command(output, *args, **kwargs), self.simulator)
+
+# one session per process, created on first use
+session = None
+def get_session() -> SimulationSession:
+    global session
+    if session is None:
+        session = SimulationSession()
+    return session
+
+def set_session(new_session : SimulationSession | None) -> None:
+    global session
+    session = new_session
@@ -0,0 +1,281 @@
+import numpy as np
+
+##########################################
+
+from PySpice.Spice.BasicElement import Resistor, Capacitor, VoltageSource, BipolarJunctionTransistor, SubCircuitElement
+
+##########################################
+
+from subcircuit_def import get_amp_circuit
+from netlist_template import get_resistor_names, get_path
+from spice_models import get_model_params
+from ac_metrics import get_AC_arrays
+
+# transistor vectors of the operating point the small signal network is biased from, saved as @q...[ic] and so on
+OP_PARAMS = ('ic', 'vbe', 'vbc')
+# k/q in volts per kelvin
+THERMAL_VOLTAGE = 8.617333262e-5
+# conductance standing in for a zero ohm series resistance of the model card
+GMAX = 1e9
+# largest difference in dB between the small signal and ngspice gains before a check counts as a mismatch
+AC_TOLERANCE = 0.1
+# share of mismatched checks warned about, once at least MISMATCH_MIN_CHECKS sweeps were checked
+MISMATCH_WARN_RATE = 0.05
+MISMATCH_MIN_CHECKS = 20
+
+# gummel-poon parameters the hybrid-pi model reads, with SPICE's defaults for the ones a model card leaves out
+MODEL_DEFAULTS = {'IS' : 1e-16, 'BF' : 100, 'NF' : 1, 'VAF' : np.inf, 'ISE' : 0, 'NE' : 1.5, 'BR' : 1, 'NR' : 1, 'VAR' : np.inf, 'ISC' : 0, 'NC' : 2,
+                  'RB' : 0, 'RE' : 0, 'RC' : 0, 'CJE' : 0, 'VJE' : 0.75, 'MJE' : 0.33, 'TF' : 0, 'CJC' : 0, 'VJC' : 0.75, 'MJC' : 0.33, 'TR' : 0, 'FC' : 0.5}
+
+# fast AC solves, the ones that fell back to ngspice for want of transistor vectors, and the ones checked against ngspice in this process
+counts = {'fast' : 0, 'fallback' : 0, 'checked' : 0, 'mismatched' : 0}
+# whether this process warned about the mismatch rate yet
+warned = False
+
+# every resistor, capacitor, voltage source and transistor of "circuit" as (kind, name, nodes, value), subcircuits expanded the way ngspice names them
+# R rrb1 in Xin_Stage of Xfbamp1 is ('R', 'r.xfbamp1.xin_stage.rrb1', ('vcc', 'xfbamp1.xin_stage.vb'), 205000.0), a source's value is its AC magnitude
+def flatten(circuit) -> list[tuple[str, str, tuple[str, ...], object]]:
+    elements = []
+    def expand(container, scope : dict, path : str, ports : dict[str, str]) -> None:
+        # subcircuits defined here shadow the ones of the same name outside
+        scope = {**scope, **{subcircuit.name.lower() : subcircuit for subcircuit in container.subcircuits}}
+        for element in container.elements:
+            nodes = tuple(ports.get(str(node).lower(), f"{path}.{str(node).lower()}" if path and str(node) != '0' else str(node).lower()) for node in element.nodes)
+            name = element.name.lower()
+            flat_name = f"{name[0]}.{path}.{name}" if path else name
+            if isinstance(element, SubCircuitElement):
+                definition = scope[element.subcircuit_name.lower()]
+                expand(definition, scope, f"{path}.{name}" if path else name, dict(zip((node.lower() for node in definition.external_nodes), nodes)))
+            elif isinstance(element, Resistor):
+                elements.append(('R', flat_name, nodes, float(element.resistance)))
+            elif isinstance(element, Capacitor):
+                elements.append(('C', flat_name, nodes, float(element.capacitance)))
+            elif isinstance(element, VoltageSource):
+                ac_magnitude = getattr(element, 'ac_magnitude', None)
+                elements.append(('V', flat_name, nodes, float(ac_magnitude) if ac_magnitude is not None else 0.0))
+            elif isinstance(element, BipolarJunctionTransistor):
+                elements.append(('Q', flat_name, nodes, element.model))
+            else:
+                raise ValueError(f"No small signal model for {element.name}")
+    expand(circuit, dict(), '', dict())
+    return elements
+
+# the SPICE depletion capacitance of a junction at bias v, linear past fc*vj where the power law blows up
+def depletion_capacitance(c0 : float, vj : float, m : float, fc : float, v : np.ndarray) -> np.ndarray:
+    v = np.asarray(v, dtype=float)
+    forward = c0/(1 - fc)**(1 + m)*(1 - fc*(1 + m) + m*v/vj)
+    reverse = c0*(1 - np.minimum(v, fc*vj)/vj)**-m
+    return np.where(v < fc*vj, reverse, forward)
+
+# hybrid-pi elements of transistors sharing one model card, from each one's collector current and junction voltages
+# Ic = If*(1 - Vbc/VAF - Vbe/VAR) as in gummel-poon without high injection, gm is taken at constant Vce so the Early effect is all in go
+def get_hybrid_pi(params : dict[str, float], ic : np.ndarray, vbe : np.ndarray, vbc : np.ndarray, temperature = 25) -> dict[str, np.ndarray]:
+    p = {**MODEL_DEFAULTS, **params}
+    vt = THERMAL_VOLTAGE*(temperature + 273.15)
+    ic, vbe, vbc = (np.asarray(x, dtype=float) for x in (ic, vbe, vbc))
+    early = 1 - vbc/p['VAF'] - vbe/p['VAR']
+    i_forward = ic/early
+    g_forward = i_forward/(p['NF']*vt)
+    g_reverse = p['IS']*np.exp(vbc/(p['NR']*vt))/(p['NR']*vt)
+    go = i_forward/p['VAF']
+    return {
+        'gm' : early*g_forward - i_forward/p['VAR'] - go,
+        'go' : go,
+        'gpi' : g_forward/p['BF'] + p['ISE']*np.exp(vbe/(p['NE']*vt))/(p['NE']*vt),
+        'gmu' : g_reverse/p['BR'] + p['ISC']*np.exp(vbc/(p['NC']*vt))/(p['NC']*vt),
+        'cpi' : p['TF']*g_forward + depletion_capacitance(p['CJE'], p['VJE'], p['MJE'], p['FC'], vbe),
+        'cmu' : p['TR']*g_reverse + depletion_capacitance(p['CJC'], p['VJC'], p['MJC'], p['FC'], vbc),
+        # series resistances, taken as a near short when the card has none
+        'gb' : 1/p['RB'] if p['RB'] > 0 else GMAX,
+        'ge' : 1/p['RE'] if p['RE'] > 0 else GMAX,
+        'gc' : 1/p['RC'] if p['RC'] > 0 else GMAX,
+    }
+
+# points of an ngspice AC sweep
+def get_frequencies(start_frequency, stop_frequency, number_of_points : int, variation : str = 'dec') -> np.ndarray:
+    start, stop = float(start_frequency), float(stop_frequency)
+    if variation == 'dec':
+        return start*10**(np.arange(int(np.floor(np.log10(stop/start)*number_of_points + 1e-9)) + 1)/number_of_points)
+    if variation == 'oct':
+        return start*2**(np.arange(int(np.floor(np.log2(stop/start)*number_of_points + 1e-9)) + 1)/number_of_points)
+    return np.linspace(start, stop, number_of_points)
+
+# modified nodal analysis of the amplifier netlist linearised about an operating point
+# unknowns are the node voltages, each transistor's internal collector, base and emitter and the current of each voltage source
+# like the netlist template only resistor values follow the design, the rest of the topology is read once
+class SmallSignalNetwork:
+    def __init__(self, curr_dict : dict, trans : str) -> None:
+        elements = flatten(get_amp_circuit(curr_dict, trans))
+        paths = {name : path for path, name in get_resistor_names(curr_dict, trans).items()}
+        self.index = {'0' : 0} # ground is row 0, dropped before solving
+        def node(name : str) -> int:
+            return self.index.setdefault(name, len(self.index))
+        by_kind = {kind : [(name, nodes, value) for k, name, nodes, value in elements if k == kind] for kind in 'RCVQ'}
+        self.R_nodes = np.array([[node(a), node(b)] for _, (a, b), _ in by_kind['R']], dtype=np.int64)
+        self.R_values = np.array([value for _, _, value in by_kind['R']])
+        # design dictionary path of each resistor the optimizer changes
+        self.R_paths = [(i, paths[name]) for i, (name, _, _) in enumerate(by_kind['R']) if name in paths]
+        self.C_nodes = np.array([[node(a), node(b)] for _, (a, b), _ in by_kind['C']], dtype=np.int64)
+        self.C_values = np.array([value for _, _, value in by_kind['C']])
+        self.transistors = [name for name, _, _ in by_kind['Q']]
+        # external collector, base and emitter then the internal ones behind the series resistances
+        self.Q_nodes = np.array([[node(n) for n in nodes] + [node(f"{name}#{pin}") for pin in 'cbe'] for name, nodes, _ in by_kind['Q']], dtype=np.int64)
+        n_nodes = len(self.index)
+        self.V_nodes = np.array([[node(a), node(b)] for _, (a, b), _ in by_kind['V']], dtype=np.int64)
+        self.V_rows = n_nodes + np.arange(len(by_kind['V']))
+        self.V_values = np.array([value for _, _, value in by_kind['V']])
+        self.size = n_nodes + len(by_kind['V'])
+        self.output = self.index['ac_out']
+
+    # @q...[ic] style vectors the operating point has to save, named for the amplifier "instance" of the netlist
+    def saves(self, instance : str = 'xfbamp1') -> list[str]:
+        return [f"@{name.replace('.xfbamp1.', f'.{instance}.')}[{param}]" for name in self.transistors for param in OP_PARAMS]
+
+    # conductance and capacitance matrices of the design linearised about "hybrid_pi"
+    def matrices(self, curr_dict : dict, hybrid_pi : dict[str, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+        G = np.zeros((self.size, self.size))
+        C = np.zeros((self.size, self.size))
+        R_values = self.R_values.copy()
+        for i, path in self.R_paths:
+            R_values[i] = get_path(curr_dict, path)
+        stamp(G, self.R_nodes, 1/R_values)
+        stamp(C, self.C_nodes, self.C_values)
+        c, b, e, ci, bi, ei = self.Q_nodes.T
+        n = len(self.transistors)
+        stamp(G, np.stack((b, bi), axis=1), np.broadcast_to(hybrid_pi['gb'], n))
+        stamp(G, np.stack((e, ei), axis=1), np.broadcast_to(hybrid_pi['ge'], n))
+        stamp(G, np.stack((c, ci), axis=1), np.broadcast_to(hybrid_pi['gc'], n))
+        stamp(G, np.stack((bi, ei), axis=1), hybrid_pi['gpi'])
+        stamp(G, np.stack((bi, ci), axis=1), hybrid_pi['gmu'])
+        stamp(G, np.stack((ci, ei), axis=1), hybrid_pi['go'])
+        stamp(C, np.stack((bi, ei), axis=1), hybrid_pi['cpi'])
+        stamp(C, np.stack((bi, ci), axis=1), hybrid_pi['cmu'])
+        # gm*(Vb' - Ve') flows from the internal collector to the internal emitter
+        gm = hybrid_pi['gm']
+        np.add.at(G, (ci, bi), gm)
+        np.add.at(G, (ci, ei), -gm)
+        np.add.at(G, (ei, bi), -gm)
+        np.add.at(G, (ei, ei), gm)
+        # each voltage source's current is an unknown of its own, its row holds the source
+        for (a, b), row in zip(self.V_nodes, self.V_rows):
+            G[a, row] += 1
+            G[b, row] -= 1
+            G[row, a] += 1
+            G[row, b] -= 1
+        return G[1:, 1:], C[1:, 1:]
+
+    # AC_out at every frequency, all of them in one batched solve of (G + jwC)x = b
+    def solve(self, curr_dict : dict, hybrid_pi : dict[str, np.ndarray], frequency : np.ndarray) -> np.ndarray:
+        G, C = self.matrices(curr_dict, hybrid_pi)
+        sources = np.zeros(self.size)
+        sources[self.V_rows] = self.V_values
+        A = G[None] + 2j*np.pi*np.asarray(frequency, dtype=float)[:, None, None]*C[None]
+        x = np.linalg.solve(A, np.broadcast_to(sources[1:], (len(frequency), self.size - 1))[..., None])[..., 0]
+        return x[:, self.output - 1]
+
+# adds conductances (or capacitances) "values" between each pair of "nodes"
+def stamp(matrix : np.ndarray, nodes : np.ndarray, values : np.ndarray) -> None:
+    a, b = nodes[:, 0], nodes[:, 1]
+    np.add.at(matrix, (a, a), values)
+    np.add.at(matrix, (b, b), values)
+    np.add.at(matrix, (a, b), -values)
+    np.add.at(matrix, (b, a), -values)
+
+# one network per transistor model in this process, the topology is the same for every design
+networks = dict()
+def get_network(curr_dict : dict, trans : str) -> SmallSignalNetwork:
+    if trans not in networks:
+        networks[trans] = SmallSignalNetwork(curr_dict, trans)
+    return networks[trans]
+
+# value of an operating point vector, from PySpice's internal parameters or the nodes of a raw file plot, None when it was not saved
+def get_op_vector(analysis, name : str) -> float | None:
+    for vectors in (getattr(analysis, 'internal_parameters', None), getattr(analysis, 'nodes', None)):
+        for key, value in (vectors or dict()).items():
+            if key.lower() == name:
+                return float(np.asarray(value, dtype=float).ravel()[0])
+    return None
+
+# AC sweep of the small signal network, read like an ngspice AC analysis
+class SmallSignalAnalysis:
+    def __init__(self, frequency : np.ndarray, AC_out : np.ndarray) -> None:
+        self.frequency = frequency
+        self.AC_out = AC_out
+
+# answers the AC analyses CircuitAnalyzer asks for from one design's operating point, without ngspice
+class SmallSignalSimulator:
+    def __init__(self, network : SmallSignalNetwork, curr_dict : dict, hybrid_pi : dict[str, np.ndarray]) -> None:
+        self.network = network
+        self.curr_dict = curr_dict
+        self.hybrid_pi = hybrid_pi
+
+    def solve(self, frequency : np.ndarray) -> np.ndarray:
+        return self.network.solve(self.curr_dict, self.hybrid_pi, frequency)
+
+    def ac(self, start_frequency, stop_frequency, number_of_points : int, variation : str = 'dec') -> SmallSignalAnalysis:
+        frequency = get_frequencies(start_frequency, stop_frequency, number_of_points, variation)
+        return SmallSignalAnalysis(frequency, self.solve(frequency))
+
+# transistor vectors the operating point of "trans" has to save for the small signal solve, in the amplifier "instance" of the netlist
+def get_op_saves(curr_dict : dict, trans : str, instance : str = 'xfbamp1') -> list[str]:
+    return get_network(curr_dict, trans).saves(instance)
+
+# small signal simulator of one transistor corner biased at "op", None when the operating point lacks the transistor vectors
+# "params" overrides the model card like CircuitAnalyzer's model_params
+def get_small_signal_simulator(curr_dict : dict, trans : str, op, params : dict[str, float] | None = None, temperature = 25) -> SmallSignalSimulator | None:
+    network = get_network(curr_dict, trans)
+    values = dict()
+    for param in OP_PARAMS:
+        values[param] = [get_op_vector(op, f"@{name}[{param}]") for name in network.transistors]
+        if None in values[param]:
+            return None
+    card = get_model_params(trans)
+    if params:
+        card = {**card, **{key.upper() : value for key, value in params.items()}}
+    return SmallSignalSimulator(network, curr_dict, get_hybrid_pi(card, values['ic'], values['vbe'], values['vbc'], temperature))
+
+# counts one fast solve, True when it is the one in every "interval" to be checked against ngspice
+def is_check_due(interval : int) -> bool:
+    counts['fast'] += 1
+    return interval > 0 and counts['fast'] % interval == 0
+
+# counts a check of the small signal gains of every corner against ngspice's, a mismatch when any is more than AC_TOLERANCE dB off
+# returns whether the gains matched, the checked design is scored from ngspice's sweeps either way
+def check_AC(simulators : dict[str, SmallSignalSimulator], AC_analyses : dict) -> bool:
+    worst = 0.0
+    for key, analysis in AC_analyses.items():
+        frequency, AC_out = get_AC_arrays(analysis)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            error = np.abs(20*np.log10(np.absolute(simulators[key].solve(frequency))/np.absolute(AC_out)))
+        worst = max(worst, float(np.nanmax(error)) if len(error) else 0.0)
+    counts['checked'] += 1
+    matched = worst <= AC_TOLERANCE # an infinite error fails too
+    if not matched:
+        counts['mismatched'] += 1
+        warn_mismatch_rate()
+    return matched
+
+# warns once when too many checks failed, the unchecked designs are scored from a solver that disagrees with ngspice
+def warn_mismatch_rate() -> None:
+    global warned
+    if not warned and counts['checked'] >= MISMATCH_MIN_CHECKS and counts['mismatched'] > MISMATCH_WARN_RATE*counts['checked']:
+        warned = True
+        print(f"Warning: {counts['mismatched']} of {counts['checked']} fast AC sweeps were over {AC_TOLERANCE} dB off ngspice, consider running without fastAC")
+
+# counts since the last drain, sent back by worker processes
+def drain_counts() -> dict[str, int]:
+    drained = dict(counts)
+    for name in counts:
+        counts[name] = 0
+    return drained
+
+# worker processes drain their counts often, so the parent judges the mismatch rate of the whole run
+def merge_counts(other : dict[str, int]) -> None:
+    for name, n in other.items():
+        counts[name] += n
+    warn_mismatch_rate()
+
+def report() -> str:
+    rate = counts['mismatched']/counts['checked'] if counts['checked'] else 0
+    return (f"{counts['fast']} AC sweeps solved from the operating point, {counts['checked']} of them checked against ngspice with "
+            f"{counts['mismatched']} over {AC_TOLERANCE} dB ({rate:.1%}), {counts['fallback']} simulated for want of transistor vectors")
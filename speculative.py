@@ -0,0 +1,166 @@
+import multiprocessing
+import numpy as np
+
+##########################################
+
+import parallel_walks
+from simulated_annealing import P, temperature, get_encoding, is_hopeless
+from parallel_tempering import get_evaluation, get_evaluations, evaluation_worker
+from eval_cache import CachedEvaluation, EvaluationCache, get_mode
+from checkpoint import WalkCheckpoint
+from trace_log import TraceWriter
+from sensitivity import GRADIENT_INTERVAL, get_gradient, get_drift
+from helper_funcs import RunConfig, get_config
+import instrumentation
+import surrogate
+
+# chain steps, rounds of concurrent evaluations and evaluations of every speculative walk in this process
+counts = {'steps' : 0, 'rounds' : 0, 'evaluations' : 0}
+
+# steps the chains advanced per round, the speedup over evaluating one proposal at a time, and the share of evaluations the chains used
+def report() -> str:
+    speedup = counts['steps']/counts['rounds'] if counts['rounds'] else 0
+    used = counts['steps']/counts['evaluations'] if counts['evaluations'] else 0
+    return f"{counts['steps']} steps in {counts['rounds']} rounds, {speedup:.2f}x effective speedup, {used:.0%} of {counts['evaluations']} evaluations used"
+
+# one annealing chain that evaluates its next K proposals together and commits the first that P accepts
+# every proposal of a round is drawn from the same state, which is the state each of them would be drawn from had the ones before it been rejected
+# so a round is the same as up to K sequential steps, the proposals after the accepted one are thrown away unseen
+class SpeculativeWalk:
+    def __init__(self, s_0 : dict, K : int, nWorkers : int = 1, cache : EvaluationCache | None = None, cache_size : int = 100000, max_runs : int = 10000,
+                 config : RunConfig | None = None) -> None:
+        self.config = config if config is not None else get_config()
+        self.s_0 = s_0
+        self.K = K
+        self.nWorkers = min(nWorkers, K)
+        self.cache = cache
+        self.cache_size = cache_size
+        self.max_runs = max_runs
+        self.encoding = get_encoding(s_0)
+        self.model = surrogate.get_surrogate(self.config, self.encoding.size)
+        self.steps = 0
+        self.rounds = 0
+        self.evaluations = 0
+
+    # records of a round's designs in order, the parent's cache first and the rest across the pool
+    def __evaluate(self, designs : list[dict], pool) -> list[CachedEvaluation | None]:
+        if self.config.ngspiceBatch: # the round's ngspice processes run side by side
+            return get_evaluations(designs, self.cache, self.config, self.nWorkers)
+        if pool is None:
+            return [get_evaluation(s, self.cache, self.config) for s in designs]
+        mode = get_mode(self.config.analysis_options())
+        records = [self.cache.get(s, mode) if self.cache is not None else None for s in designs]
+        misses = [j for j, record in enumerate(records) if record is None]
+        for j, (record, stats) in zip(misses, pool.map(evaluation_worker, [designs[j] for j in misses], chunksize=1)):
+            records[j] = record
+            parallel_walks.merge_worker_stats(stats)
+            if record is not None and self.cache is not None:
+                self.cache.put(designs[j], record, mode)
+        return records
+
+    # runs kMax steps of annealing from T, returning the best design and energy like run_walk
+    # rounds stop at checkpoint boundaries, so a checkpoint is always taken where run_walk would take it
+    def run(self, T : float, kMax : int, pbar=0, checkpoint : WalkCheckpoint | None = None, trace : TraceWriter | None = None) -> tuple[dict, float]:
+        config, encoding, model = self.config, self.encoding, self.model
+        drift, drift_x, drift_step = np.zeros(encoding.size), None, 0
+        state = checkpoint.load() if checkpoint is not None else None
+        if state is not None: # continues exactly where the checkpoint left off
+            x, xbest = state['x'], state['xbest']
+            e, ebest = float(state['e']), float(state['ebest'])
+            T, b = float(state['T']), float(state['b'])
+            self.steps, self.rounds, self.evaluations = int(state['step']), int(state['rounds']), int(state['evaluations'])
+            if model is not None and 'surrogate_y' in state:
+                model.restore(state)
+            if config.sensitivityMoves and 'drift' in state:
+                drift, drift_x, drift_step = state['drift'], state['drift_x'], int(state['drift_step'])
+            if not config.isVerbose and pbar:
+                pbar.update(self.steps)
+        else:
+            x = encoding.encode(self.s_0)
+            xbest = x
+            record = get_evaluation(self.s_0, self.cache, config)
+            e = -record.goodness if record is not None else 0
+            ebest = e
+            if model is not None:
+                model.add(encoding.log_values(x), -e)
+            if config.sensitivityMoves:
+                drift, drift_x = get_drift(get_gradient(self.s_0, encoding, config), config.sigma, encoding.size), x
+            b = T**(-2/kMax) if T != 0 else 0
+        if trace is not None: # records written after the checkpoint are written again
+            trace.truncate(self.steps if state is not None else -1)
+            if state is None:
+                trace.record(0, x, record)
+        pool = None
+        if self.nWorkers > 1 and not config.ngspiceBatch:
+            pool = multiprocessing.Pool(processes=self.nWorkers, initializer=parallel_walks.init_worker, initargs=(config, self.cache_size, self.max_runs))
+        try:
+            while self.steps < kMax:
+                i = self.steps
+                # differentiates the current state again once the old gradient is stale
+                if config.sensitivityMoves and i - drift_step >= GRADIENT_INTERVAL and not np.array_equal(x, drift_x):
+                    drift, drift_x, drift_step = get_drift(get_gradient(encoding.decode(x), encoding, config), config.sigma, encoding.size), x, i
+                k = min(self.K, kMax - i)
+                if checkpoint is not None: # ends the round at the next checkpoint
+                    k = min(k, checkpoint.interval - i % checkpoint.interval)
+                if config.sensitivityMoves and not np.array_equal(x, drift_x): # and where run_walk would take a new gradient
+                    k = min(k, max(drift_step + GRADIENT_INTERVAL - i, 1))
+                # the temperatures of the round's steps and a proposal for each
+                temperatures = []
+                for _ in range(k):
+                    temperatures.append(temperature(temperatures[-1] if temperatures else T, b=b))
+                proposals = [encoding.neighbour(x, sd=config.sigma, mean=drift) for _ in range(k)]
+                log_values = [encoding.log_values(xnew) for xnew in proposals] if model is not None else [None]*k
+                simulate = [j for j in range(k) if not is_hopeless(model, log_values[j], e, temperatures[j])]
+                energies = np.zeros(k)
+                records = [None]*k
+                for j, record in zip(simulate, self.__evaluate([encoding.decode(proposals[j]) for j in simulate], pool)):
+                    records[j] = record
+                    energies[j] = -record.goodness if record is not None else 0
+                self.rounds += 1
+                self.evaluations += len(simulate)
+                # replays the round as sequential steps up to the first acceptance
+                for j in range(k):
+                    if j in simulate:
+                        if model is not None:
+                            model.add(log_values[j], -energies[j])
+                        if trace is not None:
+                            trace.record(i + j + 1, proposals[j], records[j])
+                    accepted = P(e, energies[j], temperatures[j])
+                    if accepted: # acceptance
+                        x = proposals[j]
+                        e = energies[j]
+                    if instrumentation.instruments is not None:
+                        instrumentation.instruments.step(accepted)
+                    if energies[j] < ebest: # records best
+                        xbest = proposals[j]
+                        ebest = energies[j]
+                    self.steps += 1
+                    if accepted: # the rest were drawn from a state the chain has left
+                        break
+                T = temperatures[self.steps - i - 1]
+                counts['steps'] += self.steps - i
+                counts['rounds'] += 1
+                counts['evaluations'] += len(simulate)
+
+                if config.isVerbose and (i - 1)//100 != (self.steps - 1)//100: # verbose printing, once the round passes every 100th step
+                    print(f"{round(self.steps/kMax*100)}% Complete")
+                    print(f"Current Energy: {e:.2E}")
+                    print(f"   Round Steps: {self.steps - i} of {k}")
+                    print()
+
+                if not config.isVerbose and pbar: # non verbose output
+                    pbar.update(self.steps - i)
+
+                if checkpoint is not None and checkpoint.is_due(self.steps - 1, kMax): # saves the walk after the round is complete
+                    if trace is not None: # the trace on disk has to reach the checkpoint
+                        trace.flush()
+                    checkpoint.save(step=self.steps, x=x, e=e, T=T, b=b, xbest=xbest, ebest=ebest, rounds=self.rounds, evaluations=self.evaluations,
+                                    **(model.state() if model is not None else {}),
+                                    **({'drift' : drift, 'drift_x' : drift_x, 'drift_step' : drift_step} if config.sensitivityMoves else {}))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if trace is not None:
+                trace.flush()
+        return encoding.decode(xbest), ebest
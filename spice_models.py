@@ -0,0 +1,46 @@
+import re
+
+##########################################
+
+from subcircuit_def import SubCircuitDictionaries
+
+# SPICE scale suffixes, longest first so "meg" wins over "m"
+suffixes = [('meg', 1e6), ('mil', 25.4e-6), ('t', 1e12), ('g', 1e9), ('k', 1e3), ('m', 1e-3), ('u', 1e-6), ('n', 1e-9), ('p', 1e-12), ('f', 1e-15)]
+
+# converts a SPICE number such as "13E-12" or "4.7k" to a float
+def spice_float(text : str) -> float:
+    text = text.lower()
+    for suffix, scale in suffixes:
+        match = re.fullmatch(r'([-+]?[\d.]+(?:e[-+]?\d+)?)' + suffix + r'[a-z]*', text)
+        if match:
+            return float(match.group(1))*scale
+    return float(text)
+
+# reads the first .MODEL card of a library file as (name, type, parameters)
+def read_model_card(path : str) -> tuple[str, str, dict[str, float]]:
+    lines = []
+    with open(path) as lib:
+        for line in lib:
+            line = line.strip()
+            if not line or line.startswith('*'): # comments
+                continue
+            if line.startswith('+'): # continuation of the card
+                if lines:
+                    lines[-1] += ' ' + line[1:]
+            elif line.lower().startswith('.model'):
+                if lines: # only the first card
+                    break
+                lines.append(line)
+    if not lines:
+        raise ValueError(f"No .MODEL card in {path}")
+    card = lines[0].replace('(', ' ').replace(')', ' ')
+    _, name, type_, rest = card.split(None, 3)
+    params = {key.upper() : spice_float(value) for key, value in re.findall(r'(\w+)\s*=\s*([^\s]+)', rest)}
+    return name, type_.upper(), params
+
+# model parameters for a transistor name from SubCircuitDictionaries.get_trans_dict
+model_cards = dict()
+def get_model_params(trans : str) -> dict[str, float]:
+    if trans not in model_cards:
+        model_cards[trans] = read_model_card(SubCircuitDictionaries().get_trans_dict()[trans])[2]
+    return model_cards[trans]
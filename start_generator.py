@@ -0,0 +1,121 @@
+import multiprocessing
+import numpy as np
+from scipy.stats import qmc
+
+##########################################
+
+import parallel_walks
+from bias_estimate import estimate_OP_current, is_over_current
+from simulated_annealing import get_encoding
+from eval_cache import CachedEvaluation, EvaluationCache, evaluate
+from helper_funcs import RunConfig, get_config
+
+# every resistor of a candidate is within this many E48 steps of the start design, about twice the spread of the old neighbour(s, free_vars, 10) draws
+START_SPAN = 24
+# DC gain window a start has to be in, the bounds the old random start drew until
+START_GAIN_LOW = 400
+START_GAIN_HIGH = 944
+# sobol points screened per batch, a power of two keeps the sequence balanced
+START_BATCH = 64
+# batches screened at most before settling for the starts found so far
+MAX_START_BATCHES = 16
+# passing candidates wanted per start before screening stops, the pool the diverse starts are picked from
+START_OVERSAMPLE = 4
+# smallest RMS distance in E48 steps between two starts
+START_SEPARATION = 4
+
+# how many candidates ended at each stage of screening in this process
+counts = {'drawn' : 0, 'bias' : 0, 'dc' : 0, 'gain' : 0, 'failed' : 0, 'passed' : 0}
+
+def report() -> str:
+    return (f"{counts['drawn']} drawn, {counts['bias']} over current by estimate, {counts['dc']} over current at DC, "
+            f"{counts['gain']} outside the gain window, {counts['failed']} failed, {counts['passed']} passed")
+
+# "n" flat index states spread over the box around x_0 by the next points of "sampler"
+def get_candidates(encoding, x_0 : np.ndarray, sampler : qmc.Sobol, n : int) -> np.ndarray:
+    flat_0 = encoding.flat(x_0)
+    low = np.maximum(flat_0 - START_SPAN, encoding.flat_min)
+    high = np.minimum(flat_0 + START_SPAN, encoding.flat_max)
+    return np.minimum(low + np.floor(sampler.random(n)*(high - low + 1)).astype(np.int64), high)
+
+# stage a candidate was screened out at, "passed" with its evaluation when it made it through every stage
+# CircuitAnalyzer runs the closed form current estimate, then the operating point alone and only then the AC sweep, so most bad candidates never see an AC analysis
+# one evaluation per candidate, so rejected candidates are cached like the rest and the operating point is never simulated twice
+def screen(s : dict, cache : EvaluationCache | None = None, config : RunConfig | None = None) -> tuple[str, CachedEvaluation | None]:
+    config = config if config is not None else get_config()
+    options = config.analysis_options()
+    try:
+        record = evaluate(s, cache, **options)
+    except: # catches errors in NgSpice
+        return 'failed', None
+    if record.goodness == -1: # CircuitAnalyzer's rejection on current, by estimate or at DC
+        return ('bias' if options['prefilter'] and is_over_current(estimate_OP_current(s)) else 'dc'), None
+    if not START_GAIN_LOW < record.DC_gain < START_GAIN_HIGH:
+        return 'gain', None
+    return 'passed', record
+
+# screens one candidate in a worker process
+def screen_worker(s : dict) -> tuple[str, CachedEvaluation | None, dict]:
+    return *screen(s, parallel_walks.worker_cache), parallel_walks.get_worker_stats()
+
+# "k" starts from "candidates", best goodness first, each at least "separation" E48 steps from the ones before it
+# when too few are far enough apart the rest are the candidates farthest from every start so far
+def select_diverse(candidates : np.ndarray, goodness : np.ndarray, k : int, separation : float = START_SEPARATION) -> list[int]:
+    order = np.argsort(-goodness, kind='stable')
+    chosen = []
+    distance = np.full(len(candidates), np.inf) # RMS distance to the nearest chosen start
+    for i in order:
+        if len(chosen) == k:
+            break
+        if distance[i] >= separation:
+            chosen.append(int(i))
+            distance = np.minimum(distance, np.sqrt(np.mean((candidates - candidates[i])**2, axis=1)))
+    while len(chosen) < min(k, len(candidates)):
+        i = int(np.argmax(distance))
+        chosen.append(i)
+        distance = np.minimum(distance, np.sqrt(np.mean((candidates - candidates[i])**2, axis=1)))
+    return chosen
+
+# "k" good and diverse random starts around s_0, screened in batches of sobol points across nWorkers processes
+# starts are repeated when fewer than k candidates pass, s_0 itself is used when none do
+def get_random_starts(s_0 : dict, k : int, config : RunConfig, cache : EvaluationCache | None = None, seed : int | None = None,
+                      cache_size : int = 100000, max_runs : int = 10000) -> list[dict]:
+    encoding = get_encoding(s_0)
+    x_0 = encoding.encode(s_0)
+    sampler = qmc.Sobol(d=encoding.size, scramble=True, seed=seed if seed is not None else np.random.randint(2**31))
+    passed, goodness = [], []
+    pool = None
+    if config.nWorkers > 1:
+        pool = multiprocessing.Pool(processes=config.nWorkers, initializer=parallel_walks.init_worker,
+                               initargs=parallel_walks.get_init_args(config, cache, cache_size, max_runs))
+    try:
+        for batch in range(MAX_START_BATCHES):
+            candidates = get_candidates(encoding, x_0, sampler, START_BATCH)
+            designs = [encoding.decode(encoding.unflat(flat)) for flat in candidates]
+            if pool is not None:
+                results = []
+                for stage, record, stats in pool.imap(screen_worker, designs):
+                    results.append((stage, record))
+                    parallel_walks.merge_worker_stats(stats, cache)
+            else:
+                results = [screen(s, cache, config) for s in designs]
+            counts['drawn'] += len(designs)
+            for flat, (stage, record) in zip(candidates, results):
+                counts[stage] += 1
+                if stage == 'passed':
+                    passed.append(flat)
+                    goodness.append(record.goodness)
+            if config.isVerbose:
+                print(f"Start Batch {batch + 1}: {len(passed)} of {counts['drawn']} candidates passed")
+            if len(passed) >= k*START_OVERSAMPLE:
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if not passed:
+        print("No random start passed screening, starting from the default design")
+        return [s_0]*k
+    passed = np.array(passed)
+    chosen = select_diverse(passed, np.array(goodness), k)
+    return [encoding.decode(encoding.unflat(passed[chosen[i % len(chosen)]])) for i in range(k)]
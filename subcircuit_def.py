@@ -1,4 +1,8 @@
-from PySpice.Spice.Netlist import SubCircuitFactory, Circuit
+import re
+
+##########################################
+
+from PySpice.Spice.Netlist import SubCircuit, SubCircuitFactory, Circuit
 from PySpice.Unit import *
 
 ################################################
@@ -149,8 +153,9 @@ class OutStage(SubCircuitFactory):
 class FeedBackAmp(SubCircuitFactory):
     NAME = 'feedbackamp'
     NODES = ('Vcc','gnd','in_node','out')
-    def __init__(self, fbDict : dict, trans : str):
-        super().__init__()
+    def __init__(self, fbDict : dict, trans : str, name : str | None = None):
+        # a fused netlist defines one amplifier per transistor corner, each under its own name
+        SubCircuit.__init__(self, name if name is not None else self.NAME, *self.NODES)
         # Input Stage
         self.subcircuit(InputStage(fbDict['inStage'], trans))
         self.X('in_Stage','inStage','Vcc','gnd','in_node','gain_in')
@@ -173,4 +178,39 @@ def get_base_circuit() -> Circuit:
     circuit.V('VDC', 'Vcc', circuit.gnd, 9@u_V)
     circuit.C('Cc_load','out','AC_out', 1@u_F)
     circuit.R('R_load','AC_out',circuit.gnd, 300@u_Ohm)  
-    return circuit
\ No newline at end of file
+    return circuit
+
+# amplifier under test: base circuit, AC source and the feedback amplifier for one transistor model
+def get_amp_circuit(fbDict : dict, trans : str) -> Circuit:
+    circuit = get_base_circuit()
+    circuit.SinusoidalVoltageSource('AC_voltage', 'ac_in', circuit.gnd, amplitude=1@u_V) 
+    circuit.R('RAC', 'ac_in', 'in_node', 1500@u_Ohm)
+    circuit.include(SubCircuitDictionaries().get_trans_dict()[trans])
+    circuit.subcircuit(FeedBackAmp(fbDict, trans))
+    circuit.X('fbamp1','feedbackamp','Vcc', circuit.gnd,'in_node','out')
+    return circuit
+
+# node and element suffix of a transistor corner in a fused netlist
+def corner_suffix(key : str) -> str:
+    return re.sub(r'\W', '_', str(key)).lower()
+
+# outputs a fused netlist saves, the AC output and supply current of every corner
+def get_fused_saves(corners : dict[str, str]) -> list[str]:
+    return [name for key in corners for name in (f"AC_out_{corner_suffix(key)}", f"i(vvdc_{corner_suffix(key)})")]
+
+# every transistor corner's amplifier in one circuit, driven by the same AC source
+# each corner has its own supply, input resistor, load and output, corner "LO" draws i(vvdc_lo) through Xfbamp_lo into AC_out_lo
+def get_fused_circuit(fbDict : dict, corners : dict[str, str]) -> Circuit:
+    circuit = Circuit('main')
+    circuit.SinusoidalVoltageSource('AC_voltage', 'ac_in', circuit.gnd, amplitude=1@u_V)
+    trans_dict = SubCircuitDictionaries().get_trans_dict()
+    for key, trans in corners.items():
+        suffix = corner_suffix(key)
+        circuit.V(f'VDC_{suffix}', f'Vcc_{suffix}', circuit.gnd, 9@u_V)
+        circuit.R(f'RAC_{suffix}', 'ac_in', f'in_node_{suffix}', 1500@u_Ohm)
+        circuit.C(f'Cc_load_{suffix}', f'out_{suffix}', f'AC_out_{suffix}', 1@u_F)
+        circuit.R(f'R_load_{suffix}', f'AC_out_{suffix}', circuit.gnd, 300@u_Ohm)
+        circuit.include(trans_dict[trans])
+        circuit.subcircuit(FeedBackAmp(fbDict, trans, name=f'feedbackamp_{suffix}'))
+        circuit.X(f'fbamp_{suffix}', f'feedbackamp_{suffix}', f'Vcc_{suffix}', circuit.gnd, f'in_node_{suffix}', f'out_{suffix}')
+    return circuit
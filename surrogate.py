@@ -0,0 +1,89 @@
+import numpy as np
+
+##########################################
+
+from helper_funcs import RunConfig
+
+# training points kept per surrogate, the oldest are replaced once it is full
+SURROGATE_POINTS = 2000
+# nearest training points the local gaussian process is fitted to
+SURROGATE_NEIGHBOURS = 24
+# noise added to the kernel diagonal, in units of the local signal variance
+SURROGATE_NOISE = 1e-2
+
+# screening counts of this process, workers send theirs back to be merged
+counts = {'proposals' : 0, 'skipped' : 0}
+
+# online regressor of log10(goodness + 1) over log10 resistor values
+# predictions come from a small gaussian process fitted to the nearest training points, so each one costs the same however long the walk
+class Surrogate:
+    def __init__(self, size : int, min_points : int = 100, kappa : float = 2.0, max_points : int = SURROGATE_POINTS, neighbours : int = SURROGATE_NEIGHBOURS) -> None:
+        self.X = np.zeros((max_points, size))
+        self.y = np.zeros(max_points)
+        self.n = 0
+        self.next = 0
+        # predictions start once there are min_points, kappa standard deviations are added to be optimistic
+        self.min_points = max(min_points, neighbours)
+        self.kappa = kappa
+        self.neighbours = neighbours
+
+    # records an evaluated design, rejected designs count as zero goodness
+    def add(self, log_values : np.ndarray, goodness : float) -> None:
+        self.X[self.next] = log_values
+        self.y[self.next] = np.log10(max(goodness, 0) + 1)
+        self.next = (self.next + 1) % len(self.y)
+        self.n = min(self.n + 1, len(self.y))
+
+    # mean and standard deviation of log10(goodness + 1)
+    def predict(self, log_values : np.ndarray) -> tuple[float, float]:
+        d2 = np.sum((self.X[:self.n] - log_values)**2, axis=1)
+        nearest = np.argpartition(d2, self.neighbours - 1)[:self.neighbours]
+        X, y = self.X[nearest], self.y[nearest]
+        # length scale and signal variance follow the neighbourhood
+        length2 = max(np.median(d2[nearest]), 1e-6)
+        mean = y.mean()
+        signal = max(y.var(), 1e-6)
+        K = signal*np.exp(-np.sum((X[:, None, :] - X[None, :, :])**2, axis=2)/(2*length2)) + SURROGATE_NOISE*signal*np.eye(len(y))
+        k = signal*np.exp(-d2[nearest]/(2*length2))
+        weights = np.linalg.solve(K, np.stack((y - mean, k), axis=1))
+        variance = max(signal - k @ weights[:, 1], 0)
+        return mean + k @ weights[:, 0], np.sqrt(variance)
+
+    # most negative energy the design plausibly has, None until the surrogate has enough points to judge
+    def optimistic_energy(self, log_values : np.ndarray) -> float | None:
+        counts['proposals'] += 1
+        if self.n < self.min_points:
+            return None
+        mean, sd = self.predict(log_values)
+        return -(10**(mean + self.kappa*sd) - 1)
+
+    # training points as arrays for a checkpoint
+    def state(self) -> dict[str, np.ndarray]:
+        return {'surrogate_X' : self.X[:self.n], 'surrogate_y' : self.y[:self.n], 'surrogate_next' : np.array(self.next)}
+
+    def restore(self, state : dict[str, np.ndarray]) -> None:
+        self.n = len(state['surrogate_y'])
+        self.X[:self.n] = state['surrogate_X']
+        self.y[:self.n] = state['surrogate_y']
+        self.next = int(state['surrogate_next'])
+
+# a walk's surrogate, None when screening is off
+def get_surrogate(config : RunConfig, size : int) -> Surrogate | None:
+    if not config.surrogate:
+        return None
+    return Surrogate(size, min_points=config.surrogateMinPoints, kappa=config.surrogateKappa)
+
+# screening counts since the last drain, sent back by worker processes
+def drain_counts() -> dict[str, int]:
+    drained = dict(counts)
+    for name in counts:
+        counts[name] = 0
+    return drained
+
+def merge_counts(other : dict[str, int]) -> None:
+    for name, n in other.items():
+        counts[name] += n
+
+def report() -> str:
+    rate = counts['skipped']/counts['proposals'] if counts['proposals'] else 0
+    return f"{counts['skipped']} of {counts['proposals']} proposals skipped without simulating ({rate:.1%})"
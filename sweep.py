@@ -0,0 +1,74 @@
+import csv
+import itertools
+import time
+
+##########################################
+
+from eval_cache import EvaluationCache
+from optimizer import get_start_design, run_annealing
+from start_generator import get_random_starts
+from helper_funcs import CONFIG_FIELDS, RunConfig, get_config_parser, set_config
+
+# SA hyperparameters a sweep is meant for, any other setting can be swept too
+SWEEP_FIELDS = ['sigma', 'T', 'kAnnealing', 'nWalk']
+
+# every combination of the swept values on top of "base"
+def get_sweep_configs(base : RunConfig, grid : dict[str, list]) -> list[RunConfig]:
+    names = list(grid.keys())
+    return [base.replace(**dict(zip(names, values))) for values in itertools.product(*(grid[name] for name in names))]
+
+# spellings of a swept bool setting, bool() of any non-empty string would be True
+BOOL_VALUES = {'true' : True, '1' : True, 'y' : True, 'false' : False, '0' : False, 'n' : False}
+
+# parses "name=v1,v2,..." into the setting's type
+def parse_sweep(text : str) -> tuple[str, list]:
+    name, values = text.split('=', 1)
+    if name not in CONFIG_FIELDS:
+        raise ValueError(f"Unknown setting: {name}")
+    kind = CONFIG_FIELDS[name][0]
+    return name, [parse_value(name, kind, value) for value in values.split(',')]
+
+def parse_value(name : str, kind : type, value : str):
+    if kind != bool:
+        return kind(value)
+    if value.lower() not in BOOL_VALUES:
+        raise ValueError(f"{name} takes true or false, not {value}")
+    return BOOL_VALUES[value.lower()]
+
+# runs the SA stage of every configuration in this process, one CSV row per run written as it finishes
+# evaluations are shared between runs through "cache", the SA settings don't change them
+# worker processes start from its records and send their lookups back into it, so the evaluation and hit columns count them too
+def run_sweep(configs : list[RunConfig], path : str, cache : EvaluationCache | None = None, repeats : int = 1) -> None:
+    cache = cache if cache is not None else EvaluationCache()
+    with open(path, mode='w', newline='') as file:
+        writer = csv.writer(file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow([*SWEEP_FIELDS, 'repeat', 'goodness', 'evaluations', 'cache_hits', 'time', 'design'])
+        for config in configs:
+            set_config(config)
+            for repeat in range(repeats):
+                s_0 = get_start_design(config)
+                starts = get_random_starts(s_0, config.nWalk, config, cache) if config.isRand else None
+                hits, misses = cache.hits, cache.misses
+                start = time.time()
+                sbest_list, ebest_list, tempering = run_annealing(s_0, config, cache, starts=starts)
+                end = time.time()
+                best = min(range(len(ebest_list)), key=lambda i: ebest_list[i])
+                writer.writerow([*(getattr(config, name) for name in SWEEP_FIELDS), repeat, -ebest_list[best],
+                                 cache.hits + cache.misses - hits - misses, cache.hits - hits, round(end - start, 3), sbest_list[best]])
+                file.flush()
+
+if __name__ == "__main__":
+    # e.g. python sweep.py --preset test --sweep sigma=0.3,1,3 --sweep T=10,30 --out sweep.csv
+    parser = get_config_parser()
+    parser.add_argument('--sweep', action='append', default=[], help="name=v1,v2,... values of a setting to sweep")
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--out', default='sweep.csv')
+    args = parser.parse_args()
+    # sweeps are quiet unless asked otherwise
+    base = RunConfig.from_namespace(args)
+    if args.isVerbose is None:
+        base = base.replace(isVerbose=False)
+    if args.showPlots is None:
+        base = base.replace(showPlots=False)
+    grid = dict(parse_sweep(text) for text in args.sweep)
+    run_sweep(get_sweep_configs(base, grid), args.out, repeats=args.repeats)
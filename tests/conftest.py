@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the top of the repository and read library/ relative to it
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    monkeypatch.chdir(ROOT)
+
+# simulations go to the stand-in circuit of mock_ngspice, so the tests run without ngspice
+@pytest.fixture
+def mock_session():
+    from mock_ngspice import MockNgSpice
+    from simulation_session import SimulationSession, set_session
+    set_session(SimulationSession(ngspice=MockNgSpice()))
+    yield
+    set_session(None)
+
+# quiet test preset, walks take it explicitly so nothing prompts
+@pytest.fixture
+def config():
+    from helper_funcs import RunConfig
+    return RunConfig.preset('test', isVerbose=False, showPlots=False)
+
+@pytest.fixture
+def start_design(config):
+    from optimizer import get_start_design
+    return get_start_design(config)
+
+# worker processes of a pool simulate on the stand-in too
+@pytest.fixture
+def mock_workers(monkeypatch, mock_session):
+    import parallel_walks
+    from mock_ngspice import MockNgSpice
+    from simulation_session import SimulationSession
+    monkeypatch.setattr(parallel_walks, 'SimulationSession', lambda max_runs=10000: SimulationSession(ngspice=MockNgSpice()))
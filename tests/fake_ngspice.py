@@ -0,0 +1,46 @@
+# stand-in for "ngspice -b -r raw deck": answers the deck's .op and .ac lines from MockNgSpice in a binary raw file
+# a deck containing CRASH exits with an error and one containing HANG never finishes
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_ngspice import MockNgSpice
+
+# header and data of one plot of a binary raw file, as ngspice writes them
+def raw_plot(plotname : str, names : list[str], data : np.ndarray) -> bytes:
+    flags = 'complex' if np.iscomplexobj(data) else 'real'
+    header = f"Title: main\nDate: today\nPlotname: {plotname}\nFlags: {flags}\nNo. Variables: {len(names)}\nNo. Points: {len(data)}\nVariables:\n"
+    header += ''.join(f"\t{i}\t{name}\t{'frequency' if name == 'frequency' else 'voltage'}\n" for i, name in enumerate(names))
+    return (header + "Binary:\n").encode('ascii') + np.ascontiguousarray(data).tobytes()
+
+def main(args : list[str]) -> int:
+    raw_path, deck_path = args[args.index('-r') + 1], args[-1]
+    with open(deck_path) as file:
+        deck = file.read()
+    if 'CRASH' in deck:
+        return 3
+    if 'HANG' in deck:
+        time.sleep(100)
+    ngspice = MockNgSpice()
+    ngspice.load_circuit(deck)
+    with open(raw_path, 'wb') as raw:
+        for line in deck.splitlines():
+            command = line[1:].strip()
+            if command.split()[:1] == ['op']:
+                ngspice.exec_command(command)
+                analysis = ngspice.plot(None, None).to_analysis()
+                raw.write(raw_plot('Operating Point', [f"i({name})" for name in analysis.branches], np.array([[value[0] for value in analysis.branches.values()]])))
+            elif command.split()[:1] == ['ac']:
+                ngspice.exec_command(command)
+                analysis = ngspice.plot(None, None).to_analysis()
+                data = np.stack([analysis.frequency.astype(complex)] + list(analysis.nodes.values()), axis=1)
+                raw.write(raw_plot('AC Analysis', ['frequency'] + [f"v({name})" for name in analysis.nodes], data))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
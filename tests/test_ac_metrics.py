@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from ac_metrics import get_BWs, get_worst_case, GAIN_HIGH, GAIN_LOW
+
+# the 50 points per decade sweep CircuitAnalyzer runs
+FREQ = 1e3*10**(np.arange(251)/50)
+
+# __get_BW before vectorizing, on plain floats, returning (BW, DC gain, corner) or None when every corner is skipped
+def old_get_BW(freqs : list, gains : list, is_coarse : list):
+    BW_min = None
+    DC_gain_min = None
+    key_min = None
+    for key, freq in enumerate(freqs):
+        gain = [float(x) for x in gains[key]]
+        freq = [float(x) for x in freq]
+        DC_gain_curr = gain[0]
+        if DC_gain_curr > 100:
+            index_3dB = None
+            for i, x in enumerate(gain):
+                if x > 1188.5 or x < 944:
+                    index_3dB = i
+                    break
+            if index_3dB > 1:
+                currBW = lin_approx(freq[index_3dB], gain[index_3dB], freq[index_3dB-1], gain[index_3dB-1], DC_gain_curr*0.944)
+            else:
+                if index_3dB == 0:
+                    for i, x in enumerate(gain):
+                        if x <= DC_gain_curr*0.944 or x >= DC_gain_curr/0.944:
+                            index_3dB = i
+                            break
+                    currBW = lin_approx(freq[index_3dB], gain[index_3dB], freq[index_3dB-1], gain[index_3dB-1], DC_gain_curr*0.944)
+                    i = 0
+                    n = 0
+                    adj = 0
+                    while(freq[i] < 7.2*10**6):
+                        if is_coarse[key][i]:
+                            adj += min((gain[i] - 1188.5)**2,(gain[i] - 944)**2)
+                            n += 1
+                        i += 1
+                    currBW /= np.sqrt(adj)/n
+            if index_3dB != None and currBW != None and (BW_min == None or currBW < BW_min):
+                BW_min = currBW
+                DC_gain_min = DC_gain_curr
+                key_min = key
+    return None if BW_min == None else (BW_min, DC_gain_min, key_min)
+
+def lin_approx(x1, y1, x2, y2, y_target):
+    return (y_target-y1)*(x2-x1)/(y2-y1) + x1
+
+# __get_BW now, every corner stacked into one get_BWs call
+def new_get_BW(freqs : list, gains : list, is_coarse : list):
+    BWs, DC_gains, statuses = get_BWs(np.stack(freqs), np.stack(gains), np.stack(is_coarse))
+    worst = get_worst_case(BWs, statuses)
+    return None if worst is None else (BWs[worst], DC_gains[worst], worst)
+
+# old and new agree on the result, or both fail where the old loop raised
+def assert_same(gains : list, is_coarse : list | None = None) -> None:
+    freqs = [FREQ]*len(gains)
+    is_coarse = is_coarse if is_coarse is not None else [np.ones(len(FREQ), dtype=bool)]*len(gains)
+    try:
+        expected = old_get_BW(freqs, gains, is_coarse)
+    except (TypeError, NameError, ZeroDivisionError):
+        with pytest.raises(ValueError):
+            new_get_BW(freqs, gains, is_coarse)
+        return
+    assert new_get_BW(freqs, gains, is_coarse) == expected
+
+# one pole roll off from "DC_gain" at "pole" Hz
+def pole(DC_gain : float, pole : float) -> np.ndarray:
+    return DC_gain/np.sqrt(1 + (FREQ/pole)**2)
+
+def test_edge_in_window():
+    assert_same([pole(1000, 2e6)])
+
+def test_edge_at_window_boundary():
+    gains = pole(GAIN_HIGH, 2e6)
+    gains[:80] = GAIN_HIGH # on the boundary is still inside
+    gains[80] = GAIN_LOW
+    gains[81:] = np.minimum(gains[81:], GAIN_LOW - 1)
+    assert_same([gains])
+
+def test_punished_DC_gain():
+    assert_same([pole(1500, 2e6)])
+    assert_same([pole(700, 5e5)])
+
+def test_punished_DC_gain_coarse_points():
+    is_coarse = np.ones(len(FREQ), dtype=bool)
+    is_coarse[1::3] = False
+    assert_same([pole(1500, 2e6)], [is_coarse])
+
+def test_stale_second_point():
+    stale = pole(1000, 2e6)
+    stale[1:] = 900 # leaves the window at index 1
+    assert_same([pole(1000, 2e6), stale])
+    assert_same([pole(1000, 1e7), stale])
+    assert_same([stale, pole(1000, 2e6)]) # nothing measured before it
+
+@pytest.mark.filterwarnings("ignore:divide by zero")
+def test_flat_gain():
+    assert_same([np.full(len(FREQ), 2000.0)]) # punished and never drops
+    assert_same([np.full(len(FREQ), 1000.0)]) # never leaves the window
+
+def test_DC_gain_below_100():
+    assert_same([pole(50, 2e6)])
+    assert new_get_BW([FREQ], [pole(50, 2e6)], [np.ones(len(FREQ), dtype=bool)]) is None
+    assert_same([pole(50, 2e6), pole(1000, 2e6)])
+
+def test_two_corner_worst_case():
+    assert_same([pole(1000, 3e6), pole(1100, 2e6)])
+    assert_same([pole(1100, 2e6), pole(1000, 3e6)])
+    assert new_get_BW([FREQ]*2, [pole(1000, 3e6), pole(1100, 2e6)], [np.ones(len(FREQ), dtype=bool)]*2)[2] == 1
+
+def test_batched_rows_match_single_rows():
+    gains = np.stack([pole(1000, 3e6), pole(1500, 2e6), pole(50, 1e6)])
+    BWs, DC_gains, statuses = get_BWs(FREQ, gains)
+    for i in range(len(gains)):
+        BW, DC_gain, status = get_BWs(FREQ, gains[i])
+        np.testing.assert_array_equal([BW, DC_gain, status], [BWs[i], DC_gains[i], statuses[i]])
+
+def test_random_curves_match_old_loop():
+    rng = np.random.default_rng(6)
+    for _ in range(500):
+        corners = rng.integers(1, 3)
+        gains = [pole(rng.uniform(50, 2500), 10**rng.uniform(3, 8))*(1 + rng.normal(0, 0.02, len(FREQ))) for _ in range(corners)]
+        assert_same(gains)
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from scipy.optimize import root
+from scipy.stats import qmc
+
+##########################################
+
+from bias_estimate import BETA_MARGIN, VCC, estimate_current, estimate_OP_current, is_over_current, stage_current
+from simulated_annealing import get_encoding
+from spice_models import get_model_params
+from start_generator import get_candidates
+
+# thermal voltage at room temperature
+VT = 0.02585
+
+# junction voltage past which the diode current continues as a straight line, so the solver can't overflow
+V_MAX = 1.0
+
+# diode current, exponential up to V_MAX
+def diode(V : float, IS : float, N : float) -> float:
+    x, x_max = V/(N*VT), V_MAX/(N*VT)
+    return IS*np.expm1(x) if x < x_max else IS*(np.exp(x_max)*(1 + x - x_max) - 1)
+
+# Ebers-Moll collector and base currents of an NPN
+def transistor(V_B : float, V_C : float, V_E : float, params : dict, beta : float) -> tuple[float, float]:
+    IS, BR = params['IS'], params['BR']
+    forward = diode(V_B - V_E, IS, params['NF'])
+    reverse = diode(V_B - V_C, IS, params['NR'])
+    return forward - reverse - reverse/BR, forward/beta + reverse/BR
+
+# DC solution of kcl(v, supply) at VCC, ramping the supply up from nothing the way SPICE's source stepping does
+def solve(kcl, size : int) -> np.ndarray:
+    v = np.zeros(size)
+    for supply in np.linspace(0, VCC, 91)[1:]:
+        solution = root(kcl, v, args=(supply,), method='hybr', options={'xtol' : 1e-13})
+        v = solution.x
+    assert np.max(np.abs(kcl(v, VCC))) < 1e-9
+    return v
+
+# supply current of one stage of stage_current's topology, solved with every bias resistor and both junctions
+def solve_stage(R_top : float, R_mid : float, R_bottom : float, R_emitter : float, R_collector : float | None, params : dict, beta : float) -> float:
+    if R_collector is None: # emitter follower on the supply
+        def kcl(v, supply):
+            V_B, V_E = v
+            IC, IB = transistor(V_B, supply, V_E, params, beta)
+            return [(supply - V_B)/R_top - V_B/R_bottom - IB, IC + IB - V_E/R_emitter]
+        V_B, V_E = solve(kcl, 2)
+        return (VCC - V_B)/R_top + transistor(V_B, VCC, V_E, params, beta)[0]
+    # upper transistor Q1 from the collector resistor onto the lower transistor Q2
+    def kcl(v, supply):
+        V_B1, V_B2, V_C, V_E, V_out = v
+        IC1, IB1 = transistor(V_B1, V_out, V_C, params, beta)
+        IC2, IB2 = transistor(V_B2, V_C, V_E, params, beta)
+        return [(supply - V_B1)/R_top - (V_B1 - V_B2)/R_mid - IB1, (V_B1 - V_B2)/R_mid - V_B2/R_bottom - IB2,
+                IC1 + IB1 - IC2, IC2 + IB2 - V_E/R_emitter, (supply - V_out)/R_collector - IC1]
+    V_B1, V_B2, V_C, V_E, V_out = solve(kcl, 5)
+    return (VCC - V_B1)/R_top + (VCC - V_out)/R_collector
+
+def solve_current(s : dict, params : dict, beta : float) -> float:
+    inStage, outStage = s['inStage'], s['outStage']
+    current = solve_stage(inStage['RB1'], 0, inStage['RB2'], inStage['RE'], None, params, beta)
+    for cascode in (s['cascode1'], s['cascode2']):
+        current += solve_stage(cascode['RB1'], cascode['RB2'], cascode['RB3'], cascode['RE_deg'] + cascode['RE'], cascode['RC'], params, beta)
+    return current + solve_stage(outStage['RB1'], outStage['RB2'], outStage['RB3'], outStage['RE'], outStage['RC'], params, beta)
+
+# the prefilter only rejects what the simulator would, so the estimate stays under the solved current of sampled designs
+# for any beta down to the margin
+@pytest.mark.parametrize('trans', ['ZTX107-NOM', 'ZTX107-LO', 'ZTX107-HI', '2N2222A'])
+def test_estimate_is_lower_bound(start_design, trans):
+    encoding = get_encoding(start_design)
+    x_0 = encoding.encode(start_design)
+    params = get_model_params(trans)
+    for x in get_candidates(encoding, x_0, qmc.Sobol(len(encoding.flat(x_0)), seed=0), 16):
+        s = encoding.decode(encoding.unflat(x))
+        for beta in (params['BF']/BETA_MARGIN, params['BF']):
+            assert 0 < estimate_current(s, params['BF']) <= solve_current(s, params, beta)
+
+# a collector resistor too large for the lower transistor's current saturates the upper one
+@pytest.mark.parametrize('R_collector', [3e3, 10e3, 30e3, 100e3, 1e6])
+def test_saturated_cascode(R_collector):
+    params = get_model_params('ZTX107-NOM')
+    estimate = stage_current(100e3, 12.1e3, 21.5e3, 256.6, R_collector, params['BF']/BETA_MARGIN, cascode=True)
+    for beta in (params['BF']/BETA_MARGIN, params['BF']):
+        assert 0 < estimate <= solve_stage(100e3, 12.1e3, 21.5e3, 256.6, R_collector, params, beta)
+
+def test_over_current(start_design):
+    assert not is_over_current(estimate_OP_current(start_design))
+    assert is_over_current(1)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+##########################################
+
+from checkpoint import WalkCheckpoint, get_rng_state, set_rng_state
+from simulated_annealing import run_walk
+
+class Interrupted(Exception):
+    pass
+
+# stops the walk right after its "stop_after"th checkpoint, like a run killed there
+class InterruptedCheckpoint(WalkCheckpoint):
+    def __init__(self, path : str, interval : int, stop_after : int) -> None:
+        super().__init__(path, interval)
+        self.stop_after = stop_after
+        self.saves = 0
+
+    def save(self, **arrays) -> None:
+        super().save(**arrays)
+        self.saves += 1
+        if self.saves == self.stop_after:
+            raise Interrupted
+
+def test_rng_state_round_trip():
+    np.random.seed(3)
+    np.random.normal() # leaves a cached gaussian behind
+    state = get_rng_state()
+    expected = np.random.normal(size=10)
+    np.random.seed(4)
+    set_rng_state(state)
+    assert np.array_equal(np.random.normal(size=10), expected)
+
+def test_load_restores_rng_state(tmp_path):
+    checkpoint = WalkCheckpoint(str(tmp_path/'walk.npz'))
+    assert checkpoint.load() is None
+    np.random.seed(5)
+    checkpoint.save(step=np.array(7))
+    expected = np.random.random(10)
+    np.random.seed(6)
+    assert int(checkpoint.load()['step']) == 7
+    assert np.array_equal(np.random.random(10), expected)
+
+# a walk resumed from its checkpoint ends with the same best design and energy as one that ran through
+@pytest.mark.parametrize('stop_after', [1, 2])
+def test_resumed_walk_matches_uninterrupted(tmp_path, mock_session, config, start_design, stop_after):
+    np.random.seed(11)
+    expected = run_walk(20, 60, start_design, cache=None, checkpoint=WalkCheckpoint(str(tmp_path/'through.npz'), interval=25), config=config)
+    np.random.seed(11)
+    path = str(tmp_path/'interrupted.npz')
+    with pytest.raises(Interrupted):
+        run_walk(20, 60, start_design, cache=None, checkpoint=InterruptedCheckpoint(path, interval=25, stop_after=stop_after), config=config)
+    np.random.seed(12) # the checkpoint has to bring back the random state
+    resumed = run_walk(20, 60, start_design, cache=None, checkpoint=WalkCheckpoint(path, interval=25), config=config)
+    assert resumed == expected
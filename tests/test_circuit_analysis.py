@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from scipy.stats import qmc
+
+##########################################
+
+import circuit_analysis
+import mock_ngspice
+from ac_metrics import get_edge_index, get_gain_penalty
+from circuit_analysis import COARSE_POINTS, REFINE_POINTS, CircuitAnalyzer
+from optimizer import get_start_design
+from simulated_annealing import get_encoding
+from start_generator import get_candidates
+
+def get_designs(s_0 : dict, n : int) -> list[dict]:
+    encoding = get_encoding(s_0)
+    x_0 = encoding.encode(s_0)
+    return [s_0] + [encoding.decode(encoding.unflat(x)) for x in get_candidates(encoding, x_0, qmc.Sobol(len(encoding.flat(x_0)), seed=0), n)]
+
+@pytest.mark.parametrize('keep_AC', [False, True])
+def test_result_sweep(mock_session, start_design, keep_AC):
+    analyzer = CircuitAnalyzer(start_design)
+    result = analyzer.result(keep_AC=keep_AC)
+    assert (result.gain is not None) == keep_AC
+    analysis, expected = result.get_AC_analysis(), analyzer.get_AC_analysis()
+    assert np.allclose(analysis.frequency, expected.frequency)
+    assert np.allclose(analysis.AC_out, expected.AC_out, rtol=1e-5)
+
+# a design rejected on current never has an AC analysis, kept or simulated again
+@pytest.mark.parametrize('keep_AC', [False, True])
+def test_rejected_design_has_no_sweep(monkeypatch, mock_session, start_design, keep_AC):
+    monkeypatch.setattr(mock_ngspice, 'MOCK_CURRENT', 0.05)
+    analyzer = CircuitAnalyzer(start_design)
+    assert analyzer.goodness == -1
+    assert analyzer.get_AC_analysis() is None
+    assert analyzer.result(keep_AC=keep_AC).get_AC_analysis() is None
+
+# a design in the gain window gets the bandwidth edge to BW_tol, a design outside it the full sweep's punished bandwidth
+# the full sweep interpolates its edge across a 4.7% bracket, so the edge is compared with a sweep fine enough to have converged
+@pytest.mark.parametrize('dBeta', [False, True])
+def test_adaptive_matches_full_sweep(monkeypatch, mock_session, config, dBeta):
+    kinds = set()
+    for s in get_designs(get_start_design(config.replace(dBeta=dBeta)), 32):
+        full, adaptive = CircuitAnalyzer(s), CircuitAnalyzer(s, adaptive=True, BW_tol=1e-3)
+        punished = bool(get_edge_index(full.gains[full.key_min])[1])
+        kinds.add(punished)
+        if punished:
+            assert (adaptive.BW, adaptive.goodness) == (full.BW, full.goodness)
+        else:
+            monkeypatch.setattr(circuit_analysis, 'SWEEP_POINTS', 5000)
+            converged = CircuitAnalyzer(s)
+            monkeypatch.undo()
+            assert adaptive.BW == pytest.approx(converged.BW, rel=1e-3)
+            assert full.BW == pytest.approx(converged.BW, rel=0.02)
+    assert kinds == {False, True}
+
+# refining points are left out of the gain penalty, which averages the coarse points only
+def test_refined_points_left_out_of_penalty():
+    frequency = 1e3*10**(np.arange(5*COARSE_POINTS + 1)/COARSE_POINTS)
+    gains = 800/np.absolute(1 + 1j*frequency/2e6)**2
+    refined = np.linspace(frequency[20], frequency[21], REFINE_POINTS + 2)[1:-1]
+    merged = np.concatenate((frequency, refined))
+    order = np.argsort(merged, kind='stable')
+    merged_gains = 800/np.absolute(1 + 1j*merged/2e6)**2
+    is_coarse = np.concatenate((np.ones(len(frequency), dtype=bool), np.zeros(REFINE_POINTS, dtype=bool)))
+    expected = get_gain_penalty(frequency, gains)
+    assert get_gain_penalty(merged[order], merged_gains[order], is_coarse[order]) == expected
+    assert get_gain_penalty(merged[order], merged_gains[order]) != expected
+
+# an adaptive sweep keeps the coarse log points and marks the linear points refining the edge
+def test_adaptive_sweep_points(mock_session, start_design):
+    s = get_designs(start_design, 1)[1] # DC gain in the window
+    analysis = CircuitAnalyzer(s, adaptive=True).get_AC_analysis()
+    coarse = analysis.frequency[analysis.is_coarse]
+    assert coarse == pytest.approx(1e3*10**(np.arange(5*COARSE_POINTS + 1)/COARSE_POINTS))
+    refined = np.count_nonzero(~analysis.is_coarse)
+    assert refined > 0 and refined % REFINE_POINTS == 0
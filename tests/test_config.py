@@ -0,0 +1,37 @@
+import pytest
+
+##########################################
+
+from helper_funcs import CONFIG_FIELDS, RunConfig
+
+def answer(monkeypatch, answers : list[str]) -> list[str]:
+    prompts = []
+    def fake_input(prompt : str) -> str:
+        prompts.append(prompt)
+        return answers[len(prompts) - 1]
+    monkeypatch.setattr('builtins.input', fake_input)
+    return prompts
+
+@pytest.mark.parametrize('reply, preset', [('y', 'default'), ('test', 'test')])
+def test_interactive_preset(monkeypatch, reply, preset):
+    prompts = answer(monkeypatch, [reply])
+    assert RunConfig.interactive().to_dict() == RunConfig.preset(preset).to_dict()
+    assert len(prompts) == 1
+
+# the original questions, every other setting keeps its default
+def test_interactive_questions(monkeypatch):
+    prompts = answer(monkeypatch, ['n', 'n', 'y', 'n', '0.5', '300', '2', '10', '400'])
+    config = RunConfig.interactive()
+    assert len(prompts) == 9
+    assert (config.isVerbose, config.isRand, config.dBeta, config.sigma) == (False, True, False, 0.5)
+    assert (config.kAnnealing, config.nWalk, config.T, config.kGreedy) == (300, 2, 10, 400)
+    asked = {'isVerbose', 'isRand', 'dBeta', 'sigma', 'kAnnealing', 'nWalk', 'T', 'kGreedy', 'nWorkers'}
+    assert all(getattr(config, name) == default for name, (kind, default) in CONFIG_FIELDS.items() if name not in asked)
+
+def test_flags_override_preset(tmp_path):
+    path = tmp_path/'run.json'
+    path.write_text('{"kAnnealing" : 50, "surrogate" : true}')
+    config = RunConfig.from_args(['--preset', 'test', '--config', str(path), '--kGreedy', '7', '--no-useTemplate'])
+    assert (config.kAnnealing, config.surrogate, config.kGreedy, config.useTemplate, config.nWalk) == (50, True, 7, False, 1)
+    with pytest.raises(ValueError):
+        RunConfig(unknown=1)
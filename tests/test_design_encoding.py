@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+##########################################
+
+from simulated_annealing import free_vars, free_vars_dict, get_encoding, iter_resistor, neighbour
+
+# the free resistors of "s" in walk order
+def resistors(s : dict) -> list[float]:
+    values = []
+    for key in free_vars:
+        if type(s[key]) == dict:
+            values += [float(s[key][name]) for name in free_vars_dict[key]]
+        else:
+            values.append(float(s[key]))
+    return values
+
+# the encoded walk has to visit the designs of the dict walk it replaced, drawing the same random numbers
+@pytest.mark.parametrize('sd', [0.3, 1, 3, 30])
+def test_neighbour_matches_dict_walk(start_design, sd):
+    encoding = get_encoding(start_design)
+    s, x = start_design, encoding.encode(start_design)
+    for seed in range(5):
+        for step in range(200):
+            np.random.seed(seed*1000 + step)
+            s = neighbour(s, free_vars, sd)
+            np.random.seed(seed*1000 + step)
+            x = encoding.neighbour(x, sd)
+            assert resistors(encoding.decode(x)) == pytest.approx(resistors(s), rel=1e-9)
+
+# a shared stream stays aligned when both walks run from one seed
+def test_neighbour_draws_same_stream(start_design):
+    encoding = get_encoding(start_design)
+    np.random.seed(7)
+    s = start_design
+    for step in range(100):
+        s = neighbour(s, free_vars, 2)
+    after_dict = np.random.random()
+    np.random.seed(7)
+    x = encoding.encode(start_design)
+    for step in range(100):
+        x = encoding.neighbour(x, 2)
+    assert np.random.random() == after_dict
+    assert resistors(encoding.decode(x)) == pytest.approx(resistors(s), rel=1e-9)
+
+def test_encode_decode_round_trip(start_design):
+    encoding = get_encoding(start_design)
+    assert resistors(encoding.decode(encoding.encode(start_design))) == pytest.approx(resistors(start_design), rel=1e-9)
+
+# the clamps of iter_resistor at 10 ohm and 21.5 Mohm
+def test_neighbour_clamps(start_design):
+    encoding = get_encoding(start_design)
+    x = encoding.encode(start_design)
+    low, high = encoding.decode(encoding.neighbour(x, 0, mean=-10**4)), encoding.decode(encoding.neighbour(x, 0, mean=10**4))
+    assert resistors(low) == pytest.approx([iter_resistor(R, -10**4) for R in resistors(start_design)])
+    assert resistors(high) == pytest.approx([iter_resistor(R, 10**4) for R in resistors(start_design)])
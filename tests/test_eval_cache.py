@@ -0,0 +1,28 @@
+import pytest
+
+##########################################
+
+from eval_cache import CachedEvaluation, EvaluationCache, evaluate, get_mode
+
+def test_mode_shares_equivalent_options():
+    assert get_mode({'template' : True, 'batch' : True, 'fused' : True, 'AC_check' : 50}) == get_mode({})
+    assert get_mode({'adaptive' : False, 'fast_AC' : False}) == get_mode({})
+    assert get_mode({'adaptive' : True}) != get_mode({})
+
+# designs the prefilter rejected were never simulated, an unfiltered run must simulate them itself
+def test_mode_keeps_prefilter_apart():
+    assert get_mode({'prefilter' : True}) != get_mode({'prefilter' : False})
+
+def test_mode_freezes_dicts():
+    mode = get_mode({'model_params' : {'BF' : 300, 'IS' : 1e-14}})
+    assert hash(mode) == hash(get_mode({'model_params' : {'IS' : 1e-14, 'BF' : 300}}))
+
+def test_evaluate_caches_by_mode(mock_session, start_design):
+    cache = EvaluationCache()
+    rejected = CachedEvaluation(BW=0, DC_gain=0, OP_current=1, goodness=0)
+    cache.put(start_design, rejected, get_mode({'prefilter' : True}))
+    assert evaluate(start_design, cache, prefilter=True) == rejected
+    record = evaluate(start_design, cache)
+    assert record != rejected and record.goodness > 0
+    assert evaluate(start_design, cache, template=True) == record
+    assert cache.hits == 2
@@ -0,0 +1,150 @@
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import pytest
+
+##########################################
+
+import eval_server
+from eval_server import EvaluationClient, connect, get_client_authkey, get_server_authkey, parse_address, start_workers
+from mock_ngspice import MockNgSpice
+from simulation_session import SimulationSession
+
+def test_parse_address():
+    assert parse_address('') == ('127.0.0.1', eval_server.EVAL_PORT)
+    assert parse_address(':5000') == ('127.0.0.1', 5000)
+    assert parse_address('farm:5000') == ('farm', 5000)
+
+def test_no_default_key(monkeypatch):
+    monkeypatch.delenv('EVAL_AUTHKEY', raising=False)
+    with pytest.raises(RuntimeError):
+        get_client_authkey()
+    with pytest.raises(RuntimeError):
+        get_server_authkey('0.0.0.0')
+    # a loopback server makes up its own key
+    first, second = get_server_authkey('127.0.0.1'), get_server_authkey('localhost')
+    assert len(first) == 32 and first != second
+    monkeypatch.setenv('EVAL_AUTHKEY', 'secret')
+    assert get_server_authkey('0.0.0.0') == get_client_authkey() == b'secret'
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+# only clients with the server's key get its queues
+def test_server_checks_key(monkeypatch):
+    address = ('127.0.0.1', free_port())
+    server = multiprocessing.get_context('fork').Process(target=eval_server.serve, args=(address, b'right'), daemon=True)
+    server.start()
+    try:
+        manager = connect(address, b'right', wait=10)
+        assert manager.get_task_queue().qsize() == 0
+        with pytest.raises(multiprocessing.AuthenticationError):
+            connect(address, b'wrong')
+        monkeypatch.delenv('EVAL_AUTHKEY', raising=False)
+        with pytest.raises(RuntimeError):
+            connect(address)
+    finally:
+        server.kill()
+        server.join()
+
+KEY = b'test'
+
+# stands in for CircuitAnalyzer in the simulator processes, the design says what to do
+# "once" names a file the first attempt creates, so only the first attempt hangs or crashes
+class StubAnalyzer:
+    def __init__(self, s : dict, **options) -> None:
+        if s.get('once') is None or not os.path.exists(s['once']):
+            if s.get('once') is not None:
+                open(s['once'], 'w').close()
+            if s.get('action') == 'hang':
+                time.sleep(3600)
+            elif s.get('action') == 'crash':
+                os._exit(1)
+            elif s.get('action') == 'error':
+                raise NameError('Simulation failed')
+        time.sleep(s.get('sleep', 0))
+        self.BW, self.DC_gain, self.OP_current, self.goodness = s['value'], 1000, 0.01, s['value']
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(eval_server, 'CircuitAnalyzer', StubAnalyzer)
+    monkeypatch.setattr(eval_server, 'SimulationSession', lambda max_runs=10000: SimulationSession(ngspice=MockNgSpice()))
+    processes = []
+    def start(queue_size : int = eval_server.QUEUE_SIZE, workers : int = 2) -> tuple[str, int]:
+        address = ('127.0.0.1', free_port())
+        processes.append(multiprocessing.Process(target=eval_server.serve, args=(address, KEY, queue_size), daemon=True))
+        processes[-1].start()
+        connect(address, KEY, wait=10)
+        processes.extend(start_workers(address, workers, KEY))
+        return address
+    start.processes = processes
+    yield start
+    for process in processes:
+        process.kill()
+        process.join()
+
+def test_records_in_order(server):
+    client = EvaluationClient(server(), KEY, timeout=5)
+    designs = [{'value' : float(i), 'sleep' : 0.01*(i % 3)} for i in range(20)]
+    records = client.map(designs, {})
+    assert [record.goodness for record in records] == [float(i) for i in range(20)]
+    assert (client.resent, client.failures) == (0, 0)
+    assert client.evaluate({'value' : 7.0}, {}).BW == 7
+    with pytest.raises(RuntimeError):
+        client.evaluate({'value' : 0.0, 'action' : 'error'}, {})
+    client.close()
+
+# a hung simulation is killed, its simulator restarted and the design sent again
+def test_timeout_restarts_simulator(server, tmp_path):
+    client = EvaluationClient(server(workers=1), KEY, timeout=1)
+    records = client.map([{'value' : 1.0, 'action' : 'hang', 'once' : str(tmp_path/'hung')}, {'value' : 2.0}], {})
+    assert [record.goodness for record in records] == [1, 2]
+    assert client.resent == 1
+
+def test_simulator_crash(server, tmp_path):
+    client = EvaluationClient(server(workers=1), KEY, timeout=5)
+    records = client.map([{'value' : 1.0, 'action' : 'crash', 'once' : str(tmp_path/'crashed')}, {'value' : 2.0}], {})
+    assert [record.goodness for record in records] == [1, 2]
+    assert client.resent == 1
+    # a design that always crashes fails after its retries instead of hanging the client
+    assert client.map([{'value' : 3.0, 'action' : 'crash'}], {}) == [None]
+    assert client.failures == 1
+
+# takes one design off the queue and dies before starting it, like a worker killed at the wrong moment
+def take_one(address : tuple[str, int], connected) -> None:
+    tasks = connect(address, KEY).get_task_queue()
+    connected.set()
+    tasks.get()
+    os._exit(1)
+
+def test_lost_worker(server):
+    address = server(workers=0)
+    connected = multiprocessing.Event()
+    lost = multiprocessing.Process(target=take_one, args=(address, connected))
+    lost.start()
+    connected.wait(10)
+    time.sleep(0.2) # into tasks.get
+    threading.Timer(1, lambda: server.processes.extend(start_workers(address, 1, KEY))).start()
+    client = EvaluationClient(address, KEY, timeout=1, queue_wait=1)
+    records = client.map([{'value' : 1.0}], {})
+    lost.join()
+    assert records[0].goodness == 1
+    assert client.resent == 1
+
+# a full queue holds the client back until workers take designs
+def test_back_pressure(server):
+    address = server(queue_size=2, workers=0)
+    client = EvaluationClient(address, KEY, timeout=5)
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(client.map([{'value' : float(i)} for i in range(10)], {})))
+    thread.start()
+    time.sleep(1.5)
+    tasks = connect(address, KEY).get_task_queue()
+    assert tasks.qsize() == 2 and not results
+    server.processes.extend(start_workers(address, 2, KEY))
+    thread.join(30)
+    assert [record.goodness for record in results] == [float(i) for i in range(10)]
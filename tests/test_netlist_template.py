@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from scipy.stats import qmc
+
+##########################################
+
+from circuit_analysis import CircuitAnalyzer
+from netlist_template import get_template
+from optimizer import get_start_design
+from simulated_annealing import get_encoding
+from simulation_session import get_session
+from start_generator import get_candidates
+
+def get_designs(s_0 : dict, n : int) -> list[dict]:
+    encoding = get_encoding(s_0)
+    x_0 = encoding.encode(s_0)
+    return [encoding.decode(encoding.unflat(x)) for x in get_candidates(encoding, x_0, qmc.Sobol(len(encoding.flat(x_0)), seed=0), n)]
+
+# the altered template answers like a netlist generated for each design, on both transistor corners
+@pytest.mark.parametrize('dBeta', [False, True])
+def test_template_matches_netlist(mock_session, config, dBeta):
+    for s in get_designs(get_start_design(config.replace(dBeta=dBeta)), 8):
+        netlist, template = CircuitAnalyzer(s), CircuitAnalyzer(s, template=True)
+        assert template.OP_currents == pytest.approx(netlist.OP_currents, rel=1e-12)
+        assert (template.goodness, template.BW, template.DC_gain) == pytest.approx((netlist.goodness, netlist.BW, netlist.DC_gain), rel=1e-12)
+
+# records the alter and altermod calls a template makes on the session's ngspice
+@pytest.fixture
+def alters(mock_session, monkeypatch):
+    ngspice = get_session().ngspice
+    calls = []
+    alter_device, alter_model = ngspice.alter_device, ngspice.alter_model
+    monkeypatch.setattr(ngspice, 'alter_device', lambda device, **parameters: (calls.append(('alter', device, parameters)), alter_device(device, **parameters)))
+    monkeypatch.setattr(ngspice, 'alter_model', lambda model, **parameters: (calls.append(('altermod', model, parameters)), alter_model(model, **parameters)))
+    return calls
+
+# alternating designs and corners only alters the values that changed since the last analysis
+def test_alters_only_changes(config, alters):
+    s_a = get_start_design(config.replace(dBeta=True))
+    # the template is built for the first corner, LO
+    s_b = {**s_a, 'cascode1' : {**s_a['cascode1'], 'RC' : 2000.0}}
+    template = get_template(s_a)
+    template.bind(s_a, 'ZTX107-LO').operating_point()
+    assert alters == []
+    alters.clear()
+    template.bind(s_a, 'ZTX107-HI').operating_point()
+    assert alters == [('altermod', 'ZTX107-LO', {'bf' : 700.0})]
+    alters.clear()
+    template.bind(s_b, 'ZTX107-HI').operating_point()
+    assert alters == [('alter', 'r.xfbamp1.xcascode_1.rrc', {'resistance' : 2000.0})]
+    alters.clear()
+    template.bind(s_b, 'ZTX107-HI').ac(1, 1e6, 10)
+    assert alters == []
+    template.bind(s_a, 'ZTX107-LO').operating_point()
+    assert alters == [('alter', 'r.xfbamp1.xcascode_1.rrc', {'resistance' : 3010.0}), ('altermod', 'ZTX107-LO', {'bf' : 250.0})]
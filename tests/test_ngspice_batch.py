@@ -0,0 +1,80 @@
+import os
+import stat
+import sys
+
+import numpy as np
+import pytest
+from scipy.stats import qmc
+
+##########################################
+
+import ngspice_batch
+from eval_cache import evaluate, evaluate_batch
+from fake_ngspice import raw_plot
+from ngspice_batch import BatchSimulator, read_raw, run_batch
+from optimizer import get_start_design
+from simulated_annealing import get_encoding
+from start_generator import get_candidates
+from subcircuit_def import get_amp_circuit
+
+# ngspice -b answered by tests/fake_ngspice.py
+@pytest.fixture
+def fake_ngspice(tmp_path, monkeypatch):
+    command = tmp_path/'ngspice'
+    command.write_text(f"#!/bin/sh\nexec {sys.executable} {os.path.join(os.path.dirname(__file__), 'fake_ngspice.py')} \"$@\"\n")
+    command.chmod(command.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setattr(ngspice_batch, 'NGSPICE_COMMAND', str(command))
+
+def get_designs(s_0 : dict, n : int) -> list[dict]:
+    encoding = get_encoding(s_0)
+    x_0 = encoding.encode(s_0)
+    return [encoding.decode(encoding.unflat(x)) for x in get_candidates(encoding, x_0, qmc.Sobol(len(encoding.flat(x_0)), seed=0), n)]
+
+# a real operating point plot followed by a complex AC plot, read back by the kind of analysis
+def test_read_raw(tmp_path):
+    frequency = np.array([1.0, 10.0, 100.0])
+    AC_out = np.array([10 + 1j, 9 - 2j, 1 - 5j])
+    path = tmp_path/'plots.raw'
+    path.write_bytes(raw_plot('Operating Point', ['i(vvdc)', 'vdc#branch', 'v(out)'], np.array([[-1e-2, -2e-3, 4.5]]))
+                     + raw_plot('AC Analysis', ['frequency', 'v(AC_out)'], np.stack([frequency.astype(complex), AC_out], axis=1)))
+    plots = read_raw(str(path))
+    assert set(plots) == {'op', 'ac'}
+    op, ac = plots['op'], plots['ac']
+    assert op.name == 'Operating Point'
+    assert op.branches == {'vvdc' : pytest.approx([-1e-2]), 'vdc' : pytest.approx([-2e-3])}
+    assert op.nodes['out'] == pytest.approx([4.5])
+    assert np.array_equal(ac.frequency, frequency) and not np.iscomplexobj(ac.frequency)
+    assert np.array_equal(ac.AC_out, AC_out)
+    with pytest.raises(AttributeError):
+        ac.missing
+
+def test_read_raw_empty(tmp_path):
+    path = tmp_path/'empty.raw'
+    path.write_bytes(b'')
+    assert read_raw(str(path)) == dict()
+
+# designs evaluated in ngspice -b processes score like the same designs simulated in the session
+@pytest.mark.parametrize('dBeta', [False, True])
+def test_batch_matches_session(fake_ngspice, mock_session, config, dBeta):
+    designs = get_designs(get_start_design(config.replace(dBeta=dBeta)), 4)
+    expected = [evaluate(s) for s in designs]
+    records = evaluate_batch(designs, nProcesses=2, batch=True)
+    for record, reference in zip(records, expected):
+        assert (record.BW, record.DC_gain, record.OP_current, record.goodness) == pytest.approx((reference.BW, reference.DC_gain, reference.OP_current, reference.goodness), rel=1e-9)
+
+# a crashed or hung ngspice process only fails its own deck
+def test_failed_decks(fake_ngspice, start_design):
+    simulator = BatchSimulator(get_amp_circuit(start_design, 'ZTX107-NOM'))
+    deck = simulator.deck(['op'])
+    results = run_batch([deck, deck.replace('\n.op', '\n* CRASH\n.op'), deck.replace('\n.op', '\n* HANG\n.op'), deck], nProcesses=4, timeout=2)
+    assert [result is None for result in results] == [False, True, True, False]
+    assert results[0]['op'].branches['vvdc'] == pytest.approx(results[3]['op'].branches['vvdc'])
+
+# a simulator runs its command once and raises like PySpice when ngspice failed
+def test_simulator_failure(fake_ngspice, start_design):
+    simulator = BatchSimulator(get_amp_circuit(start_design, 'ZTX107-NOM'))
+    assert simulator.operating_point().branches['vvdc'][0] < 0
+    simulator.netlist = simulator.netlist.replace('.title main', '.title main\n* CRASH', 1)
+    assert simulator.operating_point() is simulator.analyses['op']
+    with pytest.raises(NameError):
+        simulator.ac(1, 1e6, 10)
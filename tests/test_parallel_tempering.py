@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+##########################################
+
+from checkpoint import WalkCheckpoint
+from parallel_tempering import SWAP_INTERVAL, ParallelTempering, temperature_ladder
+from test_checkpoint import Interrupted, InterruptedCheckpoint
+
+def get_tempering(s_0 : dict, config, n : int = 4) -> ParallelTempering:
+    return ParallelTempering(s_0, temperature_ladder(1, 30, n), config=config)
+
+def test_temperature_ladder():
+    assert temperature_ladder(1, 30, 4) == pytest.approx([1, 30**(1/3), 30**(2/3), 30])
+    assert temperature_ladder(1, 30, 1) == pytest.approx([30])
+
+# swap rounds alternate between the pairs starting at an odd and at an even replica
+def test_swaps_alternate(mock_session, config, start_design):
+    np.random.seed(1)
+    tempering = get_tempering(start_design, config)
+    tempering.run(3*SWAP_INTERVAL)
+    assert tempering.swaps_tried.tolist() == [1, 2, 1]
+    tempering.run(4*SWAP_INTERVAL)
+    assert tempering.swaps_tried.tolist() == [2, 2, 2]
+
+# a hotter replica holding the lower energy always hands its state down, one holding a rejected design never does
+def test_swap_takes_lower_energy(config, start_design):
+    tempering = get_tempering(start_design, config)
+    tempering.states = [np.full(tempering.encoding.size, i) for i in range(4)]
+    tempering.energies = np.array([-2.0, -5.0, -3.0, -0.5])
+    tempering.steps = 2*SWAP_INTERVAL # even round, pairs (0, 1) and (2, 3)
+    np.random.seed(2)
+    tempering._ParallelTempering__swap()
+    assert [int(x[0]) for x in tempering.states] == [1, 0, 2, 3]
+    assert tempering.energies.tolist() == [-5.0, -2.0, -3.0, -0.5]
+    assert tempering.swaps_tried.tolist() == [1, 0, 1]
+    assert tempering.swaps_accepted.tolist() == [1, 0, 0]
+
+def test_rates(config, start_design):
+    tempering = get_tempering(start_design, config, n=3)
+    assert tempering.acceptance_rates().tolist() == [0, 0, 0]
+    assert tempering.swap_rates().tolist() == [0, 0]
+    tempering.steps = 10
+    tempering.accepted = np.array([2, 5, 9])
+    tempering.swaps_tried = np.array([4, 0])
+    tempering.swaps_accepted = np.array([1, 0])
+    assert tempering.acceptance_rates().tolist() == [0.2, 0.5, 0.9]
+    assert tempering.swap_rates().tolist() == [0.25, 0]
+    assert "25.0%" in tempering.report()
+
+# tempering resumed from its checkpoint ends like a run that went through
+def test_resume_matches_uninterrupted(tmp_path, mock_session, config, start_design):
+    np.random.seed(11)
+    expected = get_tempering(start_design, config).run(60, checkpoint=WalkCheckpoint(str(tmp_path/'through.npz'), interval=25))
+    np.random.seed(11)
+    path = str(tmp_path/'interrupted.npz')
+    with pytest.raises(Interrupted):
+        get_tempering(start_design, config).run(60, checkpoint=InterruptedCheckpoint(path, interval=25, stop_after=1))
+    np.random.seed(12)
+    resumed = get_tempering(start_design, config)
+    assert resumed.run(60, checkpoint=WalkCheckpoint(path, interval=25)) == expected
+    assert resumed.steps == 60
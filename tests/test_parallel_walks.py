@@ -0,0 +1,34 @@
+import numpy as np
+
+##########################################
+
+from eval_cache import EvaluationCache
+from parallel_walks import run_walks_parallel
+
+# a walk's evaluations reach the parent's on-disk cache, so the same run again simulates nothing
+def test_second_run_simulates_nothing(tmp_path, mock_workers, config, start_design):
+    config = config.replace(nWalk=2, nWorkers=2)
+    path = str(tmp_path/'cache')
+    cache = EvaluationCache(path=path)
+    first = run_walks_parallel(T=20, kMax=40, s_0=start_design, numWalk=2, nWorkers=2, seed=3, cache=cache, config=config)
+    assert cache.misses > 0 and len(cache) > 0
+    cache.close()
+    cache = EvaluationCache(path=path)
+    second = run_walks_parallel(T=20, kMax=40, s_0=start_design, numWalk=2, nWorkers=2, seed=3, cache=cache, config=config)
+    assert second == first
+    assert cache.misses == 0 and cache.hits > 0
+    cache.close()
+
+def test_records_round_trip(mock_session, start_design):
+    parent, worker = EvaluationCache(), EvaluationCache(keep_new=True)
+    from eval_cache import evaluate
+    record = evaluate(start_design, parent)
+    worker.merge(parent.records())
+    assert evaluate(start_design, worker) == record
+    other = dict(start_design, RF=start_design['RF']*2)
+    evaluate(other, worker)
+    drained = worker.drain()
+    assert (drained['hits'], drained['misses'], len(drained['records'])) == (1, 1, 1)
+    parent.merge_drained(drained)
+    assert parent.get(other) is not None
+    assert worker.drain() == {'records' : [], 'hits' : 0, 'disk_hits' : 0, 'misses' : 0}
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+##########################################
+
+import pareto
+from pareto import ParetoArchive, crowding_distance, domination_amount
+
+# non-dominated rows of F by pairwise comparison, the first of equal rows
+def reference_front(F : np.ndarray) -> set[tuple]:
+    front = set()
+    for i, f in enumerate(F):
+        dominated = any(np.all(g <= f) and np.any(g < f) for g in F)
+        if not dominated and not any(np.array_equal(g, f) for g in F[:i]):
+            front.add(tuple(f))
+    return front
+
+def fill(archive : ParetoArchive, F : np.ndarray) -> None:
+    for i, f in enumerate(F):
+        archive.insert(np.full((1, 2), i), f, goodness=float(i))
+
+# integer objectives give ties and duplicates, more points than ARCHIVE_CAPACITY make the archive grow
+@pytest.mark.parametrize('seed', range(5))
+def test_insert_keeps_non_dominated(seed):
+    F = np.random.default_rng(seed).integers(0, 30, size=(600, 3)).astype(float)
+    archive = ParetoArchive((1, 2), limit=None)
+    fill(archive, F)
+    assert set(map(tuple, archive.objectives())) == reference_front(F)
+    assert len(archive) == len(reference_front(F))
+    # states and goodness move with their objectives when the archive compacts
+    for x, f, goodness in zip(archive.states(), archive.objectives(), archive.goodness[:len(archive)]):
+        assert np.array_equal(F[int(goodness)], f)
+        assert (x == int(goodness)).all()
+
+def test_insert_result():
+    archive = ParetoArchive((1, 2), limit=None)
+    assert archive.insert(np.zeros((1, 2)), np.array([1.0, 1.0, 1.0]), 1)
+    assert not archive.insert(np.zeros((1, 2)), np.array([1.0, 1.0, 1.0]), 1) # equal
+    assert not archive.insert(np.zeros((1, 2)), np.array([1.0, 2.0, 1.0]), 1) # dominated
+    assert archive.insert(np.zeros((1, 2)), np.array([0.0, 2.0, 1.0]), 1) # trade off
+    assert archive.insert(np.zeros((1, 2)), np.array([0.0, 0.0, 0.0]), 1) # dominates both
+    assert len(archive) == 1
+
+def test_crowding_distance():
+    F = np.array([[0.0, 4.0], [1.0, 3.0], [3.0, 1.0], [4.0, 0.0]])
+    assert list(crowding_distance(F)) == [np.inf, 1.5, 1.5, np.inf]
+    assert np.isinf(crowding_distance(F[:2])).all()
+
+# past the limit and its slack the most crowded designs go, the extremes of every objective stay
+def test_thinning():
+    limit = 20
+    # points on the plane x + y + z = 1 never dominate each other
+    F = np.random.default_rng(0).dirichlet(np.ones(3), size=200)
+    archive = ParetoArchive((1, 2), limit=limit)
+    for i, f in enumerate(F):
+        archive.insert(np.full((1, 2), i), f, goodness=float(i))
+        assert len(archive) <= limit*(1 + pareto.ARCHIVE_SLACK)
+    # the first thinning happens on the insertion that passes the slack
+    n = int(limit*(1 + pareto.ARCHIVE_SLACK)) + 1
+    thinned = ParetoArchive((1, 2), limit=limit)
+    fill(thinned, F[:n])
+    assert len(thinned) == limit
+    assert set(thinned.goodness[:limit].astype(int)) == set(np.argsort(-crowding_distance(F[:n]), kind='stable')[:limit])
+    for j in range(3):
+        assert F[:n, j].min() in thinned.objectives()[:, j]
+        assert F[:n, j].max() in thinned.objectives()[:, j]
+
+def test_state_round_trip():
+    F = np.random.default_rng(1).dirichlet(np.ones(3), size=300)
+    archive = ParetoArchive((1, 2), limit=None)
+    fill(archive, F)
+    restored = ParetoArchive((1, 2), limit=None)
+    restored.restore(archive.state())
+    assert np.array_equal(restored.objectives(), archive.objectives())
+    assert np.array_equal(restored.states(), archive.states())
+    merged = ParetoArchive((1, 2), limit=None)
+    merged.merge(archive)
+    assert set(map(tuple, merged.objectives())) == set(map(tuple, archive.objectives()))
+
+def test_domination_amount():
+    archive = ParetoArchive((1, 2), limit=None)
+    archive.insert(np.zeros((1, 2)), np.array([0.0, 0.0, 0.0]), 1)
+    assert domination_amount(archive, None, np.array([-1.0, 1.0, 1.0])) == 0
+    assert domination_amount(archive, None, np.array([1.0, 2.0, 0.0])) > 0
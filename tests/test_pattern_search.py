@@ -0,0 +1,37 @@
+import pytest
+
+##########################################
+
+from checkpoint import WalkCheckpoint
+from eval_cache import evaluate
+from pattern_search import PatternSearch
+from test_checkpoint import Interrupted, InterruptedCheckpoint
+
+# every accepted move lowers the energy, so the search ends at or below where it started
+@pytest.mark.parametrize('sensitivityMoves', [False, True])
+def test_improves_or_keeps_energy(mock_session, config, start_design, sensitivityMoves):
+    config = config.replace(sensitivityMoves=sensitivityMoves)
+    search = PatternSearch(start_design, config=config)
+    s, e = search.run(150)
+    assert e <= -evaluate(start_design).goodness
+    assert e == -evaluate(s).goodness
+    assert search.evaluations <= 150
+
+# energies of every design the search moved to only go down
+def test_energy_never_rises(mock_session, config, start_design):
+    search = PatternSearch(start_design, config=config)
+    energies = []
+    while search.step >= 1 and search.evaluations < 200:
+        search.run(search.evaluations + 20)
+        energies.append(search.e)
+    assert energies == sorted(energies, reverse=True)
+    assert energies[-1] < energies[0]
+
+# a search killed after a sweep's checkpoint ends like one that ran through
+@pytest.mark.parametrize('stop_after', [1, 3])
+def test_resume_matches_uninterrupted(tmp_path, mock_session, config, start_design, stop_after):
+    expected = PatternSearch(start_design, config=config).run(120)
+    path = str(tmp_path/'search.npz')
+    with pytest.raises(Interrupted):
+        PatternSearch(start_design, config=config).run(120, checkpoint=InterruptedCheckpoint(path, interval=1, stop_after=stop_after))
+    assert PatternSearch(start_design, config=config).run(120, checkpoint=WalkCheckpoint(path)) == expected
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+##########################################
+
+from circuit_analysis import CircuitAnalyzer
+from netlist_template import get_path, get_resistor_names
+from optimizer import get_start_design
+from sensitivity import get_drift, get_gradient, get_log_gradient
+from simulated_annealing import get_encoding
+
+# every flat index of the encoding has its own flattened ngspice resistor, and NgSpice's sensitivities name each of them
+@pytest.mark.parametrize('dBeta', [False, True])
+def test_names_cover_flat_indices(mock_session, config, dBeta):
+    s = get_start_design(config.replace(dBeta=dBeta))
+    encoding = get_encoding(s)
+    names = get_resistor_names(s, list(s['trans'].values())[0])
+    assert all(path in names for path in encoding.paths)
+    assert len({names[path] for path in encoding.paths}) == encoding.size
+    DC, AC = CircuitAnalyzer(s, keep_simulators=True).get_sensitivities(None)
+    assert all(names[path] in DC for path in encoding.paths)
+    # the flat index of each path moves the resistor at that path
+    x = encoding.flat(encoding.encode(s))
+    for j, path in enumerate(encoding.paths):
+        moved = x.copy()
+        moved[j] += 1
+        changed = encoding.decode(encoding.unflat(moved))
+        assert [p for p in encoding.paths if get_path(changed, p) != get_path(s, p)] == [path]
+
+# one entry per flat index, each from the sensitivities of its own resistor
+def test_gradient_per_flat_index(mock_session, config, start_design):
+    encoding = get_encoding(start_design)
+    gradient = get_gradient(start_design, encoding, config)
+    assert gradient.shape == (encoding.size,)
+    assert np.all(gradient != 0)
+    analyzer = CircuitAnalyzer(start_design, keep_simulators=True)
+    reversed_gradient = get_log_gradient(analyzer, encoding.paths[::-1])
+    assert reversed_gradient[::-1]*np.log(10)/encoding.len_valid_res == pytest.approx(gradient)
+
+def test_drift():
+    assert np.array_equal(get_drift(None, 0.3, 4), np.zeros(4))
+    assert np.array_equal(get_drift(np.zeros(4), 0.3, 4), np.zeros(4))
+    assert get_drift(np.array([1.0, -4.0, 2.0]), 0.5, 3) == pytest.approx([0.125, -0.5, 0.25])
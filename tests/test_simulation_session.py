@@ -0,0 +1,41 @@
+import pytest
+from scipy.stats import qmc
+
+##########################################
+
+from circuit_analysis import CircuitAnalyzer
+from mock_ngspice import MockNgSpice
+from simulated_annealing import get_encoding
+from simulation_session import SimulationSession, set_session
+from start_generator import get_candidates
+
+def get_designs(s_0 : dict, n : int) -> list[dict]:
+    encoding = get_encoding(s_0)
+    x_0 = encoding.encode(s_0)
+    return [encoding.decode(encoding.unflat(x)) for x in get_candidates(encoding, x_0, qmc.Sobol(len(encoding.flat(x_0)), seed=0), n)]
+
+def evaluate(designs : list[dict], session : SimulationSession, template : bool) -> list[tuple]:
+    set_session(session)
+    try:
+        return [(analyzer.goodness, analyzer.BW, analyzer.OP_current) for analyzer in (CircuitAnalyzer(s, template=template) for s in designs)]
+    finally:
+        set_session(None)
+
+# running out of max_runs releases ngspice's memory between analyses and later designs evaluate as before
+@pytest.mark.parametrize('template', [False, True])
+def test_release_after_max_runs(start_design, template):
+    designs = get_designs(start_design, 8)
+    expected = evaluate(designs, SimulationSession(ngspice=MockNgSpice()), template)
+    session = SimulationSession(max_runs=3, ngspice=MockNgSpice())
+    assert evaluate(designs, session, template) == expected
+    assert session.releases == (session.total_runs - 1)//3
+    assert session.runs <= 3
+
+# a release drops the loaded circuit, so its owner loads it again
+def test_release_unloads(start_design):
+    session = SimulationSession(ngspice=MockNgSpice())
+    evaluate([start_design], session, template=False)
+    assert session.loaded is not None
+    session.release()
+    assert session.loaded is None and session.runs == 0 and not session.ngspice.resistors
+    assert not session.holds(None)
@@ -0,0 +1,102 @@
+import ast
+import os
+import numpy as np
+import pytest
+
+##########################################
+
+import small_signal
+from circuit_analysis import ACAnalysis, CircuitAnalyzer, SWEEP_POINTS, get_sweep
+from ac_metrics import get_AC_arrays
+from mock_ngspice import MockAnalysis
+from small_signal import AC_TOLERANCE, check_AC, get_op_saves, get_op_vector, get_small_signal_simulator
+
+# operating points and ngspice sweeps of the default start design, one per tolerance
+REFERENCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ac_reference.npz')
+
+@pytest.fixture
+def counts(monkeypatch):
+    monkeypatch.setattr(small_signal, 'counts', {'fast' : 0, 'fallback' : 0, 'checked' : 0, 'mismatched' : 0})
+    monkeypatch.setattr(small_signal, 'warned', False)
+    return small_signal.counts
+
+# stands in for a small signal simulator whose gains are off ngspice's by "error" dB
+class OffsetSolver:
+    def __init__(self, analysis : ACAnalysis, error : float) -> None:
+        self.analysis = analysis
+        self.error = error
+
+    def solve(self, frequency : np.ndarray) -> np.ndarray:
+        return self.analysis.AC_out*10**(self.error/20)
+
+def sweep() -> ACAnalysis:
+    frequency = 1e3*10**(np.arange(251)/50)
+    return ACAnalysis(frequency, 1000/(1 + 1j*frequency/7.2e6)**2)
+
+def test_check_AC(counts):
+    analysis = sweep()
+    assert check_AC({'LO' : OffsetSolver(analysis, 0.05)}, {'LO' : analysis})
+    assert not check_AC({'LO' : OffsetSolver(analysis, 0), 'HI' : OffsetSolver(analysis, -0.2)}, {'LO' : analysis, 'HI' : analysis})
+    assert not check_AC({'LO' : OffsetSolver(analysis, np.inf)}, {'LO' : analysis})
+    assert (counts['checked'], counts['mismatched']) == (3, 2)
+
+# one warning per process once the mismatch rate passes MISMATCH_WARN_RATE over enough checks
+def test_mismatch_warning(counts, capsys):
+    analysis = sweep()
+    for i in range(small_signal.MISMATCH_MIN_CHECKS - 1):
+        check_AC({'LO' : OffsetSolver(analysis, 1 if i < 2 else 0)}, {'LO' : analysis})
+    assert "Warning" not in capsys.readouterr().out
+    check_AC({'LO' : OffsetSolver(analysis, 1)}, {'LO' : analysis})
+    assert "Warning" in capsys.readouterr().out
+    check_AC({'LO' : OffsetSolver(analysis, 1)}, {'LO' : analysis})
+    assert "Warning" not in capsys.readouterr().out
+
+# counts drained from workers are judged together in the parent
+def test_merged_counts_warn(counts, capsys):
+    small_signal.merge_counts({'fast' : 100, 'fallback' : 0, 'checked' : 40, 'mismatched' : 1})
+    assert "Warning" not in capsys.readouterr().out
+    small_signal.merge_counts({'fast' : 100, 'fallback' : 0, 'checked' : 10, 'mismatched' : 2})
+    assert "Warning" in capsys.readouterr().out
+
+# a checked design is scored from ngspice's sweep, however far off the solver was
+def test_checked_design_keeps_ngspice_sweep(monkeypatch, counts, mock_session, start_design):
+    # the mock saves no transistor vectors, so every transistor gets the same made up bias
+    monkeypatch.setattr(small_signal, 'get_op_vector', lambda analysis, name: {'ic' : 2e-3, 'vbe' : 0.68, 'vbc' : -3.0}[name.split('[')[1][:-1]])
+    expected = CircuitAnalyzer(start_design)
+    checked = CircuitAnalyzer(start_design, fast_AC=True, AC_check=1)
+    assert counts['checked'] == 1
+    assert (checked.BW, checked.DC_gain, checked.goodness) == (expected.BW, expected.DC_gain, expected.goodness)
+
+# the small signal solve against ngspice itself, biased from ngspice's operating point of the same design
+@pytest.mark.skipif(not os.path.exists(REFERENCE), reason="no stored ngspice sweep, PYTHONPATH=. python tests/test_small_signal.py writes one where ngspice is installed")
+def test_matches_stored_ngspice_sweep():
+    with np.load(REFERENCE) as data:
+        reference = {name : data[name] for name in data.files}
+    s = ast.literal_eval(str(reference['design']))
+    for key, trans in s['trans'].items():
+        op = MockAnalysis(nodes={name : reference[f"{key}:{name}"] for name in get_op_saves(s, trans)})
+        simulator = get_small_signal_simulator(s, trans, op)
+        error = 20*np.log10(np.absolute(simulator.solve(reference[f"{key}:frequency"]))/np.absolute(reference[f"{key}:AC_out"]))
+        assert np.max(np.abs(error)) <= AC_TOLERANCE
+
+# runs the default start design through ngspice and stores what test_matches_stored_ngspice_sweep compares against
+def write_reference(path : str = REFERENCE) -> None:
+    from helper_funcs import RunConfig
+    from optimizer import get_start_design
+    from simulation_session import get_session
+    from subcircuit_def import get_amp_circuit
+    s = get_start_design(RunConfig.preset('default'))
+    arrays = {'design' : np.array(repr(s))}
+    for key, trans in s['trans'].items():
+        simulator = get_session().simulator(get_amp_circuit(s, trans))
+        simulator.save(["AC_out"] + get_op_saves(s, trans))
+        op = simulator.operating_point()
+        for name in get_op_saves(s, trans):
+            arrays[f"{key}:{name}"] = np.array(get_op_vector(op, name))
+        arrays[f"{key}:frequency"], arrays[f"{key}:AC_out"] = get_AC_arrays(simulator.ac(**get_sweep(SWEEP_POINTS)))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, **arrays)
+
+if __name__ == "__main__":
+    write_reference()
+    print(f"Wrote {REFERENCE}")
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+##########################################
+
+from checkpoint import WalkCheckpoint
+from simulated_annealing import get_encoding, run_walk
+from speculative import SpeculativeWalk
+from test_checkpoint import Interrupted, InterruptedCheckpoint
+from trace_log import TraceWriter, read_trace
+
+# with one proposal per round the speculative walk is run_walk, drawing the same random numbers in the same order
+@pytest.mark.parametrize('settings', [{}, {'surrogate' : True, 'surrogateMinPoints' : 20}])
+@pytest.mark.parametrize('T', [0, 20])
+def test_one_proposal_matches_run_walk(tmp_path, mock_session, config, start_design, settings, T):
+    config = config.replace(**settings)
+    size = get_encoding(start_design).size
+    np.random.seed(21)
+    expected = run_walk(T, 80, start_design, trace=TraceWriter(str(tmp_path/'walk.trace'), walk=0, state_size=size), config=config)
+    after_walk = np.random.random()
+    np.random.seed(21)
+    walk = SpeculativeWalk(start_design, K=1, config=config)
+    assert walk.run(T, 80, trace=TraceWriter(str(tmp_path/'speculative.trace'), walk=0, state_size=size)) == expected
+    assert np.random.random() == after_walk
+    assert np.array(read_trace(str(tmp_path/'speculative.trace'))).tobytes() == np.array(read_trace(str(tmp_path/'walk.trace'))).tobytes()
+    assert walk.steps == walk.rounds == 80
+
+# rounds end at checkpoints, so a walk resumed from one ends where an uninterrupted walk does
+def test_resumed_speculative_walk(tmp_path, mock_session, config, start_design):
+    np.random.seed(22)
+    expected = SpeculativeWalk(start_design, K=4, config=config).run(20, 60, checkpoint=WalkCheckpoint(str(tmp_path/'through.npz'), interval=25))
+    np.random.seed(22)
+    path = str(tmp_path/'interrupted.npz')
+    with pytest.raises(Interrupted):
+        SpeculativeWalk(start_design, K=4, config=config).run(20, 60, checkpoint=InterruptedCheckpoint(path, interval=25, stop_after=1))
+    np.random.seed(23)
+    walk = SpeculativeWalk(start_design, K=4, config=config)
+    assert walk.run(20, 60, checkpoint=WalkCheckpoint(path, interval=25)) == expected
+    assert walk.steps == 60
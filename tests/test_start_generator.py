@@ -0,0 +1,37 @@
+import pytest
+from collections import Counter
+from scipy.stats import qmc
+
+##########################################
+
+import circuit_analysis
+from eval_cache import EvaluationCache
+from optimizer import get_start_design
+from simulated_annealing import get_encoding
+from start_generator import get_candidates, screen
+
+@pytest.fixture
+def stages(monkeypatch):
+    stages = Counter()
+    monkeypatch.setattr(circuit_analysis, 'stage_hook', lambda stage, seconds: stages.update([stage]))
+    return stages
+
+# every candidate's operating points are simulated by one analyzer, and a screened candidate is cached whatever its stage
+@pytest.mark.parametrize('dBeta', [False, True])
+def test_screen_simulates_once(mock_session, config, stages, dBeta):
+    config = config.replace(dBeta=dBeta)
+    s_0 = get_start_design(config)
+    encoding = get_encoding(s_0)
+    x_0 = encoding.encode(s_0)
+    designs = [encoding.decode(encoding.unflat(x)) for x in get_candidates(encoding, x_0, qmc.Sobol(len(encoding.flat(x_0)), seed=0), 16)]
+    cache = EvaluationCache()
+    results = []
+    for s in designs:
+        stages.clear()
+        results.append(screen(s, cache, config))
+        assert stages['dc'] == 1
+        assert stages['ac'] == (1 if results[-1][0] in ('passed', 'gain') else 0)
+    assert {stage for stage, record in results} <= {'passed', 'gain', 'dc'}
+    stages.clear()
+    assert [screen(s, cache, config) for s in designs] == results
+    assert not stages
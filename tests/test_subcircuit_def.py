@@ -0,0 +1,18 @@
+##########################################
+
+from subcircuit_def import FeedBackAmp, get_fused_circuit
+
+# a corner's amplifier is the plain one under its own name
+def test_feedbackamp_name(start_design):
+    plain = FeedBackAmp(start_design, 'ZTX107-NOM')
+    named = FeedBackAmp(start_design, 'ZTX107-NOM', name='feedbackamp_lo')
+    assert (plain.name, named.name) == ('feedbackamp', 'feedbackamp_lo')
+    assert named.external_nodes == plain.external_nodes == FeedBackAmp.NODES
+    assert str(named) == str(plain).replace('.subckt feedbackamp ', '.subckt feedbackamp_lo ').replace('.ends feedbackamp', '.ends feedbackamp_lo')
+
+def test_fused_circuit_defines_every_corner(start_design):
+    circuit = get_fused_circuit(start_design, {'LO' : 'ZTX107-LO', 'HI' : 'ZTX107-HI'})
+    netlist = str(circuit)
+    for suffix in ('lo', 'hi'):
+        assert f".subckt feedbackamp_{suffix} " in netlist
+        assert f"Xfbamp_{suffix} " in netlist
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+##########################################
+
+import surrogate
+from simulated_annealing import is_hopeless, may_accept
+from surrogate import Surrogate
+
+# smooth goodness over log resistor values with a known maximum of 10
+def goodness(x : np.ndarray) -> float:
+    return 2 + 8*np.exp(-np.sum((x - 0.5)**2)/0.5)
+
+def get_model(n : int, seed : int = 0, **kwargs) -> Surrogate:
+    rng = np.random.default_rng(seed)
+    model = Surrogate(3, **kwargs)
+    for x in rng.uniform(-1, 2, (n, 3)):
+        model.add(x, goodness(x))
+    return model
+
+@pytest.fixture(autouse=True)
+def counts():
+    surrogate.drain_counts()
+    yield surrogate.counts
+    surrogate.drain_counts()
+
+# kappa standard deviations above the fit keep the optimistic energy under the true energy
+# it is a bound with high probability, the rare design above it is only just above
+def test_optimistic_energy_is_lower_bound():
+    model = get_model(400)
+    xs = np.random.default_rng(1).uniform(-1, 2, (200, 3))
+    excess = np.array([(model.optimistic_energy(x) + goodness(x))/goodness(x) for x in xs])
+    assert np.mean(excess > 0) <= 0.05
+    assert np.max(excess) < 0.01
+
+def test_predict_interpolates():
+    model = get_model(400)
+    for x in np.random.default_rng(2).uniform(-0.5, 1.5, (50, 3)):
+        mean, sd = model.predict(x)
+        assert 10**mean - 1 == pytest.approx(goodness(x), rel=0.05)
+        assert sd >= 0
+
+# nothing is judged, and so nothing skipped, until the surrogate has min_points
+def test_nothing_skipped_below_min_points(counts):
+    model = get_model(99, min_points=100)
+    for x in np.random.default_rng(3).uniform(-1, 2, (50, 3)):
+        assert model.optimistic_energy(x) is None
+        assert not is_hopeless(model, x, -10, 1)
+    assert counts == {'proposals' : 100, 'skipped' : 0}
+    assert not is_hopeless(None, np.zeros(3), -10, 1)
+
+# a proposal is skipped exactly when P could not accept its optimistic energy
+def test_skipped_only_when_rejected(counts):
+    model = get_model(400, min_points=100)
+    rng = np.random.default_rng(4)
+    skipped = 0
+    for x in rng.uniform(-1, 2, (200, 3)):
+        E_past, T = -rng.uniform(1, 12), rng.choice([0, 1, 10, 100])
+        hopeless = is_hopeless(model, x, E_past, T)
+        assert hopeless == (not may_accept(E_past, model.optimistic_energy(x), T))
+        skipped += hopeless
+    assert 0 < skipped < 200
+    assert counts['skipped'] == skipped
+
+def test_state_round_trip():
+    model = get_model(150, max_points=100)
+    restored = Surrogate(3, max_points=100)
+    restored.restore(model.state())
+    x = np.full(3, 0.3)
+    assert restored.predict(x) == model.predict(x)
+    assert restored.next == model.next == 50
@@ -0,0 +1,33 @@
+import csv
+import pytest
+
+##########################################
+
+from eval_cache import EvaluationCache
+from helper_funcs import RunConfig
+from sweep import get_sweep_configs, parse_sweep, run_sweep
+
+def test_parse_sweep():
+    assert parse_sweep('sigma=0.3,1') == ('sigma', [0.3, 1.0])
+    assert parse_sweep('nWalk=1,2') == ('nWalk', [1, 2])
+    assert parse_sweep('dBeta=True,False,y,0') == ('dBeta', [True, False, True, False])
+    with pytest.raises(ValueError):
+        parse_sweep('dBeta=maybe')
+    with pytest.raises(ValueError):
+        parse_sweep('unknown=1')
+
+def test_sweep_configs():
+    configs = get_sweep_configs(RunConfig.preset('test'), dict([parse_sweep('T=10,30'), parse_sweep('dBeta=true,false')]))
+    assert [(config.T, config.dBeta) for config in configs] == [(10, True), (10, False), (30, True), (30, False)]
+
+# runs on worker processes count their evaluations in the shared cache
+def test_sweep_counts_worker_evaluations(tmp_path, mock_workers, config):
+    base = config.replace(isRand=False, kAnnealing=30, nWalk=2, nWorkers=2)
+    path = tmp_path/'sweep.csv'
+    run_sweep(get_sweep_configs(base, dict([parse_sweep('T=10,10')])), str(path), cache=EvaluationCache())
+    with open(path) as file:
+        rows = list(csv.DictReader(file))
+    assert len(rows) == 2
+    assert int(rows[0]['evaluations']) > 30 and int(rows[0]['cache_hits']) < int(rows[0]['evaluations'])
+    # the second run's workers start from the first run's evaluations
+    assert 0 < int(rows[1]['cache_hits']) <= int(rows[1]['evaluations'])
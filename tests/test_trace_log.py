@@ -0,0 +1,68 @@
+import shutil
+import numpy as np
+import pytest
+
+##########################################
+
+from checkpoint import WalkCheckpoint
+from eval_cache import CachedEvaluation
+from simulated_annealing import get_encoding, run_walk
+from trace_log import TraceLog, TraceWriter, read_trace
+
+def record(goodness : float) -> CachedEvaluation:
+    return CachedEvaluation(goodness=goodness, BW=1e6, DC_gain=900, OP_current=0.01)
+
+def test_records_round_trip(tmp_path):
+    writer = TraceWriter(str(tmp_path/'walk.trace'), walk=2, state_size=3, batch=4)
+    x = np.arange(6).reshape(3, 2)
+    for step in range(10):
+        writer.record(step, x + step, record(step) if step%3 else None)
+    writer.flush()
+    records = read_trace(writer.path)
+    assert list(records['step']) == list(range(10))
+    assert set(records['walk']) == {2}
+    assert np.isnan(records['goodness'][::3]).all()
+    assert list(records['goodness'][1::3]) == [1, 4, 7]
+    assert np.array_equal(records['state'][9], x + 9)
+
+# records on disk and in the buffer past the checkpoint step are dropped
+def test_truncate(tmp_path):
+    writer = TraceWriter(str(tmp_path/'walk.trace'), walk=0, state_size=1, batch=4)
+    for step in range(10):
+        writer.record(step, np.zeros((1, 2)), record(step))
+    writer.truncate(5)
+    assert list(read_trace(writer.path)['step']) == list(range(6))
+    writer.truncate(-1)
+    assert len(read_trace(writer.path)) == 0
+
+# keeps a copy of the walk's first checkpoint, the state a run killed later would resume from
+class CopyingCheckpoint(WalkCheckpoint):
+    def save(self, **arrays) -> None:
+        super().save(**arrays)
+        if int(arrays['step']) == self.interval:
+            shutil.copy(self.path, self.path + '.first')
+
+# a walk resumed after its trace got ahead of the checkpoint writes the same trace as one that ran through
+def test_resumed_walk_rewrites_trace(tmp_path, mock_session, config, start_design):
+    size = get_encoding(start_design).size
+    np.random.seed(11)
+    checkpoint = CopyingCheckpoint(str(tmp_path/'walk.npz'), interval=25)
+    run_walk(20, 60, start_design, checkpoint=checkpoint, trace=TraceWriter(str(tmp_path/'through.trace'), walk=0, state_size=size, batch=8), config=config)
+    expected = np.array(read_trace(str(tmp_path/'through.trace')))
+    shutil.copy(tmp_path/'through.trace', tmp_path/'resumed.trace') # holds every step, past the first checkpoint
+    np.random.seed(12)
+    run_walk(20, 60, start_design, checkpoint=WalkCheckpoint(checkpoint.path + '.first', interval=25),
+             trace=TraceWriter(str(tmp_path/'resumed.trace'), walk=0, state_size=size, batch=8), config=config)
+    resumed = np.array(read_trace(str(tmp_path/'resumed.trace')))
+    assert list(resumed['step']) == list(range(61))
+    assert resumed.tobytes() == expected.tobytes()
+
+def test_log_column(tmp_path):
+    log = TraceLog(str(tmp_path/'trace'))
+    for walk in range(2):
+        writer = log.writer(f"walk{walk}", walk=walk, state_size=1)
+        writer.record(0, np.zeros((1, 2)), record(walk + 1))
+        writer.flush()
+    assert list(log.column('goodness')) == [1, 2]
+    log.begin()
+    assert len(log.column('goodness')) == 0
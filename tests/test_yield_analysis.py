@@ -0,0 +1,80 @@
+import copy
+import csv
+
+import numpy as np
+import pytest
+
+##########################################
+
+from ac_metrics import BW_GOAL
+from yield_analysis import (RESULT_FIELDS, RESISTOR_TOLERANCE, YIELD_CHUNK, get_passes, get_resistor_paths, get_samples, get_variant,
+                            run_yield_analysis, summarize, wilson_interval)
+
+def test_samples_within_tolerance_and_seeded():
+    factors, BF = get_samples(1000, 14, seed=5)
+    assert factors.shape == (1000, 14) and BF.shape == (1000,)
+    assert np.all(np.abs(factors - 1) <= RESISTOR_TOLERANCE)
+    assert np.all((BF >= 250) & (BF <= 700))
+    again = get_samples(1000, 14, seed=5)
+    assert np.array_equal(again[0], factors) and np.array_equal(again[1], BF)
+    assert not np.array_equal(get_samples(1000, 14, seed=6)[0], factors)
+
+def test_variant_leaves_design_unchanged(start_design):
+    s = copy.deepcopy(start_design)
+    paths = get_resistor_paths(s)
+    values = np.arange(1, len(paths) + 1, dtype=float)
+    variant = get_variant(s, paths, values)
+    assert s == start_design
+    assert variant['trans'] == {'MC' : 'ZTX107-NOM'}
+    assert [variant[path[0]] if len(path) == 1 else variant[path[0]][path[1]] for path in paths] == values.tolist()
+    assert variant['cascode1']['Cc'] == s['cascode1']['Cc']
+
+# rows: passing, bandwidth short, gain out of the window, current over, failed to simulate
+RESULTS = np.array([[2*BW_GOAL, 1000, 0.005],
+                    [BW_GOAL/2, 1000, 0.005],
+                    [2*BW_GOAL, 1500, 0.005],
+                    [2*BW_GOAL, 1000, 0.02],
+                    [np.nan, np.nan, np.nan]])
+
+def test_passes():
+    passes = get_passes(RESULTS)
+    assert passes['BW'].tolist() == [True, False, True, True, False]
+    assert passes['DC_gain'].tolist() == [True, True, False, True, False]
+    assert passes['OP_current'].tolist() == [True, True, True, False, False]
+    assert passes['all'].tolist() == [True, False, False, False, False]
+
+def test_wilson_interval():
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+    assert wilson_interval(0, 10) == pytest.approx((0.0, 0.2775), abs=1e-4)
+    assert wilson_interval(10, 10) == pytest.approx((0.7225, 1.0), abs=1e-4)
+    low, high = wilson_interval(50, 100)
+    assert low < 0.5 < high and 0.5 - low == pytest.approx(high - 0.5)
+
+def test_summarize():
+    summary = summarize(RESULTS)
+    assert (summary['samples'], summary['failed'], summary['yield']) == (5, 1, 0.2)
+    assert summary['yield_95'] == wilson_interval(1, 5)
+    assert summary['pass_rates'] == {'BW' : 0.6, 'DC_gain' : 0.6, 'OP_current' : 0.6}
+    # the failed row is left out of the percentiles
+    assert summary['percentiles']['DC_gain']['p50'] == 1000
+    assert summary['percentiles']['OP_current']['p95'] == pytest.approx(np.percentile([0.005, 0.005, 0.005, 0.02], 95))
+    empty = summarize(np.zeros((0, len(RESULT_FIELDS))))
+    assert empty['yield'] == 0.0 and np.isnan(empty['percentiles']['BW']['p50'])
+
+def read_results(path) -> tuple[list[int], np.ndarray, list[int]]:
+    with open(path, newline='') as file:
+        rows = list(csv.DictReader(file))
+    return [int(row['sample']) for row in rows], np.array([[float(row[name]) for name in RESULT_FIELDS] for row in rows]), [int(row['pass']) for row in rows]
+
+# the CSV written while the samples come back holds the same results the summary is made from
+@pytest.mark.parametrize('nWorkers', [1, 2])
+def test_streamed_csv_matches_summary(tmp_path, mock_workers, config, start_design, nWorkers):
+    n = YIELD_CHUNK + 6
+    path = tmp_path/'yield.csv'
+    summary = run_yield_analysis(start_design, n, path=str(path), seed=3, config=config.replace(nWorkers=nWorkers))
+    samples, results, passes = read_results(path)
+    order = np.argsort(samples)
+    assert sorted(samples) == list(range(n))
+    assert summarize(results[order]) == summary
+    assert np.array(passes)[order].tolist() == get_passes(results[order])['all'].astype(int).tolist()
+    assert summary['failed'] == 0
@@ -0,0 +1,92 @@
+import os
+import numpy as np
+
+##########################################
+
+from eval_cache import CachedEvaluation
+
+# records buffered in memory before they are appended to disk
+TRACE_BATCH = 1024
+# fixed size text header in front of the records, holds the number of encoded resistors
+TRACE_HEADER = 64
+TRACE_MAGIC = b"TRACE1"
+
+# fixed width record of one evaluation, failed simulations have NaN metrics
+def trace_dtype(state_size : int) -> np.dtype:
+    return np.dtype([('step', '<i8'), ('walk', '<i4'), ('goodness', '<f8'), ('BW', '<f8'), ('DC_gain', '<f8'), ('OP_current', '<f8'), ('state', '<i2', (state_size, 2))])
+
+# appends the evaluations of one walk to its own file, so worker processes never share a file
+# the file is only opened while a batch is written, which keeps the writer picklable
+class TraceWriter:
+    def __init__(self, path : str, walk : int, state_size : int, batch : int = TRACE_BATCH) -> None:
+        self.path = path
+        self.walk = walk
+        self.dtype = trace_dtype(state_size)
+        self.__buffer = np.zeros(batch, dtype=self.dtype)
+        self.__count = 0
+        if not os.path.exists(path):
+            with open(path, 'wb') as file:
+                file.write(f"{TRACE_MAGIC.decode()} {state_size}\n".encode().ljust(TRACE_HEADER, b' '))
+
+    # buffers one evaluation, "record" is None when the simulation failed
+    def record(self, step : int, x : np.ndarray, record : CachedEvaluation | None, walk : int | None = None) -> None:
+        row = self.__buffer[self.__count]
+        row['step'] = step
+        row['walk'] = self.walk if walk is None else walk
+        if record is None:
+            row['goodness'] = row['BW'] = row['DC_gain'] = row['OP_current'] = np.nan
+        else:
+            row['goodness'], row['BW'], row['DC_gain'], row['OP_current'] = record.goodness, record.BW, record.DC_gain, record.OP_current
+        row['state'] = x
+        self.__count += 1
+        if self.__count == len(self.__buffer):
+            self.flush()
+
+    def flush(self) -> None:
+        if self.__count:
+            with open(self.path, 'ab') as file:
+                file.write(self.__buffer[:self.__count].tobytes())
+            self.__count = 0
+
+    # drops records past "step", used when a walk resumes from an earlier checkpoint
+    def truncate(self, step : int) -> None:
+        self.__count = 0
+        records = read_trace(self.path)
+        keep = int(np.searchsorted(records['step'], step, side='right'))
+        del records
+        os.truncate(self.path, TRACE_HEADER + keep*self.dtype.itemsize)
+
+# memory maps a trace file, nothing is read until the records are used
+def read_trace(path : str) -> np.ndarray:
+    with open(path, 'rb') as file:
+        header = file.read(TRACE_HEADER).split()
+    if header[0] != TRACE_MAGIC:
+        raise ValueError(f"{path} is not a trace file")
+    dtype = trace_dtype(int(header[1]))
+    if os.path.getsize(path) == TRACE_HEADER: # np.memmap can not map an empty file
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=TRACE_HEADER)
+
+# directory holding one trace file per walk
+class TraceLog:
+    def __init__(self, directory : str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    # starts a new run, dropping the traces of any previous one
+    def begin(self) -> None:
+        for name in os.listdir(self.directory):
+            if name.endswith('.trace'):
+                os.remove(os.path.join(self.directory, name))
+
+    def writer(self, name : str, walk : int, state_size : int) -> TraceWriter:
+        return TraceWriter(os.path.join(self.directory, f"{name}.trace"), walk=walk, state_size=state_size)
+
+    # memory mapped traces in name order
+    def read(self) -> list[np.ndarray]:
+        return [read_trace(os.path.join(self.directory, name)) for name in sorted(os.listdir(self.directory)) if name.endswith('.trace')]
+
+    # one field of every trace joined in name order, e.g. the goodness history of the run
+    def column(self, field : str) -> np.ndarray:
+        columns = [trace[field] for trace in self.read()]
+        return np.concatenate(columns) if columns else np.zeros(0)
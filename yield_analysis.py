@@ -0,0 +1,173 @@
+import ast
+import csv
+import multiprocessing
+import numpy as np
+from tqdm import tqdm
+
+##########################################
+
+import parallel_walks
+from circuit_analysis import CircuitAnalyzer
+from ac_metrics import BW_GOAL, GAIN_HIGH, GAIN_LOW
+from netlist_template import get_resistor_names, get_path
+from spice_models import get_model_params
+from optimizer import get_start_design
+from helper_funcs import RunConfig, get_config, get_config_parser, set_config
+
+# resistors are within +-2% of their value, the tolerance of the valid_res series
+RESISTOR_TOLERANCE = 0.02
+# beta is drawn between the low and high corner models, the other parameters are the nominal model's
+BASE_MODEL = 'ZTX107-NOM'
+BETA_MODELS = ('ZTX107-LO', 'ZTX107-HI')
+# supply current limit of the specification
+MAX_CURRENT = 0.012
+# samples per task sent to a worker
+YIELD_CHUNK = 64
+# percentiles of each measurement in the summary
+PERCENTILES = [5, 50, 95]
+# columns of every sample's result
+RESULT_FIELDS = ['BW', 'DC_gain', 'OP_current']
+
+# path of every resistor in the design, RF and those in each stage
+def get_resistor_paths(s : dict) -> list[tuple]:
+    return list(get_resistor_names(s, BASE_MODEL).keys())
+
+# resistor scale factors and betas of n samples, drawn at once from their own stream
+def get_samples(n : int, n_resistors : int, seed : int | None = None, tolerance : float = RESISTOR_TOLERANCE) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    factors = rng.uniform(1 - tolerance, 1 + tolerance, size=(n, n_resistors))
+    BF_low, BF_high = (get_model_params(model)['BF'] for model in BETA_MODELS)
+    BF = rng.uniform(BF_low, BF_high, size=n)
+    return factors, BF
+
+# the design with its resistors at "values", simulated with the base model only
+def get_variant(s : dict, paths : list[tuple], values : np.ndarray) -> dict:
+    variant = {key : value.copy() if type(value) == dict else value for key, value in s.items()}
+    for path, value in zip(paths, values.tolist()):
+        if len(path) == 1:
+            variant[path[0]] = value
+        else:
+            variant[path[0]][path[1]] = value
+    variant['trans'] = {'MC' : BASE_MODEL}
+    return variant
+
+# BW, DC gain and supply current of each sample, NaN where NgSpice fails
+def simulate_samples(s : dict, paths : list[tuple], factors : np.ndarray, BF : np.ndarray, adaptive : bool = False) -> np.ndarray:
+    nominal = np.array([get_path(s, path) for path in paths])
+    results = np.full((len(BF), len(RESULT_FIELDS)), np.nan)
+    for i, values in enumerate(nominal*factors):
+        try: # beta is altered into the template, so every sample shares one netlist
+            analyzer = CircuitAnalyzer(get_variant(s, paths, values), template=True, adaptive=adaptive, model_params={'BF' : BF[i]})
+            results[i] = analyzer.BW, analyzer.DC_gain, analyzer.OP_current
+        except: # catches errors in NgSpice, counted as failing the specification
+            pass
+    return results
+
+# simulates one chunk of samples in a worker process
+def yield_worker(args : tuple) -> tuple[int, np.ndarray, dict]:
+    start, s, paths, factors, BF = args
+    return start, simulate_samples(s, paths, factors, BF, adaptive=get_config().adaptiveAC), parallel_walks.get_worker_stats()
+
+# whether each sample meets the specification: bandwidth over the goal, DC gain in the 60+-1.5dB window and current under the limit
+def get_passes(results : np.ndarray) -> dict[str, np.ndarray]:
+    BW, DC_gain, OP_current = (results[:, i] for i in range(len(RESULT_FIELDS)))
+    with np.errstate(invalid='ignore'): # failed samples are NaN and pass nothing
+        passes = {'BW' : BW > BW_GOAL, 'DC_gain' : (DC_gain >= GAIN_LOW) & (DC_gain <= GAIN_HIGH), 'OP_current' : OP_current < MAX_CURRENT}
+    passes['all'] = passes['BW'] & passes['DC_gain'] & passes['OP_current']
+    return passes
+
+# wilson score interval of a pass fraction
+def wilson_interval(passed : int, n : int, z : float = 1.96) -> tuple[float, float]:
+    if n == 0:
+        return 0.0, 1.0
+    p = passed/n
+    centre = (p + z**2/(2*n))/(1 + z**2/n)
+    half = z*np.sqrt(p*(1 - p)/n + z**2/(4*n**2))/(1 + z**2/n)
+    return max(centre - half, 0.0), min(centre + half, 1.0)
+
+# yield with its 95% interval, the pass rate of each specification and percentiles of each measurement
+def summarize(results : np.ndarray) -> dict:
+    passes = get_passes(results)
+    n = len(results)
+    failed = int(np.isnan(results).any(axis=1).sum())
+    passed = int(passes['all'].sum())
+    summary = {'samples' : n, 'failed' : failed, 'yield' : passed/n if n else 0.0, 'yield_95' : wilson_interval(passed, n),
+               'pass_rates' : {name : float(passes[name].mean()) if n else 0.0 for name in RESULT_FIELDS}, 'percentiles' : dict()}
+    for i, name in enumerate(RESULT_FIELDS):
+        values = results[:, i][~np.isnan(results[:, i])]
+        summary['percentiles'][name] = {f"p{p}" : float(np.percentile(values, p)) if len(values) else float('nan') for p in PERCENTILES}
+    return summary
+
+def report(summary : dict) -> str:
+    low, high = summary['yield_95']
+    lines = [f"Yield: {summary['yield']:.1%} (95% interval {low:.1%} to {high:.1%}) over {summary['samples']} samples, {summary['failed']} failed to simulate"]
+    lines.append("Pass rates: " + ", ".join(f"{name}: {rate:.1%}" for name, rate in summary['pass_rates'].items()))
+    for name, percentiles in summary['percentiles'].items():
+        lines.append(f"{name:>10}: " + ", ".join(f"{p} {value:.3E}" for p, value in percentiles.items()))
+    return "\n".join(lines)
+
+# monte carlo yield of design "s" over resistor tolerances and beta, each sample written to "path" as soon as it is back
+# chunks of samples are simulated across nWorkers processes, or in this one when nWorkers is 1
+def run_yield_analysis(s : dict, n : int, path : str | None = None, seed : int | None = None, config : RunConfig | None = None,
+                       cache_size : int = 1000, max_runs : int = 10000) -> dict:
+    config = config if config is not None else get_config()
+    paths = get_resistor_paths(s)
+    factors, BF = get_samples(n, len(paths), seed)
+    nominal = np.array([get_path(s, path) for path in paths])
+    tasks = [(start, s, paths, factors[start:start + YIELD_CHUNK], BF[start:start + YIELD_CHUNK]) for start in range(0, n, YIELD_CHUNK)]
+    results = np.full((n, len(RESULT_FIELDS)), np.nan)
+    done = np.zeros(n, dtype=bool)
+    file = open(path, mode='w', newline='') if path is not None else None
+    pool = None
+    try:
+        if file is not None:
+            writer = csv.writer(file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(['sample', *('.'.join(path) for path in paths), 'BF', *RESULT_FIELDS, 'pass'])
+        if config.nWorkers > 1:
+            pool = multiprocessing.Pool(processes=config.nWorkers, initializer=parallel_walks.init_worker, initargs=(config, cache_size, max_runs))
+            chunks = pool.imap_unordered(yield_worker, tasks)
+        else:
+            chunks = ((start, simulate_samples(s, paths, chunk_factors, chunk_BF, adaptive=config.adaptiveAC), None) for start, s, paths, chunk_factors, chunk_BF in tasks)
+        with tqdm(total=n, disable=config.isVerbose) as pbar:
+            for start, chunk, stats in chunks:
+                if stats is not None:
+                    parallel_walks.merge_worker_stats(stats)
+                stop = start + len(chunk)
+                results[start:stop] = chunk
+                done[start:stop] = True
+                if file is not None:
+                    passes = get_passes(chunk)['all']
+                    for i in range(len(chunk)):
+                        writer.writerow([start + i, *(nominal*factors[start + i]).tolist(), BF[start + i], *chunk[i].tolist(), int(passes[i])])
+                    file.flush()
+                # running yield of the samples back so far
+                pbar.set_postfix(yield_=f"{get_passes(results[done])['all'].mean():.1%}")
+                pbar.update(len(chunk))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if file is not None:
+            file.close()
+    return summarize(results)
+
+# best design written to data.csv by main.py
+def read_best_design(path : str) -> dict:
+    with open(path, newline='') as file:
+        rows = [(float(goodness), design) for goodness, design in csv.reader(file)]
+    return ast.literal_eval(max(rows, key=lambda row: row[0])[1])
+
+if __name__ == "__main__":
+    # e.g. python yield_analysis.py --design data.csv --samples 5000 --nWorkers 8
+    parser = get_config_parser()
+    parser.add_argument('--design', help="data.csv of a finished run, its best design is analysed instead of the start design")
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--out', default='yield.csv')
+    args = parser.parse_args()
+    config = RunConfig.from_namespace(args)
+    if args.isVerbose is None: # the progress bar shows the running yield
+        config = config.replace(isVerbose=False)
+    set_config(config)
+    s = read_best_design(args.design) if args.design is not None else get_start_design(config)
+    print(report(run_yield_analysis(s, args.samples, path=args.out, seed=args.seed, config=config)))